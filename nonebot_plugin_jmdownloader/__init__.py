@@ -1,15 +1,13 @@
-import asyncio
 import hashlib
-import os
+from pathlib import Path
 import random
 from re import A
-import shutil
 import time
 
-from httpx import get
-from jmcomic import (JmcomicException, JmDownloader,
+from httpx import HTTPError, get
+from jmcomic import (JmcomicException, JmDownloader, JmPhotoDetail,
                      MissingAlbumPhotoException, create_option_by_str)
-from nonebot import logger, on_command, require, get_bot
+from nonebot import logger, on_command, require, get_bot, get_driver
 from nonebot.adapters.onebot.v11 import (GROUP_ADMIN, GROUP_OWNER,
                                          ActionFailed, Bot, GroupMessageEvent,
                                          Message, MessageEvent, MessageSegment,
@@ -18,13 +16,22 @@ from nonebot.params import ArgPlainText, CommandArg
 from nonebot.permission import SUPERUSER
 from nonebot.plugin import PluginMetadata, get_loaded_plugins
 
+from .cache import cover_cache, pdf_cache, photo_info_cache, search_result_cache
 from .config import (Config, cache_dir, config_data, plugin_cache_dir,
                      plugin_config)
-from .data_source import data_manager, search_manager, SearchState
-from .utils import (blur_image_async, check_group_and_user, check_permission,
-                    download_avatar, download_photo_async,
-                    get_photo_info_async, modify_pdf_md5, search_album_async,
-                    send_forward_message)
+from .data_source import data_manager, search_manager, SearchItem, SearchState
+from .download import (DownloadQueueFull, download_flight, download_scheduler,
+                       image_cleaner, verify_pdf)
+from .executor import io_executor, loop_monitor, run_io
+from .network import cover_http
+from .pdf import StreamingPdfDownloader
+from .quota import acquire_rate_limits, group_rate_limiter, user_rate_limiter
+from .utils import (check_group_and_user, check_permission, cover_blur_pool,
+                    download_photo_async, fetch_search_page, find_file_url,
+                    get_blurred_cover, get_photo_info_async, get_search_slice,
+                    load_import_text, modify_pdf_md5, search_enricher,
+                    send_forward_message, split_import_values,
+                    start_search_prefetch)
 
 require("nonebot_plugin_apscheduler")
 
@@ -46,7 +53,9 @@ __plugin_meta__ = PluginMetadata(
           "开启jm：启用本群的jm功能\n"
           "关闭jm：禁用本群的jm功能\n"
           "jm禁用id [jm号]：禁止指定jm号的本子下载，可用空格隔开多个id，以下同理\n"
-          "jm禁用tag [tag]：禁止指定tag的本子下载\n",
+          "jm禁用tag [tag]：禁止指定tag的本子下载\n"
+          "jm导入 [id/tag/启用群/禁用群] [文件路径或链接]：从文件批量导入\n"
+          "jm状态：查看插件的运行状态\n",
     type="application",  # library
     homepage="https://github.com/Misty02600/nonebot-plugin-jmdownloader",
     config=Config,
@@ -58,12 +67,45 @@ option = create_option_by_str(config_data, mode="yml")
 
 try:
     client = option.build_jm_client()
-    downloader = JmDownloader(option)
+    if plugin_config.jmcomic_pdf_mode == "stream":
+        downloader = StreamingPdfDownloader(option, plugin_cache_dir)
+    else:
+        downloader = JmDownloader(option)
 except JmcomicException as e:
     logger.error(f"初始化失败: { e }")
 
 results_per_page = plugin_config.jmcomic_results_per_page
 
+driver = get_driver()
+# 关闭钩子按注册的相反顺序执行，文件线程池最后关闭，等待其他钩子提交的写入完成
+driver.on_shutdown(io_executor.close)
+driver.on_startup(loop_monitor.start)
+driver.on_shutdown(loop_monitor.close)
+driver.on_startup(cover_http.start)
+driver.on_shutdown(cover_http.close)
+driver.on_shutdown(cover_blur_pool.close)
+driver.on_shutdown(download_scheduler.stop)
+driver.on_shutdown(pdf_cache.save)
+driver.on_shutdown(photo_info_cache.close)
+driver.on_shutdown(data_manager.close)
+
+
+async def download_to_cache(photo: JmPhotoDetail) -> bool:
+    """ 下载本子，校验生成的PDF后删除原始图片，并将PDF加入缓存 """
+    if not await download_photo_async(downloader, photo):
+        return False
+
+    pdf_path = pdf_cache.path_of(photo.id)
+    if not await run_io(verify_pdf, pdf_path):
+        logger.error(f"jm{photo.id} 的PDF不存在或不完整")
+        return False
+
+    if plugin_config.jmcomic_delete_images:
+        image_dir = Path(downloader.option.decide_image_save_dir(photo))
+        await run_io(image_cleaner.cleanup, photo.id, image_dir, pdf_path)
+
+    return await run_io(pdf_cache.add, photo.id)
+
 
 # region jm功能指令
 jm_download = on_command("jm下载", aliases={"JM下载"}, block=True, rule=check_group_and_user)
@@ -81,6 +123,14 @@ async def _(bot: Bot, event: MessageEvent, arg: Message = CommandArg()):
         if user_limit <= 0:
             await jm_download.finish(MessageSegment.at(user_id) + f"你的下载次数已经用完了！")
 
+    if not is_superuser:
+        checks = [(user_rate_limiter, str(user_id))]
+        if isinstance(event, GroupMessageEvent):
+            checks.append((group_rate_limiter, str(event.group_id)))
+        wait = acquire_rate_limits(*checks)
+        if wait > 0:
+            await jm_download.finish(MessageSegment.at(user_id) + f"下载太频繁了，请{int(wait) + 1}秒后再试")
+
     try:
         photo = await get_photo_info_async(client, photo_id)
     except MissingAlbumPhotoException:
@@ -89,7 +139,8 @@ async def _(bot: Bot, event: MessageEvent, arg: Message = CommandArg()):
     if photo is None:
         await jm_download.finish("查询时发生错误")
 
-    if data_manager.is_jm_id_restricted(photo.id) or data_manager.has_restricted_tag(photo.tags):
+    # 只有禁止的ID或完全相同的标签才惩罚用户，子串匹配可能误伤，只拒绝下载
+    if data_manager.is_jm_id_restricted(photo.id) or data_manager.has_exact_restricted_tag(photo.tags):
 
         if isinstance(event, GroupMessageEvent):
             if not is_superuser:
@@ -106,78 +157,130 @@ async def _(bot: Bot, event: MessageEvent, arg: Message = CommandArg()):
         else:
             await jm_download.finish("该本子（或其tag）被禁止下载！")
 
-    try:
-        if not is_superuser:
-            data_manager.decrease_user_limit(user_id, 1)
-            user_limit_new = data_manager.get_user_limit(user_id)
-            message = Message()
-            message += f"jm{photo.id} | {photo.title}\n"
-            message += f"🎨 作者: {photo.author}\n"
-            message += "🔖 标签: " + " ".join(f"#{tag}" for tag in photo.tags) + "\n"
-            message += f"开始下载...\n你本周还有{user_limit_new}次下载次数！"
-            await jm_download.send(message)
-        else:
-            message = Message()
-            message += f"jm{photo.id} | {photo.title}\n"
-            message += f"🎨 作者: {photo.author}\n"
-            message += "🔖 标签: " + " ".join(f"#{tag}" for tag in photo.tags) + "\n"
-            message += "开始下载..."
-            await jm_download.send(message)
-    except ActionFailed:
-        await jm_download.send("本子信息可能被屏蔽，已开始下载")
-    except NetworkError as e:
-        logger.warning(f"{e},可能是协议端发送文件时间太长导致的报错")
+    if data_manager.has_restricted_tag(photo.tags):
+        await jm_download.finish("该本子的标签包含被禁止的关键词，无法下载")
 
-    pdf_path = f"{cache_dir}/{photo.id}.pdf"
+    if data_manager.has_restricted_title(photo.title):
+        await jm_download.finish("该本子的标题包含被禁止的关键词，无法下载")
 
-    # 如果不存在，则下载
-    if not os.path.exists(pdf_path):
-        if not await download_photo_async(downloader, photo):
-            await jm_download.finish("下载失败")
+    reservation = None
+    if not is_superuser:
+        # 先预留下载次数，文件发送成功后才扣除，下载或发送失败时退还
+        reservation = data_manager.reserve_user_limit(user_id)
+        if reservation is None:
+            await jm_download.finish(MessageSegment.at(user_id) + "你的下载次数已经用完了！")
 
+    # 从下载完成到文件发送结束期间，PDF不能被其他下载触发的缓存淘汰删除
+    pdf_cache.pin(photo.id)
     try:
-        # 根据配置决定是否需要修改MD5
-        if plugin_config.jmcomic_modify_real_md5:
-            random_suffix = hashlib.md5(str(time.time() + random.random()).encode()).hexdigest()[:8]
-            renamed_pdf_path = f"{cache_dir}/{photo.id}_{random_suffix}.pdf"
-
-            modified = await asyncio.to_thread(modify_pdf_md5, pdf_path, renamed_pdf_path)
-            if modified:
-                pdf_path = renamed_pdf_path
-    except Exception as e:
-        logger.error(f"处理PDF文件时出错: {e}")
-        await jm_download.finish("处理文件失败")
+        try:
+            if not is_superuser:
+                user_limit_new = data_manager.get_user_limit(user_id)
+                message = Message()
+                message += f"jm{photo.id} | {photo.title}\n"
+                message += f"🎨 作者: {photo.author}\n"
+                message += "🔖 标签: " + " ".join(f"#{tag}" for tag in photo.tags) + "\n"
+                message += f"开始下载...\n你本周还有{user_limit_new}次下载次数！"
+                await jm_download.send(message)
+            else:
+                message = Message()
+                message += f"jm{photo.id} | {photo.title}\n"
+                message += f"🎨 作者: {photo.author}\n"
+                message += "🔖 标签: " + " ".join(f"#{tag}" for tag in photo.tags) + "\n"
+                message += "开始下载..."
+                await jm_download.send(message)
+        except ActionFailed:
+            await jm_download.send("本子信息可能被屏蔽，已开始下载")
+        except NetworkError as e:
+            logger.warning(f"{e},可能是协议端发送文件时间太长导致的报错")
+
+        async def queued_download() -> bool:
+            """ 将下载加入队列，并在需要排队时告知队列位置 """
+            group_key = str(event.group_id) if isinstance(event, GroupMessageEvent) else "private"
+            job = download_scheduler.submit(group_key, str(user_id), photo.id, lambda: download_to_cache(photo))
+            if job is None:
+                raise DownloadQueueFull
+
+            if job.position > download_scheduler.idle_workers:
+                try:
+                    await jm_download.send(f"已加入下载队列，当前排在第{job.position}位")
+                except ActionFailed:
+                    pass
 
-    try:
-        if isinstance(event, GroupMessageEvent):
-            folder_id = data_manager.get_group_folder_id(event.group_id)
+            return await job.future
 
-            if folder_id:
-                await bot.call_api(
-                    "upload_group_file",
-                    group_id=event.group_id,
-                    file=pdf_path,
-                    name=f"{photo.id}.pdf",
-                    folder_id=folder_id
-                )
-            else:
+        # 缓存未命中时下载；同一本子正在下载时直接等待其结果，不占用队列位置
+        if download_flight.is_inflight(photo.id) or await run_io(pdf_cache.lookup, photo.id) is None:
+            try:
+                downloaded = await download_flight.run(photo.id, queued_download)
+            except DownloadQueueFull:
+                await jm_download.finish("下载队列已满，请稍后再试")
+            if not downloaded:
+                await jm_download.finish("下载失败")
+
+        pdf_path = pdf_cache.path_of(photo.id).as_posix()
+
+        try:
+            # 根据配置决定是否需要修改MD5
+            if plugin_config.jmcomic_modify_real_md5:
+                random_suffix = hashlib.md5(str(time.time() + random.random()).encode()).hexdigest()[:8]
+                renamed_pdf_path = f"{cache_dir}/{photo.id}_{random_suffix}.pdf"
+
+                modified = await run_io(modify_pdf_md5, pdf_path, renamed_pdf_path)
+                if modified:
+                    pdf_path = renamed_pdf_path
+        except Exception as e:
+            logger.error(f"处理PDF文件时出错: {e}")
+            await jm_download.finish("处理文件失败")
+
+        try:
+            if isinstance(event, GroupMessageEvent):
+                folder_id = data_manager.get_group_folder_id(event.group_id)
+
+                if folder_id:
+                    await bot.call_api(
+                        "upload_group_file",
+                        group_id=event.group_id,
+                        file=pdf_path,
+                        name=f"{photo.id}.pdf",
+                        folder_id=folder_id
+                    )
+                else:
+                    await bot.call_api(
+                        "upload_group_file",
+                        group_id=event.group_id,
+                        file=pdf_path,
+                        name=f"{photo.id}.pdf"
+                    )
+
+            elif isinstance(event, PrivateMessageEvent):
                 await bot.call_api(
-                    "upload_group_file",
-                    group_id=event.group_id,
+                    "upload_private_file",
+                    user_id=event.user_id,
                     file=pdf_path,
                     name=f"{photo.id}.pdf"
                 )
 
-        elif isinstance(event, PrivateMessageEvent):
-            await bot.call_api(
-                "upload_private_file",
-                user_id=event.user_id,
-                file=pdf_path,
-                name=f"{photo.id}.pdf"
-            )
+        except ActionFailed:
+            await jm_download.send("发送文件失败")
+        except NetworkError as e:
+            # 上传超时时协议端通常仍会把文件发出，按发送成功扣除次数
+            logger.warning(f"{e}，jm{photo.id} 发送结果未知，可能是协议端上传文件时间太长导致的超时，仍扣除下载次数")
+            if reservation is not None:
+                data_manager.commit_reservation(reservation)
+            # 协议端可能仍在读取修改过MD5的副本，交给每日的缓存整理删除
+            return
+        else:
+            if reservation is not None:
+                data_manager.commit_reservation(reservation)
 
-    except ActionFailed:
-        await jm_download.send("发送文件失败")
+        # 修改过MD5的副本只用于本次发送，发送结束后立即删除
+        if pdf_path != pdf_cache.path_of(photo.id).as_posix():
+            await run_io(Path(pdf_path).unlink, missing_ok=True)
+    finally:
+        pdf_cache.unpin(photo.id)
+        if reservation is not None:
+            data_manager.release_reservation(reservation)
 
 
 
@@ -200,9 +303,8 @@ async def _(bot: Bot, event: MessageEvent, arg: Message = CommandArg()):
     tags_text = " ".join(f"#{tag}" for tag in photo.tags)
     message += f"🔖 标签: {tags_text}\n"
 
-    avatar = await download_avatar(photo.id)
+    avatar = await get_blurred_cover(photo.id)
     if avatar:
-        avatar = await blur_image_async(avatar)
         message += MessageSegment.image(avatar)
 
     message_node = MessageSegment("node", {"name": "jm查询结果", "uin": bot.self_id, "content": message})
@@ -214,37 +316,16 @@ async def _(bot: Bot, event: MessageEvent, arg: Message = CommandArg()):
         await jm_query.finish("查询结果发送失败", reply_message=True)
 
 
-jm_search = on_command("jm搜索", aliases={"JM搜索"}, block=True, rule=check_group_and_user)
-@jm_search.handle()
-async def _(bot: Bot, event: MessageEvent, arg: Message = CommandArg()):
-    search_query = arg.extract_plain_text().strip()
-    if not search_query:
-        await jm_search.finish("请输入要搜索的内容")
-
-    searching_msg_id = (await jm_search.send("正在搜索中..."))['message_id']
-
-    page = await search_album_async(client, search_query)
-    if page is None:
-        await bot.delete_msg(message_id=searching_msg_id)
-        await jm_search.finish("搜索失败", reply_message=True)
-
-    search_results = list(page.iter_id())
-    if not search_results:
-        await bot.delete_msg(message_id=searching_msg_id)
-        await jm_search.finish("未搜索到本子", reply_message=True)
-
-    current_results = search_results[:results_per_page]
-    photos = await asyncio.gather(*(get_photo_info_async(client, photo_id) for photo_id in current_results))
-    avatars = await asyncio.gather(*(download_avatar(photo_id) for photo_id in current_results))
-
+def build_search_messages(bot: Bot, items: list[SearchItem | None], avatars: list) -> list[MessageSegment]:
+    """ 将搜索结果构造成合并消息节点，被屏蔽的本子显示为替代消息 """
     messages = []
     blocked_message = plugin_config.jmcomic_blocked_message
 
-    for photo, avatar in zip(photos, avatars):
-        if photo is None:
+    for item, avatar in zip(items, avatars):
+        if item is None:
             continue
 
-        if data_manager.has_restricted_tag(photo.tags):
+        if data_manager.has_restricted_tag(item.tags, item.title):
             message_node = MessageSegment("node", {
                 "name": "jm搜索结果",
                 "uin": bot.self_id,
@@ -252,12 +333,11 @@ async def _(bot: Bot, event: MessageEvent, arg: Message = CommandArg()):
             })
         else:
             node_content = Message()
-            node_content += f"jm{photo.id} | {photo.title}\n"
-            node_content += f"🎨 作者: {photo.author}\n"
-            node_content += "🔖 标签: " + " ".join(f"#{tag}" for tag in photo.tags)
+            node_content += f"jm{item.id} | {item.title}\n"
+            node_content += f"🎨 作者: {item.author}\n"
+            node_content += "🔖 标签: " + " ".join(f"#{tag}" for tag in item.tags)
 
             if avatar:
-                avatar = await blur_image_async(avatar)
                 node_content += MessageSegment.image(avatar)
 
             message_node = MessageSegment("node", {
@@ -267,18 +347,89 @@ async def _(bot: Bot, event: MessageEvent, arg: Message = CommandArg()):
             })
         messages.append(message_node)
 
+    return messages
+
+
+async def send_search_page(bot: Bot, event: MessageEvent, results: list[SearchItem], started_at: float):
+    """
+    发送一页搜索结果
+
+    渐进模式下先发送不带封面的结果列表，封面完成后再分批发送；否则等待封面后一起发送
+
+    Args:
+        bot: Bot
+        event: 消息事件
+        results: 本页的搜索结果
+        started_at: 收到指令的时间，用于统计首个结果的发送耗时
+    """
+    if not plugin_config.jmcomic_search_progressive:
+        items, avatars = await search_enricher.enrich(client, results)
+        await send_forward_message(bot, event, build_search_messages(bot, items, avatars))
+        search_enricher.record_first_result(time.perf_counter() - started_at)
+        return
+
+    deadline = search_enricher.deadline()
+    info_tasks = search_enricher.start_info(client, results)
+    cover_tasks = search_enricher.start_covers(results)
+    items = await search_enricher.wait(info_tasks, deadline)
+    await send_forward_message(bot, event, build_search_messages(bot, items, [None] * len(items)))
+    search_enricher.record_first_result(time.perf_counter() - started_at)
+
+    batch_size = max(1, plugin_config.jmcomic_cover_batch_size)
+    async for batch in search_enricher.iter_covers(cover_tasks, deadline, batch_size):
+        messages = []
+        for index, avatar in batch:
+            item = items[index]
+            # 补全信息后才发现需要屏蔽的本子不发送封面
+            if item is None or data_manager.has_restricted_tag(item.tags, item.title):
+                continue
+            messages.append(MessageSegment("node", {
+                "name": "jm搜索结果",
+                "uin": bot.self_id,
+                "content": Message(f"jm{item.id} | {item.title}\n") + MessageSegment.image(avatar)
+            }))
+        if not messages:
+            continue
+        try:
+            await send_forward_message(bot, event, messages)
+        except ActionFailed as e:
+            logger.warning(f"搜索结果封面发送失败：{e}")
+
+
+jm_search = on_command("jm搜索", aliases={"JM搜索"}, block=True, rule=check_group_and_user)
+@jm_search.handle()
+async def _(bot: Bot, event: MessageEvent, arg: Message = CommandArg()):
+    search_query = arg.extract_plain_text().strip()
+    if not search_query:
+        await jm_search.finish("请输入要搜索的内容")
+
+    started_at = time.perf_counter()
+    searching_msg_id = (await jm_search.send("正在搜索中..."))['message_id']
+
+    search_results = await fetch_search_page(client, search_query, 1)
+    if search_results is None:
+        await bot.delete_msg(message_id=searching_msg_id)
+        await jm_search.finish("搜索失败", reply_message=True)
+
+    if not search_results:
+        await bot.delete_msg(message_id=searching_msg_id)
+        await jm_search.finish("未搜索到本子", reply_message=True)
+
     try:
-        await send_forward_message(bot, event, messages)
+        await send_search_page(bot, event, search_results[:results_per_page], started_at)
     except ActionFailed:
         await jm_search.finish("搜索结果发送失败", reply_message=True)
 
     if len(search_results) > results_per_page:
-        search_manager.set_state(str(event.user_id), SearchState(
+        state = SearchState(
             query=search_query,
             start_idx=results_per_page,
-            total_results=search_results,
+            total_count=len(search_results),
+            last_id=search_results[-1].id,
             api_page=1
-        ))
+        )
+        search_manager.set_state(str(event.user_id), state)
+        start_search_prefetch(client, state, results_per_page)
         await jm_search.send("搜索有更多结果，使用'jm下一页'指令查看更多")
     else:
         await jm_search.send("已发送所有搜索结果")
@@ -295,6 +446,7 @@ async def handle_jm_next_page(bot: Bot, event: MessageEvent):
     if not state:
         await jm_next_page.finish("没有进行中的搜索，请先使用'jm搜索'命令")
 
+    started_at = time.perf_counter()
     searching_msg_id = (await jm_search.send("正在搜索更多内容..."))['message_id']
 
     end_idx = state.start_idx + results_per_page
@@ -302,61 +454,34 @@ async def handle_jm_next_page(bot: Bot, event: MessageEvent):
     is_return_all = False
 
     # 需要尝试调用api搜索下一页？
-    if end_idx >= len(state.total_results):
-        # 如果当前页数是80的倍数，说明可能还有下一页，80是JM搜索每页数量
-        if len(state.total_results) % 80 == 0:
+    if end_idx >= state.total_count:
+        # 如果当前结果数是80的倍数，说明可能还有下一页，80是JM搜索每页数量
+        if state.may_load_more(search_manager.max_results):
             state.api_page += 1
-            next_page = await search_album_async(client, state.query, page=state.api_page)
+            # 优先使用后台预取的结果
+            prefetch_task = state.take_next_page()
+            if prefetch_task is not None:
+                next_results = await prefetch_task
+            else:
+                next_results = await fetch_search_page(client, state.query, state.api_page)
 
-            if next_page is None:
+            if next_results is None:
                 logger.warning(f"获取下一页失败: {state.query} {state.api_page}")
                 is_return_all = True
             else:
-                next_results = list(next_page.iter_id())
                 # 严格检查是否达到最后一页
-                if not next_results or next_results[-1] == state.total_results[-1]:
+                if not next_results or next_results[-1].id == state.last_id:
                     is_return_all = True
                 else:
-                    state.total_results.extend(next_results)
+                    state.total_count += len(next_results)
+                    state.last_id = next_results[-1].id
         else:
             is_return_all = True
 
-    current_results = state.total_results[state.start_idx:end_idx]
-    photos = await asyncio.gather(*(get_photo_info_async(client, album_id) for album_id in current_results))
-    avatars = await asyncio.gather(*(download_avatar(album_id) for album_id in current_results))
-
-    messages = []
-    blocked_message = plugin_config.jmcomic_blocked_message
-
-    for photo, avatar in zip(photos, avatars):
-        if photo is None:
-            continue
-
-        if data_manager.has_restricted_tag(photo.tags):
-            message_node = MessageSegment("node", {
-                "name": "jm搜索结果",
-                "uin": bot.self_id,
-                "content": blocked_message
-            })
-        else:
-            node_content = Message()
-            node_content += f"jm{photo.id} | {photo.title}\n"
-            node_content += f"🎨 作者: {photo.author}\n"
-            node_content += "🔖 标签: " + " ".join(f"#{tag}" for tag in photo.tags)
-
-            if avatar:
-                avatar = await blur_image_async(avatar)
-                node_content += MessageSegment.image(avatar)
-
-            message_node = MessageSegment("node", {
-                "name": "jm搜索结果",
-                "uin": bot.self_id,
-                "content": node_content
-            })
-        messages.append(message_node)
+    current_results = await get_search_slice(client, state, state.start_idx, end_idx)
 
     try:
-        await send_forward_message(bot, event, messages)
+        await send_search_page(bot, event, current_results, started_at)
     except ActionFailed:
         search_manager.remove_state(str(event.user_id))
         await bot.delete_msg(message_id=searching_msg_id)
@@ -368,6 +493,7 @@ async def handle_jm_next_page(bot: Bot, event: MessageEvent):
     else:
         await jm_next_page.send("搜索有更多结果，使用'jm下一页'指令查看更多")
         state.start_idx = end_idx
+        start_search_prefetch(client, state, results_per_page)
 
     await bot.delete_msg(message_id=searching_msg_id)
 
@@ -487,20 +613,13 @@ async def _(bot: Bot, event: MessageEvent, arg: Message = CommandArg()):
     """ 启用指定群号，可用空格隔开多个群 """
     raw_text = arg.extract_plain_text().strip()
 
-    group_ids = raw_text.split()
-    success_list = []
-
-    for group_id_str in group_ids:
-        if not group_id_str.isdigit():
-            continue
-
-        group_id = int(group_id_str)
-        data_manager.set_group_enabled(group_id, True)
-        success_list.append(group_id_str)
+    result = data_manager.set_groups_enabled(raw_text.split(), True)
 
     msg = ""
-    if success_list:
-        msg += "以下群已启用插件功能：\n" + " ".join(success_list)
+    if result.added:
+        msg += "以下群已启用插件功能：\n" + " ".join(result.added) + "\n"
+    if result.duplicate or result.invalid:
+        msg += result.summary()
 
     await jm_enable_group.finish(msg.strip() or "没有做任何处理。")
 
@@ -511,20 +630,13 @@ async def _(bot: Bot, event: MessageEvent, arg: Message = CommandArg()):
     """ 禁用指定群号，可用空格隔开多个群 """
     raw_text = arg.extract_plain_text().strip()
 
-    group_ids = raw_text.split()
-    success_list = []
-
-    for group_id_str in group_ids:
-        if not group_id_str.isdigit():
-            continue
-
-        group_id = int(group_id_str)
-        data_manager.set_group_enabled(group_id, False)
-        success_list.append(group_id_str)
+    result = data_manager.set_groups_enabled(raw_text.split(), False)
 
     msg = ""
-    if success_list:
-        msg += "以下群已禁用插件功能：\n" + " ".join(success_list)
+    if result.added:
+        msg += "以下群已禁用插件功能：\n" + " ".join(result.added) + "\n"
+    if result.duplicate or result.invalid:
+        msg += result.summary()
 
     await jm_disable_group.finish(msg.strip() or "没有做任何处理。")
 
@@ -552,18 +664,13 @@ jm_forbid_id = on_command("jm禁用id", aliases={"JM禁用id"}, permission=SUPER
 async def handle_jm_forbid_id(bot: Bot, event: MessageEvent, arg: Message = CommandArg()):
     raw_text = arg.extract_plain_text().strip()
 
-    jm_ids = raw_text.split()
-    success_list = []
-
-    for jm_id in jm_ids:
-        if not jm_id.isdigit():
-            continue
-        data_manager.add_restricted_jm_id(jm_id)
-        success_list.append(jm_id)
+    result = data_manager.add_restricted_jm_ids(raw_text.split())
 
     msg = ""
-    if success_list:
-        msg += "以下jm号已加入禁止下载列表：\n" + " ".join(success_list)
+    if result.added:
+        msg += "以下jm号已加入禁止下载列表：\n" + " ".join(result.added) + "\n"
+    if result.duplicate or result.invalid:
+        msg += result.summary()
 
     await jm_forbid_id.finish(msg.strip() or "没有做任何处理")
 
@@ -573,21 +680,105 @@ jm_forbid_tag = on_command("jm禁用tag", aliases={"JM禁用tag"}, permission=SU
 async def handle_jm_forbid_tag(bot: Bot, event: MessageEvent, arg: Message = CommandArg()):
     raw_text = arg.extract_plain_text().strip()
 
-    tags = raw_text.split()
-    success_list = []
-
-    for tag in tags:
-        if not tag:
-            continue
-        data_manager.add_restricted_tag(tag)
-        success_list.append(tag)
+    result = data_manager.add_restricted_tags(raw_text.split())
 
     msg = ""
-    if success_list:
-        msg += "以下tag已加入禁止下载列表：\n" + " ".join(success_list)
+    if result.added:
+        msg += "以下tag已加入禁止下载列表：\n" + " ".join(result.added) + "\n"
+    if result.duplicate or result.invalid:
+        msg += result.summary()
 
     await jm_forbid_tag.finish(msg.strip() or "没有做任何处理")
 
+
+IMPORT_ACTIONS = {
+    "id": lambda values: data_manager.add_restricted_jm_ids(values),
+    "tag": lambda values: data_manager.add_restricted_tags(values),
+    "启用群": lambda values: data_manager.set_groups_enabled(values, True),
+    "禁用群": lambda values: data_manager.set_groups_enabled(values, False),
+}
+
+jm_import = on_command("jm导入", aliases={"JM导入"}, permission=SUPERUSER, block=True)
+@jm_import.handle()
+async def handle_jm_import(bot: Bot, event: MessageEvent, arg: Message = CommandArg()):
+    """ 从文件批量导入禁止的jm号、tag或要启用/禁用的群，整个文件只写入一次 """
+    args = arg.extract_plain_text().strip().split(maxsplit=1)
+    if not args or args[0] not in IMPORT_ACTIONS:
+        await jm_import.finish("用法：jm导入 [id/tag/启用群/禁用群] [文件路径或链接]，也可以附带或回复一个文件")
+
+    source = args[1].strip() if len(args) > 1 else find_file_url(event)
+    if not source:
+        await jm_import.finish("请提供文件路径、链接或文件")
+
+    try:
+        text = await load_import_text(source)
+    except (OSError, ValueError, HTTPError) as e:
+        await jm_import.finish(f"读取导入文件失败：{e}")
+
+    values = split_import_values(text)
+    result = IMPORT_ACTIONS[args[0]](values)
+
+    msg = f"导入完成：{result.summary()}"
+    if result.invalid:
+        msg += "\n无效的值：" + " ".join(result.invalid[:20]) + (" ..." if len(result.invalid) > 20 else "")
+    await jm_import.finish(msg)
+
+jm_status = on_command("jm状态", aliases={"JM状态"}, permission=SUPERUSER, block=True)
+@jm_status.handle()
+async def handle_jm_status(bot: Bot, event: MessageEvent):
+    flight_stats = download_flight.stats()
+    queue_stats = download_scheduler.stats()
+    cache_stats = pdf_cache.stats()
+    cleaner_stats = image_cleaner.stats()
+    cover_stats = cover_cache.stats()
+    photo_stats = photo_info_cache.stats()
+    enrich_stats = search_enricher.stats()
+    search_stats = search_result_cache.stats()
+    session_stats = search_manager.stats()
+    user_rate_stats = user_rate_limiter.stats()
+    group_rate_stats = group_rate_limiter.stats()
+    quota_stats = data_manager.stats()
+    io_stats = io_executor.stats()
+    lag_stats = loop_monitor.stats()
+
+    msg = "JMComic插件运行状态：\n"
+    msg += f"📥 正在下载: {queue_stats['running']} | 排队中: {queue_stats['depth']}\n"
+    msg += f"⏱️ 平均等待: {queue_stats['avg_wait']:.1f}s | 平均下载: {queue_stats['avg_service']:.1f}s\n"
+    msg += f"🚫 队列已满被拒绝: {queue_stats['rejected']}\n"
+    msg += (f"🎫 下载次数预留: 进行中 {quota_stats['outstanding']} | 已扣除 {quota_stats['committed']}"
+            f" | 已退还 {quota_stats['released']} (超时 {quota_stats['expired']})\n")
+    if user_rate_limiter.enabled or group_rate_limiter.enabled:
+        msg += (f"🚦 频率限制拒绝: 用户 {user_rate_stats['limited']}次 | 群 {group_rate_stats['limited']}次"
+                f" | 跟踪中 {user_rate_stats['tracked'] + group_rate_stats['tracked']}\n")
+    msg += f"🔗 已合并的重复下载: {flight_stats['merged']}/{flight_stats['started'] + flight_stats['merged']}\n"
+    msg += (f"💾 PDF缓存: {cache_stats['entries']}个 {cache_stats['bytes'] / 1024 / 1024:.1f}"
+            f"/{cache_stats['max_bytes'] / 1024 / 1024:.0f}MB | 命中率: {cache_stats['hit_rate']:.0%}\n")
+    msg += (f"📚 本子信息缓存: {photo_stats['memory_items']}条 | 命中率: {photo_stats['hit_rate']:.0%}"
+            f" (其中过期后刷新 {photo_stats['stale_hits']})\n")
+    msg += (f"🖼️ 封面缓存: 内存 {cover_stats['memory_items']}张 | 命中率: {cover_stats['hit_rate']:.0%}"
+            f" (内存 {cover_stats['memory_hits']} / 磁盘 {cover_stats['disk_hits']})\n")
+    for domain, domain_stats in cover_http.stats().items():
+        state = " | 熔断中" if cover_http.health.is_open(domain) else ""
+        msg += (f"🌐 {domain}: {domain_stats.requests}次 | 平均 {domain_stats.avg_latency * 1000:.0f}ms"
+                f" | 连接复用率 {domain_stats.reuse_rate:.0%}{state}\n")
+    msg += f"🔀 封面对冲请求: {cover_http.hedged}\n"
+    msg += (f"🧭 搜索状态: {session_stats['sessions']}/{search_manager.max_sessions}"
+            f" | 约 {session_stats['memory_bytes'] / 1024:.1f}KB | 已淘汰 {session_stats['evicted']}\n")
+    msg += (f"🗂️ 搜索结果缓存: {search_stats['pages']}页 {search_stats['items']}条"
+            f" | 命中率: {search_stats['hit_rate']:.0%}\n")
+    msg += (f"🔍 搜索结果补全: {enrich_stats['pages']}页 | 超时发送部分结果 {enrich_stats['partial_pages']}次"
+            f" | 单项超时 {enrich_stats['item_timeouts']}\n")
+    msg += (f"⚡ 首个搜索结果耗时: 平均 {enrich_stats['avg_first_result']:.1f}s"
+            f" | 最长 {enrich_stats['max_first_result']:.1f}s | 已预取 {enrich_stats['warmed_pages']}页\n")
+    msg += f"🧹 已删除原始图片: {cleaner_stats['cleaned']}本 {cleaner_stats['reclaimed_bytes'] / 1024 / 1024:.1f}MB\n"
+    msg += (f"🗄️ 文件线程池: {io_stats['workers']}线程 | 已执行 {io_stats['submitted']}"
+            f" | 最长排队 {io_stats['max_wait']:.1f}s\n")
+    if loop_monitor.threshold > 0:
+        msg += (f"🐢 事件循环阻塞: {lag_stats['stalls']}次 | 最长 {lag_stats['max_lag'] * 1000:.0f}ms"
+                f" | 平均延迟 {lag_stats['avg_lag'] * 1000:.1f}ms\n")
+
+    await jm_status.finish(msg.strip())
+
 jm_help = on_command("jm帮助", aliases={"JM帮助"}, block=True)
 @jm_help.handle()
 async def handle_jm_help(bot: Bot, event: MessageEvent):
@@ -597,38 +788,24 @@ async def handle_jm_help(bot: Bot, event: MessageEvent):
 
 # endregion
 
-@scheduler.scheduled_job("cron", day_of_week="mon", hour=0, minute=0, id="reset_user_limits")
-async def reset_user_limits():
-    """ 每周一凌晨0点重置所有用户的下载次数 """
-    try:
-        user_limits = data_manager.data.get("user_limits", {})
-
-        if not user_limits:
-            logger.info("无用户下载数据可供重置。")
-            return
-
-        for user_id in user_limits.keys():
-            data_manager.set_user_limit(int(user_id), plugin_config.jmcomic_user_limits)
-
-        logger.info("所有用户的下载次数已成功刷新")
-
-    except Exception as e:
-        logger.error(f"刷新用户下载次数时出错：{e}")
-
-
 @scheduler.scheduled_job("cron", hour=3, minute=0)
 async def clear_cache_dir():
-    """ 每天凌晨3点清理缓存文件夹 """
+    """ 每天凌晨3点整理缓存文件夹，删除残留文件并按容量上限淘汰PDF和封面 """
     try:
-        if plugin_cache_dir.exists():
-            shutil.rmtree(plugin_cache_dir)
-            plugin_cache_dir.mkdir(parents=True, exist_ok=True)
-            logger.info(f"已成功清理缓存目录：{cache_dir}")
+        freed = await run_io(pdf_cache.sweep) + await run_io(cover_cache.sweep)
+        await run_io(photo_info_cache.sweep)
+        logger.info(f"已成功整理缓存目录：{cache_dir}，释放 {freed / 1024 / 1024:.1f}MB")
     except Exception as e:
-        logger.error(f"清理缓存目录失败：{e}")
+        logger.error(f"整理缓存目录失败：{e}")
 
 
 @scheduler.scheduled_job("interval", minutes=10)
 async def clean_expired_search_states():
-    """ 定期清理过期的搜索状态 """
-    search_manager.clean_expired()
\ No newline at end of file
+    """ 定期清理过期的搜索状态和共享搜索结果 """
+    search_manager.clean_expired()
+    search_result_cache.sweep()
+
+@scheduler.scheduled_job("interval", minutes=10)
+async def expire_quota_reservations():
+    """ 定期退还超时未完成的下载次数预留 """
+    data_manager.expire_reservations()
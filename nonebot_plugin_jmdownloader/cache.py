@@ -0,0 +1,673 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import json
+from pathlib import Path
+import pickle
+import shutil
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import jmcomic
+from jmcomic import JmPhotoDetail
+from nonebot import logger
+
+from .config import plugin_cache_dir, plugin_config
+from .data_source import SearchItem
+
+
+class PdfCache:
+    """
+    有容量上限的PDF缓存
+
+    索引记录每个PDF的大小、最近访问时间和命中次数，超出容量时按 LRU 或 LFU 淘汰。
+    正在下载或发送的PDF通过 pin 标记，淘汰时跳过
+    """
+
+    INDEX_FILENAME = "pdf_index.json"
+    THUMBNAIL_DIRNAME = "thumbnails"
+    # 缓存目录中不属于任何PDF、且超过该时间未修改的文件会在整理时被删除
+    ORPHAN_MIN_AGE = 3600
+
+    def __init__(self, cache_path: Path, max_bytes: int, policy: str = "lru"):
+        self.cache_path = cache_path
+        self.index_path = cache_path / self.INDEX_FILENAME
+        self.thumbnail_path = cache_path / self.THUMBNAIL_DIRNAME
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.entries: dict[str, dict] = {}
+        # 本子ID -> 使用中的请求数量
+        self._pins: dict[str, int] = {}
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._load_index()
+        self._reconcile()
+
+    def path_of(self, photo_id: int | str) -> Path:
+        """ 获取本子PDF的缓存路径 """
+        return self.cache_path / f"{photo_id}.pdf"
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(entry["size"] for entry in self.entries.values())
+
+    def pin(self, photo_id: int | str):
+        """ 标记PDF正在使用，在对应的 unpin 之前不会被淘汰 """
+        key = str(photo_id)
+        with self._lock:
+            self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, photo_id: int | str):
+        """ 取消一次 pin 标记 """
+        key = str(photo_id)
+        with self._lock:
+            count = self._pins.get(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+            else:
+                self._pins.pop(key, None)
+
+    def _load_index(self):
+        """ 加载缓存索引 """
+        if not self.index_path.exists():
+            return
+        try:
+            with self.index_path.open("r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"缓存索引读取失败，将重新建立：{e}")
+            self.entries = {}
+
+    def save(self):
+        """ 保存缓存索引 """
+        with self._lock:
+            try:
+                self.cache_path.mkdir(parents=True, exist_ok=True)
+                with self.index_path.open("w", encoding="utf-8") as f:
+                    json.dump(self.entries, f, ensure_ascii=False)
+            except OSError as e:
+                logger.error(f"保存缓存索引出错：{e}")
+
+    def _reconcile(self):
+        """ 使索引与磁盘上的PDF保持一致 """
+        with self._lock:
+            for photo_id in list(self.entries):
+                if not self.path_of(photo_id).is_file():
+                    del self.entries[photo_id]
+
+            if self.cache_path.exists():
+                for pdf in self.cache_path.glob("*.pdf"):
+                    if pdf.stem.isdigit() and pdf.stem not in self.entries:
+                        stat = pdf.stat()
+                        self.entries[pdf.stem] = {"size": stat.st_size, "last_access": stat.st_mtime, "hits": 0}
+
+    def lookup(self, photo_id: int | str) -> Path | None:
+        """ 查找已缓存的PDF，未命中时返回 None """
+        key = str(photo_id)
+        path = self.path_of(key)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and path.is_file():
+                entry["last_access"] = time.time()
+                entry["hits"] += 1
+                self.hits += 1
+                return path
+
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def add(self, photo_id: int | str) -> bool:
+        """
+        将新生成的PDF加入缓存，必要时淘汰其他PDF
+
+        Returns:
+            bool: PDF是否存在并已加入缓存
+        """
+        key = str(photo_id)
+        path = self.path_of(key)
+        if not path.is_file():
+            return False
+
+        with self._lock:
+            self.entries[key] = {"size": path.stat().st_size, "last_access": time.time(), "hits": 0}
+            self._evict(keep=key)
+        self.save()
+        return True
+
+    def remove(self, photo_id: int | str):
+        """ 从缓存中删除PDF """
+        key = str(photo_id)
+        with self._lock:
+            self.entries.pop(key, None)
+            self.path_of(key).unlink(missing_ok=True)
+            shutil.rmtree(self.thumbnail_path / key, ignore_errors=True)
+
+    def _eviction_order(self, entry: dict) -> tuple:
+        if self.policy == "lfu":
+            return entry["hits"], entry["last_access"]
+        return (entry["last_access"],)
+
+    def _evict(self, keep: str | None = None) -> int:
+        """ 淘汰PDF直到总大小不超过上限，返回释放的字节数 """
+        freed = 0
+        total = self.total_bytes
+        if total <= self.max_bytes:
+            return 0
+
+        candidates = sorted(
+            (photo_id for photo_id in self.entries if photo_id != keep and photo_id not in self._pins),
+            key=lambda photo_id: self._eviction_order(self.entries[photo_id]),
+        )
+        for photo_id in candidates:
+            if total <= self.max_bytes:
+                break
+            size = self.entries[photo_id]["size"]
+            self.remove(photo_id)
+            total -= size
+            freed += size
+            self.evictions += 1
+
+        if freed:
+            logger.info(f"PDF缓存超出上限，已淘汰 {freed / 1024 / 1024:.1f}MB")
+        return freed
+
+    def sweep(self) -> int:
+        """
+        整理缓存目录：删除不属于缓存的残留文件，并按容量上限淘汰PDF
+
+        Returns:
+            int: 释放的字节数
+        """
+        freed = 0
+        now = time.time()
+
+        with self._lock:
+            self._reconcile()
+            orphans = []
+            if self.cache_path.exists():
+                # 数字命名的目录是下载残留的图片目录，其他目录属于别的缓存，不在这里处理
+                orphans += [
+                    path for path in self.cache_path.iterdir()
+                    if path != self.index_path
+                    and not (path.is_dir() and not path.name.isdigit())
+                    and not (path.suffix == ".pdf" and path.stem in self.entries)
+                ]
+            if self.thumbnail_path.exists():
+                orphans += [path for path in self.thumbnail_path.iterdir() if path.name not in self.entries]
+
+            for path in orphans:
+                try:
+                    if now - path.stat().st_mtime < self.ORPHAN_MIN_AGE:
+                        continue
+                    if path.is_dir():
+                        size = sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+                        shutil.rmtree(path)
+                    else:
+                        size = path.stat().st_size
+                        path.unlink()
+                    freed += size
+                except OSError as e:
+                    logger.warning(f"清理缓存文件 {path} 失败：{e}")
+
+            freed += self._evict()
+        self.save()
+        return freed
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "pinned": len(self._pins),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+class CoverCache:
+    """
+    模糊处理后封面的两级缓存
+
+    内存中按 LRU 保留最近使用的封面，磁盘上的封面带过期时间并受容量上限约束。
+    磁盘封面的大小记录在按写入时间排序的索引中，写入后超出上限时立即删除最早写入的封面
+    """
+
+    def __init__(self, cache_path: Path, memory_items: int = 200, max_bytes: int = 200 * 1024 * 1024,
+                 ttl: float = 72 * 3600):
+        self.cache_path = cache_path
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        # 磁盘封面 -> 大小，首次写入时扫描目录建立
+        self._disk: OrderedDict[str, int] | None = None
+        self._disk_bytes = 0
+        self._disk_lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path_of(self, album_id: int | str) -> Path:
+        return self.cache_path / f"{album_id}.jpg"
+
+    def _scan_disk(self) -> OrderedDict[str, int]:
+        """ 扫描磁盘上的封面，按修改时间从旧到新建立索引，调用时需持有 _disk_lock """
+        files = []
+        if self.cache_path.exists():
+            for path in self.cache_path.glob("*.jpg"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, path.stem, stat.st_size))
+        self._disk = OrderedDict((key, size) for _, key, size in sorted(files))
+        self._disk_bytes = sum(self._disk.values())
+        return self._disk
+
+    def _forget_disk(self, key: str):
+        with self._disk_lock:
+            if self._disk is not None and key in self._disk:
+                self._disk_bytes -= self._disk.pop(key)
+
+    def _record_disk(self, key: str, size: int) -> int:
+        """ 记录新写入的封面，超出容量上限时删除最早写入的其他封面，返回释放的字节数 """
+        freed = 0
+        with self._disk_lock:
+            disk = self._disk if self._disk is not None else self._scan_disk()
+            self._disk_bytes -= disk.pop(key, 0)
+            disk[key] = size
+            self._disk_bytes += size
+
+            while self._disk_bytes > self.max_bytes and len(disk) > 1:
+                old_key, old_size = disk.popitem(last=False)
+                self._disk_bytes -= old_size
+                self.path_of(old_key).unlink(missing_ok=True)
+                freed += old_size
+                self.evictions += 1
+        return freed
+
+    def get_memory(self, album_id: int | str) -> bytes | None:
+        """ 从内存中获取封面 """
+        key = str(album_id)
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+            return data
+
+    def _remember(self, key: str, data: bytes):
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def load_disk(self, album_id: int | str) -> bytes | None:
+        """ 从磁盘读取未过期的封面，并放入内存 """
+        key = str(album_id)
+        path = self.path_of(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                self._forget_disk(key)
+                self.misses += 1
+                return None
+            data = path.read_bytes()
+        except OSError:
+            self.misses += 1
+            return None
+
+        self.disk_hits += 1
+        self._remember(key, data)
+        return data
+
+    def put(self, album_id: int | str, data: bytes):
+        """ 写入内存与磁盘 """
+        key = str(album_id)
+        self._remember(key, data)
+        try:
+            self.cache_path.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path_of(key).with_suffix(".tmp")
+            tmp_path.write_bytes(data)
+            tmp_path.replace(self.path_of(key))
+        except OSError as e:
+            logger.warning(f"写入封面缓存失败：{e}")
+            return
+        self._record_disk(key, len(data))
+
+    def sweep(self) -> int:
+        """ 删除过期的封面，并按修改时间从旧到新删除直至不超过容量上限，返回释放的字节数 """
+        if not self.cache_path.exists():
+            return 0
+
+        freed = 0
+        now = time.time()
+        files = []
+        for path in self.cache_path.iterdir():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                freed += stat.st_size
+            else:
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            freed += size
+
+        # 按清理后的目录重建索引
+        with self._disk_lock:
+            self._scan_disk()
+        return freed
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_items": len(self._memory),
+            "disk_bytes": self._disk_bytes,
+            "evictions": self.evictions,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+@dataclass
+class CachedPhoto:
+    # photo 为 None 表示该本子不存在（负缓存）
+    photo: JmPhotoDetail | None
+    fetched_at: float
+
+    @property
+    def missing(self) -> bool:
+        return self.photo is None
+
+
+class PhotoInfoCache:
+    """
+    本子信息缓存
+
+    内存中按 LRU 保留，可选持久化到 SQLite。超过 ttl 的信息在 stale_ttl 内仍可使用，
+    但调用方应在后台重新获取；不存在的本子按 negative_ttl 缓存
+
+    下载需要完整的 JmPhotoDetail（包括所属的本子），因此数据库中保存 pickle 后的对象，
+    每条记录带有缓存格式和 jmcomic 的版本，版本不一致的记录视为不存在并被删除
+    """
+
+    # 修改保存的数据格式时递增
+    SCHEMA_VERSION = 1
+    VERSION = f"{SCHEMA_VERSION}:{jmcomic.__version__}"
+
+    def __init__(self, max_items: int = 2000, ttl: float = 3600, stale_ttl: float = 86400,
+                 negative_ttl: float = 600, db_path: Path | None = None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self._memory: OrderedDict[str, CachedPhoto] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._db: sqlite3.Connection | None = None
+        if db_path is not None:
+            self._open_db(db_path)
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def _open_db(self, db_path: Path):
+        try:
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS photo_info ("
+                "photo_id TEXT PRIMARY KEY, fetched_at REAL NOT NULL, data BLOB, version TEXT)"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(photo_info)")}
+            if "version" not in columns:
+                self._db.execute("ALTER TABLE photo_info ADD COLUMN version TEXT")
+            # 其他版本写入的对象可能无法正确还原，启动时直接删除
+            self._db.execute("DELETE FROM photo_info WHERE version IS NOT ?", (self.VERSION,))
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.error(f"打开本子信息缓存数据库失败：{e}")
+            self._db = None
+
+    def is_fresh(self, entry: CachedPhoto) -> bool:
+        ttl = self.negative_ttl if entry.missing else self.ttl
+        return time.time() - entry.fetched_at <= ttl
+
+    def is_usable(self, entry: CachedPhoto) -> bool:
+        """ 未过期，或虽过期但仍在可用期内 """
+        if entry.missing:
+            return self.is_fresh(entry)
+        return time.time() - entry.fetched_at <= self.ttl + self.stale_ttl
+
+    def _remember(self, key: str, entry: CachedPhoto):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def get_memory(self, photo_id: int | str) -> CachedPhoto | None:
+        """ 从内存中获取可用的缓存 """
+        key = str(photo_id)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if not self.is_usable(entry):
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+        self._count(entry)
+        return entry
+
+    def load_db(self, photo_id: int | str) -> CachedPhoto | None:
+        """ 从数据库中获取可用的缓存，并放入内存 """
+        if self._db is None:
+            self.misses += 1
+            return None
+
+        key = str(photo_id)
+        try:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT fetched_at, data FROM photo_info WHERE photo_id = ? AND version = ?", (key, self.VERSION)
+                ).fetchone()
+            entry = None
+            if row is not None:
+                entry = CachedPhoto(pickle.loads(row[1]) if row[1] is not None else None, row[0])
+        except sqlite3.Error as e:
+            logger.warning(f"读取本子信息缓存失败：{e}")
+            entry = None
+        except Exception as e:
+            # 类被移动或修改后，还原时可能抛出 ImportError、TypeError 等任意异常
+            logger.warning(f"本子信息缓存 {key} 无法还原，已删除：{e!r}")
+            self._delete_db(key)
+            entry = None
+
+        if entry is None or not self.is_usable(entry):
+            self.misses += 1
+            return None
+
+        self._remember(key, entry)
+        self._count(entry)
+        return entry
+
+    def _delete_db(self, key: str):
+        try:
+            with self._lock:
+                self._db.execute("DELETE FROM photo_info WHERE photo_id = ?", (key,))
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"删除本子信息缓存失败：{e}")
+
+    def _count(self, entry: CachedPhoto):
+        if self.is_fresh(entry):
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+
+    def put(self, photo_id: int | str, photo: JmPhotoDetail | None):
+        """ 写入缓存，photo 为 None 时记录为不存在 """
+        key = str(photo_id)
+        entry = CachedPhoto(photo, time.time())
+        self._remember(key, entry)
+
+        if self._db is None:
+            return
+        try:
+            data = pickle.dumps(photo) if photo is not None else None
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO photo_info (photo_id, fetched_at, data, version) VALUES (?, ?, ?, ?)",
+                    (key, entry.fetched_at, data, self.VERSION),
+                )
+                self._db.commit()
+        except (sqlite3.Error, pickle.PicklingError, AttributeError, TypeError) as e:
+            logger.warning(f"写入本子信息缓存失败：{e}")
+
+    def sweep(self) -> int:
+        """ 删除数据库中已不可用的记录，返回删除的条数 """
+        if self._db is None:
+            return 0
+        now = time.time()
+        try:
+            with self._lock:
+                cursor = self._db.execute(
+                    "DELETE FROM photo_info WHERE (data IS NULL AND fetched_at < ?) OR fetched_at < ?",
+                    (now - self.negative_ttl, now - self.ttl - self.stale_ttl),
+                )
+                self._db.commit()
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.warning(f"清理本子信息缓存失败：{e}")
+            return 0
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+            self._db = None
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "memory_items": len(self._memory),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+        }
+
+
+class SearchResultCache:
+    """
+    所有用户共享的搜索结果缓存
+
+    以规范化后的搜索词和API页码为键，每页结果以不可变元组保存，
+    用户的搜索状态只记录翻页位置，按 LRU 淘汰并带过期时间
+    """
+
+    def __init__(self, max_pages: int = 200, ttl: float = 1800):
+        self.max_pages = max_pages
+        self.ttl = ttl
+        self._pages: OrderedDict[tuple[str, int], tuple[float, tuple[SearchItem, ...]]] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """ 统一全角半角、大小写和空白，使等价的搜索词命中同一缓存 """
+        return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+    def get(self, query: str, page: int) -> tuple[SearchItem, ...] | None:
+        """ 获取未过期的一页搜索结果 """
+        key = (self.normalize(query), page)
+        entry = self._pages.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            self._pages.pop(key, None)
+            self.misses += 1
+            return None
+
+        self._pages.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, query: str, page: int, items: list[SearchItem]) -> tuple[SearchItem, ...]:
+        """ 缓存一页搜索结果，返回缓存中的不可变副本 """
+        key = (self.normalize(query), page)
+        frozen = tuple(items)
+        self._pages[key] = (time.monotonic(), frozen)
+        self._pages.move_to_end(key)
+        while len(self._pages) > self.max_pages:
+            self._pages.popitem(last=False)
+        return frozen
+
+    def sweep(self) -> int:
+        """ 删除过期的搜索结果，返回删除的页数 """
+        now = time.monotonic()
+        expired = [key for key, (stored_at, _) in self._pages.items() if now - stored_at > self.ttl]
+        for key in expired:
+            del self._pages[key]
+        return len(expired)
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "pages": len(self._pages),
+            "items": sum(len(items) for _, items in self._pages.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+pdf_cache = PdfCache(
+    plugin_cache_dir,
+    max_bytes=plugin_config.jmcomic_cache_size * 1024 * 1024,
+    policy=plugin_config.jmcomic_cache_policy,
+)
+cover_cache = CoverCache(
+    plugin_cache_dir / "covers",
+    memory_items=plugin_config.jmcomic_cover_memory_items,
+    max_bytes=plugin_config.jmcomic_cover_cache_size * 1024 * 1024,
+    ttl=plugin_config.jmcomic_cover_cache_ttl * 3600,
+)
+photo_info_cache = PhotoInfoCache(
+    max_items=plugin_config.jmcomic_photo_cache_size,
+    ttl=plugin_config.jmcomic_photo_cache_ttl * 60,
+    db_path=plugin_cache_dir / "metadata" / "photo_info.db" if plugin_config.jmcomic_photo_cache_persist else None,
+)
+search_result_cache = SearchResultCache(
+    max_pages=plugin_config.jmcomic_search_cache_size,
+    ttl=plugin_config.jmcomic_search_cache_ttl * 60,
+)
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Optional
+from typing import Literal, Optional
 from nonebot import get_plugin_config, require, logger
 from pydantic import BaseModel, Field, validator
 
@@ -19,6 +19,44 @@ class Config(BaseModel):
     jmcomic_modify_real_md5: bool = Field(default=False, description="是否真正修改PDF文件的MD5值")
     jmcomic_blocked_message: str = Field(default="猫猫吃掉了一个不豪吃的本子", description="搜索屏蔽时显示的消息")
     jmcomic_results_per_page: int = Field(default=20, description="每页显示的搜索结果数量")
+    jmcomic_download_workers: int = Field(default=2, description="同时下载的本子数量")
+    jmcomic_download_queue_size: int = Field(default=30, description="下载队列的最大长度")
+    jmcomic_cache_size: int = Field(default=2048, description="PDF缓存的最大容量(MB)")
+    jmcomic_cache_policy: Literal["lru", "lfu"] = Field(default="lru", description="PDF缓存的淘汰策略")
+    jmcomic_http_max_connections: int = Field(default=20, description="封面下载的最大连接数")
+    jmcomic_http2: bool = Field(default=False, description="封面下载是否启用HTTP/2")
+    jmcomic_cover_hedge_delay: float = Field(
+        default=3.0, description="封面请求超过该秒数未返回时向下一个域名发起对冲请求"
+    )
+    jmcomic_cover_memory_items: int = Field(default=200, description="内存中缓存的封面数量")
+    jmcomic_cover_cache_size: int = Field(default=200, description="磁盘封面缓存的最大容量(MB)")
+    jmcomic_cover_cache_ttl: int = Field(default=72, description="磁盘封面缓存的有效期(小时)")
+    jmcomic_image_process_workers: int = Field(default=0, description="封面处理的进程数，0表示在线程中处理")
+    jmcomic_photo_cache_size: int = Field(default=2000, description="内存中缓存的本子信息数量")
+    jmcomic_photo_cache_ttl: int = Field(default=60, description="本子信息缓存的有效期(分钟)")
+    jmcomic_photo_cache_persist: bool = Field(default=False, description="是否将本子信息缓存持久化到SQLite")
+    jmcomic_pdf_mode: Literal["stream", "img2pdf"] = Field(default="stream", description="PDF的生成方式")
+    jmcomic_delete_images: bool = Field(default=True, description="生成PDF后是否删除原始图片")
+    jmcomic_thumbnail_count: int = Field(default=0, description="删除原始图片时保留的缩略图数量")
+    jmcomic_api_concurrency: int = Field(default=4, description="同时请求JM接口的最大数量")
+    jmcomic_cover_concurrency: int = Field(default=8, description="同时下载封面的最大数量")
+    jmcomic_item_timeout: float = Field(default=10.0, description="单个搜索结果获取信息和封面的超时时间(秒)")
+    jmcomic_search_timeout: float = Field(default=20.0, description="一页搜索结果的最长等待时间(秒)")
+    jmcomic_search_progressive: bool = Field(default=False, description="是否先发送文字搜索结果，再分批发送封面")
+    jmcomic_cover_batch_size: int = Field(default=5, description="分批发送封面时每批的数量")
+    jmcomic_search_prefetch: bool = Field(default=True, description="是否在后台预取搜索结果的下一页")
+    jmcomic_search_cache_size: int = Field(default=200, description="共享搜索结果缓存的最大页数")
+    jmcomic_search_cache_ttl: int = Field(default=30, description="共享搜索结果缓存的有效期(分钟)")
+    jmcomic_search_max_sessions: int = Field(default=1000, description="同时保留的搜索状态数量上限")
+    jmcomic_search_max_results: int = Field(default=800, description="单次搜索最多可翻阅的结果数量")
+    jmcomic_storage: Literal["sqlite", "json"] = Field(default="sqlite", description="插件数据的存储方式")
+    jmcomic_save_interval: float = Field(default=2.0, description="JSON存储时合并写入的间隔(秒)")
+    jmcomic_filter_titles: bool = Field(default=False, description="禁止的标签是否也匹配本子标题")
+    jmcomic_user_rate_limit: int = Field(default=0, description="每位用户在时间窗口内最多发起的下载次数，0 表示不限制")
+    jmcomic_group_rate_limit: int = Field(default=0, description="每个群在时间窗口内最多发起的下载次数，0 表示不限制")
+    jmcomic_rate_limit_window: float = Field(default=60.0, description="下载频率限制的时间窗口(秒)")
+    jmcomic_io_workers: int = Field(default=4, description="文件操作线程池的线程数")
+    jmcomic_loop_lag_threshold: float = Field(default=0.2, description="事件循环阻塞超过该秒数时记录警告，0 表示不监控")
 
 
     @validator('jmcomic_password', 'jmcomic_username', pre=True)
@@ -41,6 +79,18 @@ if plugin_config.jmcomic_username is not None and plugin_config.jmcomic_password
         password: {plugin_config.jmcomic_password}
 """
 
+pdf_block = ""
+if plugin_config.jmcomic_pdf_mode == "img2pdf":
+    pdf_block = f"""  after_photo:
+    - plugin: img2pdf
+      kwargs:
+        pdf_dir: {cache_dir}
+        filename_rule: Pid
+"""
+
+# 没有任何插件时需要写成空字典
+plugins_block = login_block + pdf_block or "  {}\n"
+
 
 config_data = f"""
 log: {plugin_config.jmcomic_log}
@@ -63,10 +113,5 @@ dir_rule:
   rule: Bd_Pid
 
 plugins:
-{login_block}
-  after_photo:
-    - plugin: img2pdf
-      kwargs:
-        pdf_dir: {cache_dir}
-        filename_rule: Pid
+{plugins_block}
 """
\ No newline at end of file
@@ -0,0 +1,135 @@
+from collections import deque
+from collections.abc import Callable, Iterable
+import importlib.util
+import unicodedata
+
+from nonebot import logger
+
+# 常见繁体字到简体字的对照，未安装 OpenCC 时使用，覆盖标签中常见的用字
+_T2S_PAIRS = (
+    "獵猎殺杀屍尸戀恋亂乱倫伦強强姦奸幹干戰战體体亞亚醫医學学愛爱處处獸兽觸触蟲虫糞粪雙双們们無无與与開开"
+    "關关蘿萝偽伪僞伪變变態态滿满畫画漢汉語语單单東东國国見见視视頭头髮发腳脚臉脸顏颜錄录僕仆為为會会後后"
+    "裡里嗎吗這这說说對对發发動动還还過过時时從从進进現现實实點点長长問问間间邊边電电車车馬马鳥鸟魚鱼龍龙"
+    "門门風风飛飞書书員员讓让認认記记設设計计話话請请議议論论談谈調调響响傷伤膽胆腦脑臟脏腸肠蝕蚀懷怀產产"
+    "嬰婴兒儿孫孙親亲媽妈爺爷師师將将軍军隊队監监獄狱罰罚隸隶緊紧縛缚綁绑繩绳鎖锁鏈链針针劍剑槍枪彈弹藥药"
+    "蕩荡騷骚癡痴醜丑機机獨独異异種种壞坏惡恶夢梦靈灵屬属類类級级網网絡络號号碼码條条戲戏劇剧樂乐聲声"
+)
+_T2S_TABLE = str.maketrans({_T2S_PAIRS[i]: _T2S_PAIRS[i + 1] for i in range(0, len(_T2S_PAIRS), 2)})
+
+
+def _load_converter() -> Callable[[str], str]:
+    """ 优先使用 OpenCC 进行繁简转换，未安装时使用内置对照表 """
+    if importlib.util.find_spec("opencc") is not None:
+        try:
+            from opencc import OpenCC
+            return OpenCC("t2s").convert
+        except Exception as e:
+            logger.warning(f"加载 OpenCC 失败，使用内置繁简对照表：{e}")
+    return lambda text: text.translate(_T2S_TABLE)
+
+
+_to_simplified = _load_converter()
+
+
+def normalize_text(text: str) -> str:
+    """ 统一全角半角、大小写和繁简体 """
+    return _to_simplified(unicodedata.normalize("NFKC", text).casefold())
+
+
+class KeywordMatcher:
+    """
+    预编译的关键词匹配器（Aho-Corasick 自动机）
+
+    关键词与待匹配文本都会先经过 normalize_text 规范化，匹配时只需扫描文本一遍，
+    耗时与关键词数量无关。新增关键词时只插入字典树，失配指针在下次匹配前重建
+    """
+
+    # 拼接多个标签时使用的分隔符，规范化后的关键词不会包含它，因此不会跨标签匹配
+    SEPARATOR = "\x00"
+
+    def __init__(self, keywords: Iterable[str] = ()):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # 每个状态匹配到的关键词（含失配链上的），None 表示没有
+        self._output: list[str | None] = [None]
+        self._dirty = False
+        self.keywords: set[str] = set()
+        for keyword in keywords:
+            self.add(keyword)
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def add(self, keyword: str) -> bool:
+        """
+        加入关键词
+
+        Returns:
+            bool: 是否为新关键词，规范化后为空或已存在时返回 False
+        """
+        normalized = normalize_text(keyword).replace(self.SEPARATOR, "")
+        if not normalized or normalized in self.keywords:
+            return False
+
+        state = 0
+        for char in normalized:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(None)
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state] = normalized
+
+        self.keywords.add(normalized)
+        self._dirty = True
+        return True
+
+    def _build(self):
+        """ 按层次遍历计算失配指针，并沿失配链传递匹配结果 """
+        queue = deque()
+        for state in self._goto[0].values():
+            self._fail[state] = 0
+            queue.append(state)
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                if self._output[next_state] is None:
+                    self._output[next_state] = self._output[self._fail[next_state]]
+                queue.append(next_state)
+
+        self._dirty = False
+
+    def find(self, text: str) -> str | None:
+        """
+        在文本中查找关键词
+
+        Returns:
+            str | None: 第一个匹配到的关键词（规范化后），没有匹配时返回 None
+        """
+        if not self.keywords or not text:
+            return None
+        if self._dirty:
+            self._build()
+
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in normalize_text(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state] is not None:
+                return output[state]
+        return None
+
+    def find_any(self, texts: Iterable[str]) -> str | None:
+        """ 在多段文本中查找关键词，各段之间不会跨越匹配 """
+        return self.find(self.SEPARATOR.join(texts))
@@ -1,18 +1,58 @@
-import json
+import asyncio
+import heapq
+import itertools
+import sys
+import threading
+import time
+from collections.abc import Iterable
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Optional
 from dataclasses import dataclass, field
 
 from nonebot import logger, require
 
 from .config import plugin_config
+from .content_filter import KeywordMatcher, normalize_text
+from .quota import current_period
+from .storage import JsonStorage, SqliteStorage, StorageBackend
 
 require("nonebot_plugin_localstore")
 from nonebot_plugin_localstore import get_plugin_data_dir
 
 
+@dataclass
+class BulkResult:
+    """ 批量修改的结果，按输入顺序记录新增、重复和无效的值 """
+    added: list[str] = field(default_factory=list)
+    duplicate: list[str] = field(default_factory=list)
+    invalid: list[str] = field(default_factory=list)
+
+    def summary(self) -> str:
+        return f"新增 {len(self.added)} 个，重复 {len(self.duplicate)} 个，无效 {len(self.invalid)} 个"
+
+
+@dataclass
+class QuotaReservation:
+    """ 预留的下载次数，文件发送成功后提交扣除，失败时释放 """
+    reservation_id: int
+    user_id: str
+    amount: int
+    created_at: float = field(default_factory=time.monotonic)
+
+
 class JmComicDataManager:
-    """ 用于管理与 JMComic 插件相关的数据 """
+    """
+    用于管理与 JMComic 插件相关的数据
+
+    黑名单、禁止下载的本子ID和标签等频繁查询的数据在内存中以集合建立索引，
+    修改时同步更新索引与存储后端，查询不访问存储
+
+    下载次数通过预留、提交、释放三步扣除，预留中的次数只记录在内存中，
+    提交时才写入存储，Bot 在下载途中重启不会扣除用户的次数
+    """
+
+    # 预留超过该秒数仍未提交或释放时视为泄漏，由定时任务释放
+    RESERVATION_TTL = 2 * 60 * 60
 
     DEFAULT_RESTRICTED_TAGS = ["獵奇", "重口", "YAOI", "yaoi", "男同", "血腥", "猎奇", "虐杀", "恋尸癖" ]
     DEFAULT_RESTRICTED_IDS = [
@@ -22,226 +62,516 @@ class JmComicDataManager:
         "382596", "418600", "279464", "565616", "222458"
     ]
 
-    def __init__(self, filename: str = "jmcomic_data.json"):
+    def __init__(self, filename: str = "jmcomic_data.json", backend: str = "sqlite"):
         self.filepath = get_plugin_data_dir() / filename
-        self.data = {}
         self.default_enabled = plugin_config.jmcomic_allow_groups
-        self._load_data()
-
-        if "restricted_tags" not in self.data or not self.data["restricted_tags"]:
-            self.data["restricted_tags"] = self.DEFAULT_RESTRICTED_TAGS.copy()
-
-        if "restricted_ids" not in self.data:
-            self.data["restricted_ids"] = self.DEFAULT_RESTRICTED_IDS.copy()
-
-        self.save()
-
-    def _load_data(self):
-        """ 加载数据文件 """
-        if self.filepath.exists():
-            try:
-                with self.filepath.open("r", encoding="utf-8") as f:
-                    self.data = json.load(f)
-                    logger.info(f"成功加载数据文件：{self.filepath}")
-            except json.JSONDecodeError as e:
-                logger.error(f"数据文件读取错误：{e}")
-                self.data = {}
+
+        self.storage: StorageBackend
+        if backend == "sqlite":
+            self.storage = SqliteStorage(self.filepath.with_suffix(".db"), migrate_from=self.filepath)
         else:
-            logger.info(f"未找到数据文件，将创建新的文件：{self.filepath}")
-            self.data = {}
+            self.storage = JsonStorage(self.filepath, save_interval=plugin_config.jmcomic_save_interval)
+
+        if not self.storage.list_items("restricted_tags"):
+            # 标签列表被清空时也恢复默认值
+            self.storage.ensure_list("restricted_tags", [])
+            for tag in self.DEFAULT_RESTRICTED_TAGS:
+                self.storage.add_item("restricted_tags", tag)
+
+        self.storage.ensure_list("restricted_ids", self.DEFAULT_RESTRICTED_IDS)
+        # 旧版本由定时任务统一重置，记录没有周期，视为属于当前周期
+        self.storage.fill_quota_periods(current_period())
+
+        self._restricted_ids: set[str] = set(self.storage.list_items("restricted_ids"))
+        self._forbidden_albums: set[str] = set(self.storage.list_items("forbidden_albums"))
+        # 标签集合只在修改时整体替换，查询时无需复制
+        self._restricted_tags: frozenset[str] = frozenset(self.storage.list_items("restricted_tags"))
+        self._tag_matcher = KeywordMatcher(self._restricted_tags)
+        self.filter_titles = plugin_config.jmcomic_filter_titles
+        # 群黑名单和启用状态在首次查询该群时加载
+        self._blacklists: dict[str, set[str]] = {}
+        self._group_enabled: dict[str, bool | None] = {}
+
+        # 预留与扣除需要在同一把锁内读取并修改次数，避免并发的指令重复使用同一次数
+        self._quota_lock = threading.RLock()
+        self._reservations: dict[int, QuotaReservation] = {}
+        self._reserved: dict[str, int] = {}
+        self._reservation_ids = itertools.count(1)
+        self.reservations_committed = 0
+        self.reservations_released = 0
+        self.reservations_expired = 0
+
+    def batch(self):
+        """
+        批量修改的上下文，期间的修改合并为一次持久化
+
+        Example:
+            with data_manager.batch():
+                for user_id in user_ids:
+                    data_manager.add_blacklist(group_id, user_id)
+        """
+        return self.storage.batch()
 
-    def save(self):
-        """ 保存数据到文件 """
-        try:
-            with self.filepath.open("w", encoding="utf-8") as f:
-                json.dump(self.data, f, indent=4, ensure_ascii=False)
-        except Exception as e:
-            logger.error(f"保存数据文件出错：{e}")
+    def close(self):
+        """ 关闭存储后端，写入尚未保存的数据 """
+        self.storage.close()
 
     # ------------------- 群文件夹 ID 管理 -------------------
     def set_group_folder_id(self, group_id: int, folder_id: str):
         """ 设置群文件夹ID """
-        group_data = self.data.setdefault(str(group_id), {})
-        group_data["folder_id"] = folder_id
-        self.save()
+        self.storage.set_group_setting(str(group_id), "folder_id", folder_id)
 
     def get_group_folder_id(self, group_id: int) -> str | None:
         """ 获取群文件夹ID """
-        group_data = self.data.get(str(group_id), {})
-        return group_data.get("folder_id")
+        return self.storage.get_group_setting(str(group_id), "folder_id")
 
     # ------------------- 用户下载限制管理 (全局) -------------------
+    def _stored_user_limit(self, user_id: str) -> int:
+        """ 获取存储中用户的下载次数，记录属于之前的周期时视为已重置 """
+        quota = self.storage.get_user_quota(user_id)
+        if quota is None or quota[1] != current_period():
+            return plugin_config.jmcomic_user_limits
+        return quota[0]
+
     def get_user_limit(self, user_id: int) -> int:
-        """ 获取用户的当前下载次数"""
-        user_limits = self.data.setdefault("user_limits", {})
-        return user_limits.get(str(user_id), plugin_config.jmcomic_user_limits)
+        """ 获取用户当前可用的下载次数，不包括预留中的次数 """
+        key = str(user_id)
+        with self._quota_lock:
+            return max(0, self._stored_user_limit(key) - self._reserved.get(key, 0))
 
     def set_user_limit(self, user_id: int, limit: int):
-        """ 设置用户的下载次数 """
-        user_limits = self.data.setdefault("user_limits", {})
-        user_limits[str(user_id)] = limit
-        self.save()
+        """ 设置用户在当前周期的下载次数 """
+        self.storage.set_user_quota(str(user_id), limit, current_period())
 
     def increase_user_limit(self, user_id: int, amount: int = 1):
         """ 增加用户的下载次数 """
-        current_limit = self.get_user_limit(user_id)
-        self.set_user_limit(user_id, current_limit + amount)
+        with self._quota_lock:
+            self.set_user_limit(user_id, self._stored_user_limit(str(user_id)) + amount)
 
     def decrease_user_limit(self, user_id: int, amount: int = 1):
         """ 减少用户的下载次数，最低为 0 """
-        current_limit = self.get_user_limit(user_id)
-        new_limit = max(0, current_limit - amount)
-        self.set_user_limit(user_id, new_limit)
+        with self._quota_lock:
+            self.set_user_limit(user_id, max(0, self._stored_user_limit(str(user_id)) - amount))
+
+    def reserve_user_limit(self, user_id: int, amount: int = 1) -> QuotaReservation | None:
+        """
+        预留用户的下载次数，预留期间这些次数不能被其他请求使用
+
+        Returns:
+            QuotaReservation | None: 预留凭据，可用次数不足时返回 None
+        """
+        key = str(user_id)
+        with self._quota_lock:
+            if self._stored_user_limit(key) - self._reserved.get(key, 0) < amount:
+                return None
+            reservation = QuotaReservation(next(self._reservation_ids), key, amount)
+            self._reservations[reservation.reservation_id] = reservation
+            self._reserved[key] = self._reserved.get(key, 0) + amount
+            return reservation
+
+    def _pop_reservation(self, reservation: QuotaReservation) -> bool:
+        if self._reservations.pop(reservation.reservation_id, None) is None:
+            return False
+        remaining = self._reserved[reservation.user_id] - reservation.amount
+        if remaining > 0:
+            self._reserved[reservation.user_id] = remaining
+        else:
+            del self._reserved[reservation.user_id]
+        return True
+
+    def commit_reservation(self, reservation: QuotaReservation) -> bool:
+        """
+        提交预留，从存储中扣除预留的次数
+
+        Returns:
+            bool: 是否扣除，预留已被释放或已提交时返回 False
+        """
+        with self._quota_lock:
+            if not self._pop_reservation(reservation):
+                return False
+            stored = self._stored_user_limit(reservation.user_id)
+            self.storage.set_user_quota(reservation.user_id, max(0, stored - reservation.amount), current_period())
+            self.reservations_committed += 1
+            return True
+
+    def release_reservation(self, reservation: QuotaReservation) -> bool:
+        """
+        释放预留，退还预留的次数，已提交的预留不受影响
+
+        Returns:
+            bool: 是否退还
+        """
+        with self._quota_lock:
+            if not self._pop_reservation(reservation):
+                return False
+            self.reservations_released += 1
+            return True
+
+    def expire_reservations(self) -> int:
+        """ 释放超时仍未提交或释放的预留，返回释放的数量 """
+        deadline = time.monotonic() - self.RESERVATION_TTL
+        with self._quota_lock:
+            expired = [r for r in self._reservations.values() if r.created_at < deadline]
+            for reservation in expired:
+                self._pop_reservation(reservation)
+            self.reservations_released += len(expired)
+            self.reservations_expired += len(expired)
+        if expired:
+            logger.warning(f"已释放 {len(expired)} 个超时未完成的下载次数预留")
+        return len(expired)
+
+    def stats(self) -> dict[str, int]:
+        with self._quota_lock:
+            return {
+                "outstanding": len(self._reservations),
+                "reserved": sum(self._reserved.values()),
+                "committed": self.reservations_committed,
+                "released": self.reservations_released,
+                "expired": self.reservations_expired,
+            }
 
     # ------------------- 群黑名单管理 -------------------
+    def _blacklist_of(self, group_id: str) -> set[str]:
+        blacklist = self._blacklists.get(group_id)
+        if blacklist is None:
+            blacklist = set(self.storage.list_blacklist(group_id))
+            self._blacklists[group_id] = blacklist
+        return blacklist
+
     def add_blacklist(self, group_id: int, user_id: int):
         """ 添加用户到群黑名单 """
-        group_data = self.data.setdefault(str(group_id), {})
-        blacklist = group_data.setdefault("blacklist", [])
+        blacklist = self._blacklist_of(str(group_id))
         if str(user_id) not in blacklist:
-            blacklist.append(str(user_id))
-            self.save()
+            self.storage.add_blacklist(str(group_id), str(user_id))
+            blacklist.add(str(user_id))
 
     def remove_blacklist(self, group_id: int, user_id: int):
         """ 从群黑名单移除用户 """
-        group_data = self.data.get(str(group_id), {})
-        blacklist = group_data.get("blacklist", [])
+        blacklist = self._blacklist_of(str(group_id))
         if str(user_id) in blacklist:
-            blacklist.remove(str(user_id))
-            self.save()
+            self.storage.remove_blacklist(str(group_id), str(user_id))
+            blacklist.discard(str(user_id))
 
     def is_user_blacklisted(self, group_id: int, user_id: int) -> bool:
         """ 检查用户是否在群黑名单中 """
-        group_data = self.data.get(str(group_id), {})
-        blacklist = group_data.get("blacklist", [])
-        return str(user_id) in blacklist
+        return str(user_id) in self._blacklist_of(str(group_id))
 
     def list_blacklist(self, group_id: int) -> list[str]:
         """ 列出当前群的黑名单 """
-        group_data = self.data.get(str(group_id), {})
-        return group_data.get("blacklist", [])
+        return self.storage.list_blacklist(str(group_id))
 
     # ------------------- 群功能启用管理 -------------------
     def is_group_enabled(self, group_id: int) -> bool:
         """ 检查群是否启用功能 """
-        group_data = self.data.get(str(group_id), {})
-        return group_data.get("enabled", self.default_enabled)
+        key = str(group_id)
+        if key not in self._group_enabled:
+            self._group_enabled[key] = self.storage.get_group_setting(key, "enabled")
+        enabled = self._group_enabled[key]
+        return self.default_enabled if enabled is None else enabled
 
     def set_group_enabled(self, group_id: int, enabled: bool):
         """ 设置群功能启用或禁用 """
-        group_data = self.data.setdefault(str(group_id), {})
-        group_data["enabled"] = enabled
-        self.save()
+        self.storage.set_group_setting(str(group_id), "enabled", enabled)
+        self._group_enabled[str(group_id)] = enabled
+
+    def set_groups_enabled(self, group_ids: Iterable[str], enabled: bool) -> BulkResult:
+        """
+        批量启用或禁用群，所有修改只持久化一次
+
+        Args:
+            group_ids: 群号，非数字视为无效
+            enabled: 是否启用
+
+        Returns:
+            BulkResult: 已处于该状态的群记为重复
+        """
+        result = BulkResult()
+        seen = set()
+        with self.batch():
+            for group_id in group_ids:
+                if not group_id.isdigit():
+                    result.invalid.append(group_id)
+                elif group_id in seen or self.is_group_enabled(int(group_id)) == enabled:
+                    result.duplicate.append(group_id)
+                else:
+                    self.set_group_enabled(int(group_id), enabled)
+                    result.added.append(group_id)
+                seen.add(group_id)
+        return result
 
     # ------------------- 默认禁止下载的本子管理 -------------------
     def list_forbidden_albums(self) -> list[str]:
         """
         返回不可下载的本子列表
         """
-        return self.data.setdefault("forbidden_albums", [])
+        return self.storage.list_items("forbidden_albums")
 
     def add_forbidden_album(self, album_id: str):
         """
         将某本子ID加入禁用列表
         """
-        forbidden = self.data.setdefault("forbidden_albums", [])
-        if album_id not in forbidden:
-            forbidden.append(album_id)
-            self.save()
+        if album_id not in self._forbidden_albums:
+            self.storage.add_item("forbidden_albums", album_id)
+            self._forbidden_albums.add(album_id)
 
     def remove_forbidden_album(self, album_id: str):
         """
         将某本子ID移出禁用列表
         """
-        forbidden = self.data.setdefault("forbidden_albums", [])
-        if album_id in forbidden:
-            forbidden.remove(album_id)
-            self.save()
+        if album_id in self._forbidden_albums:
+            self.storage.remove_item("forbidden_albums", album_id)
+            self._forbidden_albums.discard(album_id)
 
     def is_forbidden_album(self, album_id: str) -> bool:
         """
         检查本子是否被禁用
         """
-        return album_id in self.data.setdefault("forbidden_albums", [])
+        return album_id in self._forbidden_albums
 
     # ------------------- 禁止下载: IDs + Tags -------------------
     def add_restricted_jm_id(self, jm_id: str):
         """ 将指定本子ID加入到禁止下载列表 """
-        restricted_ids = self.data.setdefault("restricted_ids", [])
-        if jm_id not in restricted_ids:
-            restricted_ids.append(jm_id)
-            self.save()
+        if jm_id not in self._restricted_ids:
+            self.storage.add_item("restricted_ids", jm_id)
+            self._restricted_ids.add(jm_id)
+
+    def add_restricted_jm_ids(self, jm_ids: Iterable[str]) -> BulkResult:
+        """ 批量加入禁止下载的本子ID，非数字视为无效，只持久化一次 """
+        result = BulkResult()
+        added = set()
+        for jm_id in jm_ids:
+            if not jm_id.isdigit():
+                result.invalid.append(jm_id)
+            elif jm_id in self._restricted_ids or jm_id in added:
+                result.duplicate.append(jm_id)
+            else:
+                result.added.append(jm_id)
+                added.add(jm_id)
+
+        if result.added:
+            self.storage.add_items("restricted_ids", result.added)
+            self._restricted_ids.update(added)
+        return result
 
     def is_jm_id_restricted(self, jm_id: str) -> bool:
         """ 检查某个本子ID是否在禁止列表中 """
-        restricted_ids = self.data.setdefault("restricted_ids", [])
-        return jm_id in restricted_ids
+        return jm_id in self._restricted_ids
 
     def add_restricted_tag(self, tag: str):
         """ 将指定标签加入到禁止下载列表 """
-        restricted_tags = self.data.setdefault("restricted_tags", [])
-        if tag not in restricted_tags:
-            restricted_tags.append(tag)
-            self.save()
+        if tag not in self._restricted_tags:
+            self.storage.add_item("restricted_tags", tag)
+            self._restricted_tags = self._restricted_tags | {tag}
+            self._tag_matcher.add(tag)
+
+    def add_restricted_tags(self, tags: Iterable[str]) -> BulkResult:
+        """ 批量加入禁止的标签，规范化后为空的视为无效，只持久化一次 """
+        result = BulkResult()
+        added = set()
+        for tag in tags:
+            if not normalize_text(tag).strip():
+                result.invalid.append(tag)
+            elif tag in self._restricted_tags or tag in added:
+                result.duplicate.append(tag)
+            else:
+                result.added.append(tag)
+                added.add(tag)
+
+        if result.added:
+            self.storage.add_items("restricted_tags", result.added)
+            self._restricted_tags = self._restricted_tags | added
+            for tag in result.added:
+                self._tag_matcher.add(tag)
+        return result
 
     def is_tag_restricted(self, tag: str) -> bool:
         """ 检查某个标签是否在禁止列表中（忽略大小写的话可再处理） """
-        restricted_tags = self.data.setdefault("restricted_tags", [])
-        return tag in restricted_tags
-
-    def has_restricted_tag(self, tags: list[str]) -> bool:
-        """ 给定一系列tags，若与 restricted_tags 有交集，则返回 True """
-        restricted_tags = set(self.data.setdefault("restricted_tags", []))
-        for t in tags:
-            if t in restricted_tags:
-                return True
-        return False
+        return tag in self._restricted_tags
 
+    def has_exact_restricted_tag(self, tags: list[str]) -> bool:
+        """
+        检查本子是否有标签与禁止的标签完全相同
 
-@dataclass
+        比较前统一大小写、全角半角与繁简体，例如禁止“猎奇”时，标签“獵奇”会命中，“重口猎奇”不会。
+        只有完全相同时才能确定用户有意下载被禁止的本子，可以禁言并拉黑
+        """
+        keywords = self._tag_matcher.keywords
+        return any(normalize_text(tag) in keywords for tag in tags)
+
+    def has_restricted_tag(self, tags: list[str], title: str | None = None) -> bool:
+        """
+        检查本子是否命中禁止的标签
+
+        标签和标题经过大小写、全角半角与繁简体统一后按子串匹配，
+        例如禁止“猎奇”时，标签“獵奇”“重口猎奇”都会命中。
+        子串匹配可能误伤无关的标签，命中时只应隐藏或拒绝，不应惩罚用户
+
+        Args:
+            tags: 本子的标签
+            title: 本子的标题，配置了匹配标题时一并检查
+        """
+        if self._tag_matcher.find_any(tags) is not None:
+            return True
+        return title is not None and self.has_restricted_title(title)
+
+    def has_restricted_title(self, title: str) -> bool:
+        """
+        检查本子标题是否包含禁止的标签，未开启匹配标题时总是返回 False
+
+        标题按子串匹配，可能误伤无关的本子，命中时只应拒绝，不应惩罚用户
+        """
+        return self.filter_titles and bool(title) and self._tag_matcher.find(title) is not None
+
+
+@dataclass(frozen=True)
+class SearchItem:
+    """ 搜索结果中的一个本子，信息缺失的字段为 None。搜索结果在用户之间共享，因此不可修改 """
+    id: str
+    title: str
+    author: str | None = None
+    tags: list[str] | None = None
+
+    @property
+    def is_complete(self) -> bool:
+        return self.author is not None and self.tags is not None
+
+
+# JM搜索接口每页返回的结果数量
+SEARCH_PAGE_SIZE = 80
+
+
+@dataclass(slots=True)
 class SearchState:
+    """ 用户的翻页位置，搜索结果本身保存在共享的搜索结果缓存中 """
     query: str
     start_idx: int
-    total_results: List[str]
+    # 已加载的结果数量，除最后一页外每个API页都是满的，因此第 i 个结果位于第 i // 80 + 1 页
+    total_count: int
+    # 最后一个已加载结果的ID，用于判断API是否重复返回了最后一页
+    last_id: str
     api_page: int
     created_at: datetime = field(default_factory=datetime.now)
+    # 后台预取下一个API页的任务，结果为该页的搜索结果
+    next_page_task: asyncio.Task | None = field(default=None, repr=False)
+    # 后台预热下一页本子信息和封面的任务
+    warm_task: asyncio.Task | None = field(default=None, repr=False)
 
     def is_expired(self, ttl_minutes: int = 30) -> bool:
         return datetime.now() - self.created_at > timedelta(minutes=ttl_minutes)
 
+    def take_next_page(self) -> asyncio.Task | None:
+        """取出预取下一个API页的任务，取出后由调用者负责等待"""
+        task, self.next_page_task = self.next_page_task, None
+        return task
+
+    def cancel_prefetch(self):
+        """取消所有后台预取任务"""
+        for task in (self.next_page_task, self.warm_task):
+            if task is not None and not task.done():
+                task.cancel()
+        self.next_page_task = None
+        self.warm_task = None
+
     @property
     def has_more(self) -> bool:
         """检查是否还有更多结果"""
-        return self.start_idx < len(self.total_results)
+        return self.start_idx < self.total_count
+
+    def may_load_more(self, max_results: int) -> bool:
+        """最后一个API页是满的且未达到单次搜索的结果上限时，可能还有下一页"""
+        return self.total_count % SEARCH_PAGE_SIZE == 0 and self.total_count < max_results
+
 
 class SearchManager:
-    def __init__(self, ttl_minutes: int = 30):
+    """
+    有容量上限的搜索状态存储
+
+    过期时间记录在最小堆中，清理时只需弹出堆顶已过期的状态；
+    状态数量达到上限时淘汰最早过期的状态
+    """
+
+    def __init__(self, ttl_minutes: int = 30, max_sessions: int = 1000, max_results: int = 800):
         self.states: dict[str, SearchState] = {}
         self.ttl_minutes = ttl_minutes
+        self.max_sessions = max(1, max_sessions)
+        self.max_results = max_results
+        # (过期时间, 序号, 用户ID, 状态)，状态被替换或移除后旧记录留在堆中，弹出时跳过
+        self._expiry: list[tuple[datetime, int, str, SearchState]] = []
+        self._counter = itertools.count()
+
+        self.evicted = 0
+        self.expired = 0
+
+    def _is_current(self, user_id: str, state: SearchState) -> bool:
+        return self.states.get(user_id) is state
 
     def get_state(self, user_id: str) -> Optional[SearchState]:
         """获取用户的搜索状态,如果过期则返回None"""
         state = self.states.get(user_id)
         if state and state.is_expired(self.ttl_minutes):
-            del self.states[user_id]
+            self.remove_state(user_id)
+            self.expired += 1
             return None
         return state
 
     def set_state(self, user_id: str, state: SearchState):
-        """设置用户的搜索状态"""
+        """设置用户的搜索状态，替换旧状态时取消其预取任务，超出容量时淘汰最早过期的状态"""
+        old_state = self.states.get(user_id)
+        if old_state is not None and old_state is not state:
+            old_state.cancel_prefetch()
+        elif old_state is None:
+            while len(self.states) >= self.max_sessions and self._pop_oldest():
+                self.evicted += 1
+
         self.states[user_id] = state
+        expires_at = state.created_at + timedelta(minutes=self.ttl_minutes)
+        heapq.heappush(self._expiry, (expires_at, next(self._counter), user_id, state))
+
+        # 频繁替换状态会在堆中留下大量失效记录，超过有效记录两倍时重建
+        if len(self._expiry) > 2 * len(self.states) + 64:
+            self._expiry = [entry for entry in self._expiry if self._is_current(entry[2], entry[3])]
+            heapq.heapify(self._expiry)
+
+    def _pop_oldest(self) -> bool:
+        """移除最早过期的有效状态，没有可移除的状态时返回 False"""
+        while self._expiry:
+            _, _, user_id, state = heapq.heappop(self._expiry)
+            if self._is_current(user_id, state):
+                self.remove_state(user_id)
+                return True
+        return False
 
     def remove_state(self, user_id: str):
         """移除用户的搜索状态"""
-        self.states.pop(user_id, None)
+        state = self.states.pop(user_id, None)
+        if state is not None:
+            state.cancel_prefetch()
 
     def clean_expired(self):
         """清理所有过期的搜索状态"""
-        expired = [uid for uid, state in self.states.items()
-                  if state.is_expired(self.ttl_minutes)]
-        for uid in expired:
-            del self.states[uid]
-
-
-search_manager = SearchManager()
-data_manager = JmComicDataManager()
\ No newline at end of file
+        now = datetime.now()
+        while self._expiry and self._expiry[0][0] < now:
+            _, _, user_id, state = heapq.heappop(self._expiry)
+            if self._is_current(user_id, state):
+                self.remove_state(user_id)
+                self.expired += 1
+
+    def stats(self) -> dict[str, int]:
+        """ 状态数量与估算的内存占用（字节） """
+        memory = sys.getsizeof(self.states) + sys.getsizeof(self._expiry)
+        memory += sum(sys.getsizeof(state) + sys.getsizeof(state.query) + sys.getsizeof(state.last_id)
+                      for state in self.states.values())
+        return {
+            "sessions": len(self.states),
+            "heap_entries": len(self._expiry),
+            "evicted": self.evicted,
+            "expired": self.expired,
+            "memory_bytes": memory,
+        }
+
+
+search_manager = SearchManager(
+    max_sessions=plugin_config.jmcomic_search_max_sessions,
+    max_results=plugin_config.jmcomic_search_max_results,
+)
+data_manager = JmComicDataManager(backend=plugin_config.jmcomic_storage)
\ No newline at end of file
@@ -0,0 +1,328 @@
+import asyncio
+from collections import OrderedDict, deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+import shutil
+import time
+
+from nonebot import logger
+from PIL import Image
+
+from .cache import pdf_cache
+from .config import plugin_config
+
+
+class DownloadSingleFlight:
+    """ 按本子ID合并并发的下载请求，后到的请求等待正在进行的下载并共享其结果 """
+
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Task[bool]] = {}
+        self.started = 0
+        self.merged = 0
+
+    def is_inflight(self, photo_id: int | str) -> bool:
+        """ 检查该本子是否正在下载 """
+        return str(photo_id) in self._inflight
+
+    async def run(self, photo_id: int | str, func: Callable[[], Awaitable[bool]]) -> bool:
+        """
+        执行下载，若同一本子已在下载中则直接等待其结果
+
+        Args:
+            photo_id: 本子ID
+            func: 实际执行下载的协程工厂，返回是否下载成功
+
+        Returns:
+            bool: 是否下载成功
+        """
+        key = str(photo_id)
+        task = self._inflight.get(key)
+
+        if task is None:
+            task = asyncio.create_task(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            self.started += 1
+        else:
+            self.merged += 1
+
+        # 发起者被取消时不应影响其他等待者，因此用 shield 包裹
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "inflight": len(self._inflight),
+            "started": self.started,
+            "merged": self.merged,
+        }
+
+
+class DownloadQueueFull(Exception):
+    """ 下载队列已满，任务未被加入队列 """
+
+
+@dataclass
+class DownloadJob:
+    photo_id: str
+    group_key: str
+    user_key: str
+    func: Callable[[], Awaitable[bool]]
+    future: asyncio.Future[bool]
+    enqueued_at: float = field(default_factory=time.monotonic)
+    position: int = 0
+
+
+class DownloadScheduler:
+    """
+    有界的下载任务队列，由固定数量的下载协程消费
+
+    任务先按群轮转，再在群内按用户轮转，避免单个用户或群占满下载位
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 30):
+        self.worker_count = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        # 群 -> 用户 -> 任务队列，OrderedDict 的顺序即轮转顺序
+        self._queues: OrderedDict[str, OrderedDict[str, deque[DownloadJob]]] = OrderedDict()
+        self._pending = 0
+        self._wakeup = asyncio.Semaphore(0)
+        self._workers: list[asyncio.Task] = []
+
+        self.running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.finished = 0
+        self.total_wait = 0.0
+        self.total_service = 0.0
+
+    @property
+    def depth(self) -> int:
+        """ 排队中的任务数量 """
+        return self._pending
+
+    @property
+    def idle_workers(self) -> int:
+        """ 空闲的下载协程数量 """
+        return max(0, self.worker_count - self.running)
+
+    def is_full(self) -> bool:
+        return self._pending >= self.max_queue
+
+    def start(self):
+        """ 启动下载协程 """
+        if self._workers:
+            return
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        """ 停止下载协程，并取消所有排队中的任务 """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+        for users in self._queues.values():
+            for jobs in users.values():
+                for job in jobs:
+                    job.future.cancel()
+        self._queues.clear()
+        self._pending = 0
+
+    def submit(self, group_key: str, user_key: str, photo_id: int | str,
+               func: Callable[[], Awaitable[bool]]) -> DownloadJob | None:
+        """
+        提交下载任务
+
+        Args:
+            group_key: 任务所属的群，私聊可使用固定值
+            user_key: 任务所属的用户
+            photo_id: 本子ID
+            func: 实际执行下载的协程工厂
+
+        Returns:
+            DownloadJob | None: 任务对象，队列已满时返回 None
+        """
+        if self.is_full():
+            self.rejected += 1
+            return None
+
+        self.start()
+
+        job = DownloadJob(
+            photo_id=str(photo_id),
+            group_key=group_key,
+            user_key=user_key,
+            func=func,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        users = self._queues.setdefault(group_key, OrderedDict())
+        users.setdefault(user_key, deque()).append(job)
+        self._pending += 1
+        self.submitted += 1
+
+        job.position = self._position_of(job)
+        self._wakeup.release()
+        return job
+
+    def _position_of(self, target: DownloadJob) -> int:
+        """ 模拟轮转出队顺序，计算任务在队列中的位置（从1开始） """
+        queues = OrderedDict(
+            (group, OrderedDict((user, deque(jobs)) for user, jobs in users.items()))
+            for group, users in self._queues.items()
+        )
+        position = 0
+        while queues:
+            position += 1
+            if self._pop_next(queues) is target:
+                return position
+        return position
+
+    @staticmethod
+    def _pop_next(queues: OrderedDict[str, OrderedDict[str, deque[DownloadJob]]]) -> DownloadJob:
+        """ 按群、用户两级轮转取出下一个任务 """
+        group, users = next(iter(queues.items()))
+        user, jobs = next(iter(users.items()))
+        job = jobs.popleft()
+
+        if jobs:
+            users.move_to_end(user)
+        else:
+            del users[user]
+
+        if users:
+            queues.move_to_end(group)
+        else:
+            del queues[group]
+
+        return job
+
+    async def _worker(self):
+        while True:
+            await self._wakeup.acquire()
+            if not self._queues:
+                continue
+
+            job = self._pop_next(self._queues)
+            self._pending -= 1
+            if job.future.cancelled():
+                continue
+
+            started_at = time.monotonic()
+            self.total_wait += started_at - job.enqueued_at
+            self.running += 1
+            try:
+                result = await job.func()
+            except Exception as e:
+                logger.error(f"下载任务 {job.photo_id} 出错: {e}")
+                result = False
+            finally:
+                self.running -= 1
+                self.finished += 1
+                self.total_service += time.monotonic() - started_at
+
+            if not job.future.done():
+                job.future.set_result(result)
+
+    def stats(self) -> dict[str, float]:
+        finished = self.finished or 1
+        return {
+            "depth": self._pending,
+            "running": self.running,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "avg_wait": self.total_wait / finished,
+            "avg_service": self.total_service / finished,
+        }
+
+
+def verify_pdf(pdf_path: Path) -> bool:
+    """ 检查PDF文件是否完整：以 %PDF 开头且末尾带有 %%EOF 标记 """
+    try:
+        with pdf_path.open("rb") as f:
+            if f.read(5) != b"%PDF-":
+                return False
+            f.seek(0, 2)
+            f.seek(max(0, f.tell() - 1024))
+            return b"%%EOF" in f.read()
+    except OSError:
+        return False
+
+
+class PhotoImageCleaner:
+    """ PDF生成后删除本子的原始图片，可选保留少量缩略图用于预览 """
+
+    THUMBNAIL_SIZE = (320, 320)
+    THUMBNAIL_QUALITY = 70
+
+    def __init__(self, thumbnail_root: Path, thumbnail_count: int = 0):
+        self.thumbnail_root = thumbnail_root
+        self.thumbnail_count = thumbnail_count
+        self.cleaned = 0
+        self.reclaimed_bytes = 0
+
+    def thumbnail_dir(self, photo_id: int | str) -> Path:
+        return self.thumbnail_root / str(photo_id)
+
+    def _make_thumbnails(self, photo_id: int | str, images: list[Path]):
+        """ 为前几页图片生成缩略图 """
+        target_dir = self.thumbnail_dir(photo_id)
+        target_dir.mkdir(parents=True, exist_ok=True)
+
+        for image_path in images[:self.thumbnail_count]:
+            try:
+                with Image.open(image_path) as image:
+                    image.draft("RGB", self.THUMBNAIL_SIZE)
+                    image.thumbnail(self.THUMBNAIL_SIZE)
+                    image.convert("RGB").save(target_dir / f"{image_path.stem}.jpg", format="JPEG",
+                                              quality=self.THUMBNAIL_QUALITY, optimize=True)
+            except OSError as e:
+                logger.warning(f"生成缩略图 {image_path} 失败：{e}")
+
+    def cleanup(self, photo_id: int | str, image_dir: Path, pdf_path: Path) -> int:
+        """
+        校验PDF后删除原始图片目录
+
+        Args:
+            photo_id: 本子ID
+            image_dir: 原始图片所在目录
+            pdf_path: 生成的PDF路径
+
+        Returns:
+            int: 释放的字节数，PDF校验失败时不做删除并返回 0
+        """
+        if not image_dir.is_dir():
+            return 0
+
+        if not verify_pdf(pdf_path):
+            logger.warning(f"jm{photo_id} 的PDF校验失败，保留原始图片")
+            return 0
+
+        images = sorted((f for f in image_dir.iterdir() if f.is_file()), key=lambda f: f.name)
+        if self.thumbnail_count > 0:
+            self._make_thumbnails(photo_id, images)
+
+        size = sum(f.stat().st_size for f in images)
+        shutil.rmtree(image_dir, ignore_errors=True)
+
+        self.cleaned += 1
+        self.reclaimed_bytes += size
+        logger.info(f"jm{photo_id} 已删除原始图片，释放 {size / 1024 / 1024:.1f}MB")
+        return size
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "cleaned": self.cleaned,
+            "reclaimed_bytes": self.reclaimed_bytes,
+        }
+
+
+download_flight = DownloadSingleFlight()
+download_scheduler = DownloadScheduler(
+    workers=plugin_config.jmcomic_download_workers,
+    max_queue=plugin_config.jmcomic_download_queue_size,
+)
+image_cleaner = PhotoImageCleaner(
+    pdf_cache.thumbnail_path,
+    thumbnail_count=plugin_config.jmcomic_thumbnail_count,
+)
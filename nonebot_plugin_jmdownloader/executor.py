@@ -0,0 +1,148 @@
+import asyncio
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import threading
+import time
+import traceback
+from typing import ParamSpec, TypeVar
+
+from nonebot import logger
+
+from .config import plugin_config
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+class IoExecutor:
+    """
+    专用于文件操作的有界线程池
+
+    与 asyncio.to_thread 使用的默认线程池（网络请求、下载）分开，
+    清理大量缓存等耗时的文件操作不会占满下载线程，下载也不会让文件操作排队
+    """
+
+    def __init__(self, workers: int = 4):
+        self.workers = max(1, workers)
+        self._executor: ThreadPoolExecutor | None = None
+        self.submitted = 0
+        self.max_wait = 0.0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="jmcomic-io")
+        return self._executor
+
+    async def run(self, func: Callable[P, R], *args: P.args, **kwargs: P.kwargs) -> R:
+        """ 在文件线程池中执行阻塞的文件操作 """
+        submitted_at = time.monotonic()
+
+        def call() -> R:
+            self.max_wait = max(self.max_wait, time.monotonic() - submitted_at)
+            return func(*args, **kwargs)
+
+        self.submitted += 1
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    async def close(self):
+        """ 在驱动关闭时等待进行中的文件操作完成 """
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "workers": self.workers,
+            "submitted": self.submitted,
+            "max_wait": self.max_wait,
+        }
+
+
+class LoopLagMonitor:
+    """
+    事件循环阻塞监控
+
+    事件循环中定时运行的心跳协程记录每次被唤醒的延迟，延迟超过阈值时记录警告；
+    另有一个后台线程检查心跳，事件循环仍被阻塞时打印事件循环线程当前的调用栈，以便定位阻塞的代码
+    """
+
+    STACK_LIMIT = 12
+
+    def __init__(self, threshold: float = 0.2, interval: float = 0.5):
+        self.threshold = threshold
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopped = threading.Event()
+        self._loop_thread_id: int | None = None
+        self._last_beat = time.monotonic()
+        self._reported = False
+
+        self.stalls = 0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self.beats = 0
+
+    async def start(self):
+        if self.threshold <= 0 or self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._beat())
+        self._watchdog = threading.Thread(target=self._watch, name="jmcomic-loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def close(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._watchdog = None
+
+    async def _beat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._last_beat = now
+            self._reported = False
+
+            self.beats += 1
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self.stalls += 1
+                logger.warning(f"事件循环被阻塞了 {lag:.2f}s")
+
+    def _watch(self):
+        """ 在事件循环阻塞期间捕获其调用栈，每次阻塞只打印一次 """
+        while not self._stopped.wait(self.threshold / 2):
+            blocked = time.monotonic() - self._last_beat - self.interval
+            if blocked <= self.threshold or self._reported:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._reported = True
+            stack = "".join(traceback.format_stack(frame, limit=self.STACK_LIMIT))
+            logger.warning(f"事件循环已阻塞 {blocked:.2f}s，当前调用栈：\n{stack}")
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "stalls": self.stalls,
+            "max_lag": self.max_lag,
+            "avg_lag": self.total_lag / self.beats if self.beats else 0.0,
+        }
+
+
+io_executor = IoExecutor(plugin_config.jmcomic_io_workers)
+loop_monitor = LoopLagMonitor(plugin_config.jmcomic_loop_lag_threshold)
+
+
+async def run_io(func: Callable[P, R], *args: P.args, **kwargs: P.kwargs) -> R:
+    """ 在文件线程池中执行阻塞的文件操作，替代 asyncio.to_thread """
+    return await io_executor.run(func, *args, **kwargs)
@@ -0,0 +1,244 @@
+import asyncio
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+import importlib.util
+import time
+
+import httpx
+from nonebot import logger
+
+from .config import plugin_config
+
+
+@dataclass
+class DomainStats:
+    requests: int = 0
+    failures: int = 0
+    new_connections: int = 0
+    total_latency: float = 0.0
+
+    @property
+    def avg_latency(self) -> float:
+        return self.total_latency / self.requests if self.requests else 0.0
+
+    @property
+    def reuse_rate(self) -> float:
+        """ 复用已有连接的请求比例 """
+        return 1 - self.new_connections / self.requests if self.requests else 0.0
+
+
+@dataclass
+class DomainHealth:
+    # 延迟与错误率均为指数加权移动平均
+    latency: float | None = None
+    error_rate: float = 0.0
+    consecutive_failures: int = 0
+    open_until: float = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        """ 是否处于熔断冷却中 """
+        return time.monotonic() < self.open_until
+
+
+class DomainHealthTracker:
+    """
+    图片域名健康度统计
+
+    按滚动延迟和错误率为域名打分，连续失败的域名会熔断一段时间，冷却期间排在最后
+    """
+
+    def __init__(self, alpha: float = 0.3, failure_threshold: int = 3, cooldown: float = 60,
+                 default_latency: float = 1.0):
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        # 尚无数据的域名按该延迟估计，使其有机会被尝试
+        self.default_latency = default_latency
+        self.domains: dict[str, DomainHealth] = {}
+
+    def _health(self, domain: str) -> DomainHealth:
+        return self.domains.setdefault(domain, DomainHealth())
+
+    def _update_latency(self, health: DomainHealth, latency: float):
+        if health.latency is None:
+            health.latency = latency
+        else:
+            health.latency += self.alpha * (latency - health.latency)
+
+    def record_success(self, domain: str, latency: float):
+        health = self._health(domain)
+        self._update_latency(health, latency)
+        health.error_rate *= 1 - self.alpha
+        health.consecutive_failures = 0
+        health.open_until = 0.0
+
+    def record_failure(self, domain: str, latency: float):
+        health = self._health(domain)
+        self._update_latency(health, latency)
+        health.error_rate += self.alpha * (1 - health.error_rate)
+        health.consecutive_failures += 1
+        if health.consecutive_failures >= self.failure_threshold:
+            health.open_until = time.monotonic() + self.cooldown
+            logger.warning(f"图片域名 {domain} 连续失败 {health.consecutive_failures} 次，熔断 {self.cooldown:.0f}s")
+
+    def record_slow(self, domain: str, elapsed: float):
+        """ 对冲请求中落败被取消的请求，其耗时至少为 elapsed """
+        self._update_latency(self._health(domain), elapsed)
+
+    def is_open(self, domain: str) -> bool:
+        return self._health(domain).is_open
+
+    def score(self, domain: str) -> float:
+        """ 分数越低越优先 """
+        health = self._health(domain)
+        latency = health.latency if health.latency is not None else self.default_latency
+        return latency * (1 + 4 * health.error_rate)
+
+    def ordered(self, domains: Iterable[str]) -> list[str]:
+        """ 按健康度排序，熔断中的域名排在最后，全部熔断时仍会依次尝试 """
+        return sorted(domains, key=lambda d: (self._health(d).is_open, self.score(d)))
+
+
+class CoverHttpClient:
+    """ 插件共享的封面下载客户端，复用连接池并按图片域名统计延迟与连接复用情况 """
+
+    def __init__(self, max_connections: int = 20, http2: bool = False, hedge_delay: float = 3.0):
+        self.max_connections = max_connections
+        self.http2 = http2
+        self.hedge_delay = hedge_delay
+        self._client: httpx.AsyncClient | None = None
+        self.domain_stats: dict[str, DomainStats] = {}
+        self.health = DomainHealthTracker()
+        self.hedged = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = self._create_client()
+        return self._client
+
+    def _create_client(self) -> httpx.AsyncClient:
+        http2 = self.http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("未安装 h2，无法启用 HTTP/2，请使用 pip install httpx[http2] 安装")
+            http2 = False
+
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+            keepalive_expiry=60,
+        )
+        return httpx.AsyncClient(limits=limits, http2=http2, timeout=httpx.Timeout(40, connect=10))
+
+    async def start(self):
+        """ 在驱动启动时创建客户端 """
+        _ = self.client
+
+    async def close(self):
+        """ 在驱动关闭时释放连接池 """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get(self, domain: str, url: str, timeout: float | None = None) -> httpx.Response:
+        """
+        发起 GET 请求并记录该域名的统计信息
+
+        Args:
+            domain: 图片域名，用于分组统计
+            url: 请求地址
+            timeout: 超时时间，为 None 时使用客户端默认值
+
+        Returns:
+            httpx.Response: 响应，状态码异常时抛出 httpx.HTTPStatusError
+        """
+        stats = self.domain_stats.setdefault(domain, DomainStats())
+
+        async def trace(event_name: str, info: dict):
+            if event_name == "connection.connect_tcp.started":
+                stats.new_connections += 1
+
+        started_at = time.monotonic()
+        stats.requests += 1
+        try:
+            kwargs = {"extensions": {"trace": trace}}
+            if timeout is not None:
+                kwargs["timeout"] = timeout
+            response = await self.client.get(url, **kwargs)
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            stats.failures += 1
+            # 4xx 说明域名本身可用，只有 5xx 计入域名的错误率
+            if e.response.status_code >= 500:
+                self.health.record_failure(domain, time.monotonic() - started_at)
+            else:
+                self.health.record_success(domain, time.monotonic() - started_at)
+            raise
+        except httpx.RequestError:
+            stats.failures += 1
+            self.health.record_failure(domain, time.monotonic() - started_at)
+            raise
+        except asyncio.CancelledError:
+            self.health.record_slow(domain, time.monotonic() - started_at)
+            raise
+        finally:
+            stats.total_latency += time.monotonic() - started_at
+
+        self.health.record_success(domain, time.monotonic() - started_at)
+        return response
+
+    async def get_hedged(self, domains: Iterable[str], build_url: Callable[[str], str],
+                         timeout: float | None = None) -> httpx.Response | None:
+        """
+        按健康度顺序向多个域名请求同一资源，返回最先成功的响应
+
+        当前请求超过 hedge_delay 仍未完成时，会向下一个域名发起对冲请求；
+        请求失败时立即换下一个域名
+
+        Args:
+            domains: 候选域名
+            build_url: 根据域名生成请求地址
+            timeout: 单个请求的超时时间
+
+        Returns:
+            httpx.Response | None: 成功的响应，所有域名都失败时返回 None
+        """
+        candidates = iter(self.health.ordered(domains))
+        pending: set[asyncio.Task[httpx.Response]] = set()
+
+        def launch() -> bool:
+            domain = next(candidates, None)
+            if domain is None:
+                return False
+            pending.add(asyncio.create_task(self.get(domain, build_url(domain), timeout)))
+            return True
+
+        launch()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, timeout=self.hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if launch():
+                        self.hedged += 1
+                    continue
+
+                for task in done:
+                    pending.discard(task)
+                    if task.exception() is None:
+                        return task.result()
+                    launch()
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict[str, DomainStats]:
+        return self.domain_stats
+
+
+cover_http = CoverHttpClient(
+    max_connections=plugin_config.jmcomic_http_max_connections,
+    http2=plugin_config.jmcomic_http2,
+    hedge_delay=plugin_config.jmcomic_cover_hedge_delay,
+)
@@ -0,0 +1,199 @@
+from io import BytesIO
+from pathlib import Path
+import shutil
+import threading
+from typing import ClassVar
+
+from jmcomic import JmDownloader, JmImageDetail, JmOption, JmPhotoDetail
+from nonebot import logger
+from PIL import Image
+
+
+class StreamingPdfWriter:
+    """
+    逐页写入的PDF生成器
+
+    JPEG 图片不经解码直接以 DCTDecode 流写入文件，每写完一页即刷新到磁盘，
+    内存中只保留各对象的偏移量，峰值内存与页数无关
+    """
+
+    # 与 img2pdf 保持一致，图片未声明 DPI 时按 96 DPI 计算页面尺寸
+    DEFAULT_DPI = 96
+    COPY_BUFFER_SIZE = 1024 * 1024
+    COLOR_SPACES: ClassVar[dict[str, str]] = {"RGB": "/DeviceRGB", "L": "/DeviceGray", "CMYK": "/DeviceCMYK"}
+
+    def __init__(self, pdf_path: Path):
+        self.pdf_path = pdf_path
+        self.part_path = pdf_path.with_name(pdf_path.name + ".part")
+        self._file = None
+        self._lock = threading.Lock()
+        # 对象 1 为 Catalog，对象 2 为 Pages，二者在结束时写入
+        self._offsets: dict[int, int] = {}
+        self._next_obj = 3
+        self._page_objs: list[int] = []
+        # 图片下载完成的顺序不固定，先到的后续页在这里等待
+        self._pending: dict[int, Path] = {}
+        self._next_index = 1
+
+    @property
+    def page_count(self) -> int:
+        return len(self._page_objs)
+
+    def open(self):
+        self.pdf_path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.part_path.open("wb")
+        self._file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def add_page(self, index: int, image_path: Path):
+        """
+        添加第 index 页（从1开始），按页码顺序写入，缺页之后的图片会等待到结束时再写入
+
+        Args:
+            index: 页码
+            image_path: 图片路径
+        """
+        with self._lock:
+            self._pending[index] = image_path
+            while self._next_index in self._pending:
+                self._write_page(self._pending.pop(self._next_index))
+                self._next_index += 1
+
+    def close(self) -> bool:
+        """
+        写入剩余页面和文件尾，并将临时文件重命名为最终的PDF
+
+        Returns:
+            bool: 是否生成了至少包含一页的PDF
+        """
+        with self._lock:
+            for index in sorted(self._pending):
+                self._write_page(self._pending[index])
+            self._pending.clear()
+
+            if not self._page_objs:
+                self._discard()
+                return False
+
+            kids = " ".join(f"{obj} 0 R" for obj in self._page_objs)
+            self._write_obj(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_objs)} >>".encode())
+            self._write_obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+            xref_offset = self._file.tell()
+            size = self._next_obj
+            xref = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+            xref += [f"{self._offsets[obj]:010d} 00000 n \n" for obj in range(1, size)]
+            self._file.write("".join(xref).encode())
+            self._file.write(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+
+            self._file.close()
+            self._file = None
+            self.part_path.replace(self.pdf_path)
+            return True
+
+    def abort(self):
+        """ 放弃生成并删除临时文件 """
+        with self._lock:
+            self._discard()
+
+    def _discard(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.part_path.unlink(missing_ok=True)
+
+    def _alloc_obj(self) -> int:
+        obj = self._next_obj
+        self._next_obj += 1
+        return obj
+
+    def _write_obj(self, obj: int, body: bytes):
+        self._offsets[obj] = self._file.tell()
+        self._file.write(f"{obj} 0 obj\n".encode() + body + b"\nendobj\n")
+
+    def _write_stream_obj(self, obj: int, header: str, length: int, write_data):
+        self._offsets[obj] = self._file.tell()
+        self._file.write(f"{obj} 0 obj\n<< {header} /Length {length} >>\nstream\n".encode())
+        write_data()
+        self._file.write(b"\nendstream\nendobj\n")
+
+    def _write_page(self, image_path: Path):
+        try:
+            with Image.open(image_path) as image:
+                width, height = image.size
+                dpi = image.info.get("dpi", (self.DEFAULT_DPI, self.DEFAULT_DPI))
+                embed_raw = image.format == "JPEG" and image.mode in self.COLOR_SPACES
+                mode = image.mode if embed_raw else "RGB"
+                # 带有 Adobe APP14 标记的 CMYK JPEG 为反相存储
+                inverted = embed_raw and mode == "CMYK" and "adobe" in image.info
+                data = None
+                if not embed_raw:
+                    # 非 JPEG 图片需要重新编码，此时内存中只有这一页
+                    data = BytesIO()
+                    image.convert("RGB").save(data, format="JPEG", quality=95)
+        except OSError as e:
+            logger.warning(f"跳过无法读取的图片 {image_path}：{e}")
+            return
+
+        image_obj, content_obj, page_obj = self._alloc_obj(), self._alloc_obj(), self._alloc_obj()
+
+        header = (f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                  f"/ColorSpace {self.COLOR_SPACES[mode]} /BitsPerComponent 8 /Filter /DCTDecode")
+        if inverted:
+            header += " /Decode [1 0 1 0 1 0 1 0]"
+
+        if data is None:
+            def write_data():
+                with image_path.open("rb") as src:
+                    shutil.copyfileobj(src, self._file, self.COPY_BUFFER_SIZE)
+            self._write_stream_obj(image_obj, header, image_path.stat().st_size, write_data)
+        else:
+            self._write_stream_obj(image_obj, header, data.getbuffer().nbytes,
+                                   lambda: self._file.write(data.getbuffer()))
+
+        page_width = width * 72 / (dpi[0] or self.DEFAULT_DPI)
+        page_height = height * 72 / (dpi[1] or self.DEFAULT_DPI)
+        content = f"q {page_width:.4f} 0 0 {page_height:.4f} 0 0 cm /Im0 Do Q".encode()
+        self._write_stream_obj(content_obj, "", len(content), lambda: self._file.write(content))
+
+        self._write_obj(page_obj, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.4f} {page_height:.4f}] "
+            f"/Resources << /XObject << /Im0 {image_obj} 0 R >> >> /Contents {content_obj} 0 R >>"
+        ).encode())
+        self._page_objs.append(page_obj)
+        self._file.flush()
+
+
+class StreamingPdfDownloader(JmDownloader):
+    """ 边下载边生成PDF的下载器，每张图片下载完成后立即写入PDF，代替下载结束后由 img2pdf 一次性合并 """
+
+    def __init__(self, option: JmOption, pdf_dir: Path):
+        super().__init__(option)
+        self.pdf_dir = pdf_dir
+        self._writers: dict[str, StreamingPdfWriter] = {}
+
+    def before_photo(self, photo: JmPhotoDetail):
+        super().before_photo(photo)
+        writer = StreamingPdfWriter(self.pdf_dir / f"{photo.id}.pdf")
+        writer.open()
+        self._writers[str(photo.id)] = writer
+
+    def after_image(self, image: JmImageDetail, img_save_path):
+        super().after_image(image, img_save_path)
+        writer = self._writers.get(str(image.from_photo.id))
+        if writer is not None:
+            writer.add_page(image.index, Path(img_save_path))
+
+    def after_photo(self, photo: JmPhotoDetail):
+        super().after_photo(photo)
+        writer = self._writers.pop(str(photo.id), None)
+        if writer is not None and not writer.close():
+            logger.error(f"jm{photo.id} 没有可写入PDF的图片")
+
+    def download_by_photo_detail(self, photo: JmPhotoDetail):
+        try:
+            return super().download_by_photo_detail(photo)
+        finally:
+            # 下载中途出错时 after_photo 不会被调用，需要丢弃未完成的PDF
+            writer = self._writers.pop(str(photo.id), None)
+            if writer is not None:
+                writer.abort()
@@ -0,0 +1,104 @@
+from collections import OrderedDict
+from datetime import datetime
+import time
+
+from .config import plugin_config
+
+
+def current_period(now: datetime | None = None) -> int:
+    """
+    获取当前的下载次数周期编号
+
+    每周一 0 点进入新的周期，用户的剩余次数记录了所属周期，
+    周期不一致时视为已重置，不需要定时遍历所有用户
+    """
+    now = now or datetime.now()
+    # 公历第 1 天（0001-01-01）是周一
+    return (now.date().toordinal() - 1) // 7
+
+
+class TokenBucketLimiter:
+    """
+    按键（用户或群）限制请求频率的令牌桶
+
+    每个键最多积攒 capacity 个令牌，每 window 秒恢复 capacity 个，
+    令牌已恢复满的桶与从未请求过的键等价，会被直接丢弃
+    """
+
+    def __init__(self, capacity: int, window: float):
+        self.capacity = capacity
+        self.window = window
+        self.rate = capacity / window if capacity > 0 and window > 0 else 0.0
+        # 键 -> (剩余令牌, 更新时间)，按更新时间排序
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self.allowed = 0
+        self.limited = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _prune(self, now: float):
+        """ 丢弃已恢复满的桶，桶按更新时间排序，遇到未满的即可停止 """
+        while self._buckets:
+            key, (_, updated_at) = next(iter(self._buckets.items()))
+            if now - updated_at < self.window:
+                break
+            del self._buckets[key]
+
+    def _tokens(self, key: str, now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return float(self.capacity)
+        tokens, updated_at = bucket
+        return min(float(self.capacity), tokens + (now - updated_at) * self.rate)
+
+    def retry_after(self, key: str) -> float:
+        """ 获取距离下一个可用令牌的秒数，0 表示当前可以请求 """
+        if not self.enabled:
+            return 0.0
+        tokens = self._tokens(key, time.monotonic())
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def consume(self, key: str):
+        """ 消耗一个令牌，调用前应先通过 retry_after 确认可以请求 """
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        self._prune(now)
+        tokens = self._tokens(key, now)
+        self._buckets.pop(key, None)
+        self._buckets[key] = (max(0.0, tokens - 1), now)
+        self.allowed += 1
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "tracked": len(self._buckets),
+            "allowed": self.allowed,
+            "limited": self.limited,
+        }
+
+
+def acquire_rate_limits(*checks: tuple[TokenBucketLimiter, str]) -> float:
+    """
+    同时检查多个频率限制，全部通过时才各消耗一个令牌
+
+    Args:
+        checks: (限制器, 键) 的列表，如用户和所在的群
+
+    Returns:
+        float: 需要等待的秒数，0 表示已通过
+    """
+    for limiter, key in checks:
+        wait = limiter.retry_after(key)
+        if wait > 0:
+            limiter.limited += 1
+            return wait
+
+    for limiter, key in checks:
+        limiter.consume(key)
+    return 0.0
+
+
+user_rate_limiter = TokenBucketLimiter(plugin_config.jmcomic_user_rate_limit, plugin_config.jmcomic_rate_limit_window)
+group_rate_limiter = TokenBucketLimiter(plugin_config.jmcomic_group_rate_limit, plugin_config.jmcomic_rate_limit_window)
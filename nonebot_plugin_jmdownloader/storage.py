@@ -0,0 +1,502 @@
+from abc import ABC, abstractmethod
+import asyncio
+from collections.abc import Iterator
+from contextlib import contextmanager
+import json
+import os
+from pathlib import Path
+import sqlite3
+import threading
+import time
+from typing import Any
+
+from nonebot import logger
+
+from .executor import run_io
+
+
+class StorageBackend(ABC):
+    """
+    插件数据的存储后端
+
+    数据分为四类：群设置（文件夹ID、是否启用）、用户剩余下载次数及其所属周期、群黑名单，
+    以及按名称区分的字符串列表（禁止下载的本子ID、标签等）
+    """
+
+    # ------------------- 群设置 -------------------
+    @abstractmethod
+    def get_group_setting(self, group_id: str, key: str) -> Any:
+        """ 获取群设置，未设置时返回 None """
+
+    @abstractmethod
+    def set_group_setting(self, group_id: str, key: str, value: Any):
+        """ 设置群设置 """
+
+    # ------------------- 用户下载次数 -------------------
+    @abstractmethod
+    def get_user_quota(self, user_id: str) -> tuple[int, int | None] | None:
+        """ 获取用户剩余的下载次数和所属周期，未记录时返回 None，旧数据没有周期时周期为 None """
+
+    @abstractmethod
+    def set_user_quota(self, user_id: str, remaining: int, period: int):
+        """ 设置用户剩余的下载次数和所属周期 """
+
+    @abstractmethod
+    def fill_quota_periods(self, period: int) -> int:
+        """ 为没有周期的旧记录补上周期，返回补上的数量 """
+
+    # ------------------- 群黑名单 -------------------
+    @abstractmethod
+    def add_blacklist(self, group_id: str, user_id: str) -> bool:
+        """ 添加黑名单，返回是否新增 """
+
+    @abstractmethod
+    def remove_blacklist(self, group_id: str, user_id: str) -> bool:
+        """ 移除黑名单，返回是否移除 """
+
+    @abstractmethod
+    def list_blacklist(self, group_id: str) -> list[str]:
+        """ 列出群黑名单 """
+
+    # ------------------- 字符串列表 -------------------
+    @abstractmethod
+    def ensure_list(self, name: str, defaults: list[str]):
+        """ 列表从未创建过时以 defaults 初始化，已创建的列表（即使为空）保持不变 """
+
+    @abstractmethod
+    def list_items(self, name: str) -> list[str]:
+        """ 按加入顺序列出列表中的值 """
+
+    @abstractmethod
+    def add_item(self, name: str, value: str) -> bool:
+        """ 向列表加入值，返回是否新增 """
+
+    @abstractmethod
+    def add_items(self, name: str, values: list[str]) -> int:
+        """ 向列表批量加入值，只持久化一次，返回新增的数量 """
+
+    @abstractmethod
+    def remove_item(self, name: str, value: str) -> bool:
+        """ 从列表移除值，返回是否移除 """
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """ 批量修改，期间的所有修改合并为一次持久化 """
+        yield
+
+    def close(self):
+        """ 关闭后端，释放资源 """
+
+
+class JsonStorage(StorageBackend):
+    """
+    将所有数据保存在一个JSON文件中
+
+    修改后只标记为待保存，在 save_interval 秒后合并写回；写入先落到临时文件并 fsync，
+    再重命名覆盖原文件，写入中途崩溃不会损坏已有数据。写入失败时按指数退避重试
+    """
+
+    # 顶层中不属于群数据的键
+    RESERVED_KEYS = ("user_limits", "forbidden_albums", "restricted_ids", "restricted_tags")
+    # 写入失败后的重试间隔(秒)，每次失败翻倍，最长为 MAX_RETRY_DELAY
+    MIN_RETRY_DELAY = 1.0
+    MAX_RETRY_DELAY = 300.0
+
+    def __init__(self, filepath: Path, save_interval: float = 2.0):
+        self.filepath = filepath
+        self.save_interval = save_interval
+        self.data: dict = {}
+        self._dirty = False
+        self._batch_depth = 0
+        self._flush_task: asyncio.Task | None = None
+        self._write_lock = threading.Lock()
+        self._load_data()
+
+        self.writes = 0
+        self.failed_writes = 0
+        self._consecutive_failures = 0
+
+    def _load_data(self):
+        """ 加载数据文件 """
+        if self.filepath.exists():
+            try:
+                with self.filepath.open("r", encoding="utf-8") as f:
+                    self.data = json.load(f)
+                    logger.info(f"成功加载数据文件：{self.filepath}")
+            except json.JSONDecodeError as e:
+                # 保留损坏的文件以便手动恢复，避免被之后的保存覆盖
+                corrupt_path = self.filepath.with_name(f"{self.filepath.name}.corrupt-{int(time.time())}")
+                self.filepath.replace(corrupt_path)
+                logger.error(f"数据文件读取错误：{e}，已将原文件移动到 {corrupt_path}")
+                self.data = {}
+        else:
+            logger.info(f"未找到数据文件，将创建新的文件：{self.filepath}")
+            self.data = {}
+
+    def save(self):
+        """ 标记数据待保存，有事件循环时延迟合并写入，否则立即写入 """
+        self._dirty = True
+        if self._batch_depth:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+
+        if self._flush_task is None:
+            self._flush_task = loop.create_task(self._flush_later())
+
+    def _retry_delay(self) -> float:
+        base = max(self.save_interval, self.MIN_RETRY_DELAY)
+        return min(self.MAX_RETRY_DELAY, base * 2 ** (self._consecutive_failures - 1))
+
+    async def _flush_later(self):
+        try:
+            delay = self.save_interval
+            while True:
+                await asyncio.sleep(delay)
+                if not self._dirty:
+                    return
+                # 在事件循环中序列化得到一致的快照，写盘放到线程中
+                content = self._dump()
+                if await run_io(self._write_atomic, content):
+                    delay = self.save_interval
+                else:
+                    delay = self._retry_delay()
+                    logger.warning(f"将在 {delay:.0f}s 后重试保存数据文件")
+        finally:
+            self._flush_task = None
+
+    def _dump(self) -> str:
+        self._dirty = False
+        return json.dumps(self.data, indent=4, ensure_ascii=False)
+
+    def _write_atomic(self, content: str) -> bool:
+        """ 原子写入数据文件，返回是否成功，失败时数据重新标记为待保存 """
+        tmp_path = self.filepath.with_name(self.filepath.name + ".tmp")
+        try:
+            with self._write_lock:
+                with tmp_path.open("w", encoding="utf-8") as f:
+                    f.write(content)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.filepath)
+                self.writes += 1
+                self._consecutive_failures = 0
+                return True
+        except Exception as e:
+            self._dirty = True
+            self.failed_writes += 1
+            self._consecutive_failures += 1
+            logger.error(f"保存数据文件出错：{e}")
+            return False
+
+    def flush(self):
+        """ 立即写入待保存的数据 """
+        if self._dirty:
+            self._write_atomic(self._dump())
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self._dirty:
+                self.save()
+
+    def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self.flush()
+
+    def get_group_setting(self, group_id: str, key: str) -> Any:
+        return self.data.get(group_id, {}).get(key)
+
+    def set_group_setting(self, group_id: str, key: str, value: Any):
+        self.data.setdefault(group_id, {})[key] = value
+        self.save()
+
+    def get_user_quota(self, user_id: str) -> tuple[int, int | None] | None:
+        # 记录为 [剩余次数, 周期]，旧版本只记录了剩余次数
+        quota = self.data.get("user_limits", {}).get(user_id)
+        if quota is None:
+            return None
+        if isinstance(quota, int):
+            return quota, None
+        return quota[0], quota[1]
+
+    def set_user_quota(self, user_id: str, remaining: int, period: int):
+        self.data.setdefault("user_limits", {})[user_id] = [remaining, period]
+        self.save()
+
+    def fill_quota_periods(self, period: int) -> int:
+        user_limits = self.data.get("user_limits", {})
+        legacy = [user_id for user_id, quota in user_limits.items() if isinstance(quota, int)]
+        for user_id in legacy:
+            user_limits[user_id] = [user_limits[user_id], period]
+        if legacy:
+            self.save()
+        return len(legacy)
+
+    def add_blacklist(self, group_id: str, user_id: str) -> bool:
+        blacklist = self.data.setdefault(group_id, {}).setdefault("blacklist", [])
+        if user_id in blacklist:
+            return False
+        blacklist.append(user_id)
+        self.save()
+        return True
+
+    def remove_blacklist(self, group_id: str, user_id: str) -> bool:
+        blacklist = self.data.get(group_id, {}).get("blacklist", [])
+        if user_id not in blacklist:
+            return False
+        blacklist.remove(user_id)
+        self.save()
+        return True
+
+    def list_blacklist(self, group_id: str) -> list[str]:
+        return list(self.data.get(group_id, {}).get("blacklist", []))
+
+    def ensure_list(self, name: str, defaults: list[str]):
+        if name not in self.data:
+            self.data[name] = list(defaults)
+            self.save()
+
+    def list_items(self, name: str) -> list[str]:
+        return list(self.data.get(name, []))
+
+    def add_item(self, name: str, value: str) -> bool:
+        items = self.data.setdefault(name, [])
+        if value in items:
+            return False
+        items.append(value)
+        self.save()
+        return True
+
+    def add_items(self, name: str, values: list[str]) -> int:
+        items = self.data.setdefault(name, [])
+        existing = set(items)
+        new_values = [value for value in dict.fromkeys(values) if value not in existing]
+        if new_values:
+            items.extend(new_values)
+            self.save()
+        return len(new_values)
+
+    def remove_item(self, name: str, value: str) -> bool:
+        items = self.data.get(name, [])
+        if value not in items:
+            return False
+        items.remove(value)
+        self.save()
+        return True
+
+
+class SqliteStorage(StorageBackend):
+    """
+    基于 SQLite 的存储后端
+
+    使用 WAL 模式，每次修改只更新对应的行，查询走主键索引。
+    数据库为空时自动从旧的JSON数据文件迁移
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS group_settings (
+        group_id TEXT NOT NULL, key TEXT NOT NULL, value TEXT,
+        PRIMARY KEY (group_id, key)
+    );
+    CREATE TABLE IF NOT EXISTS user_limits (
+        user_id TEXT PRIMARY KEY, remaining INTEGER NOT NULL, period INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS blacklist (
+        group_id TEXT NOT NULL, user_id TEXT NOT NULL,
+        PRIMARY KEY (group_id, user_id)
+    );
+    CREATE TABLE IF NOT EXISTS list_items (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL, value TEXT NOT NULL,
+        UNIQUE (name, value)
+    );
+    CREATE TABLE IF NOT EXISTS lists (
+        name TEXT PRIMARY KEY
+    );
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY, value TEXT
+    );
+    """
+
+    def __init__(self, db_path: Path, migrate_from: Path | None = None):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL 模式下 NORMAL 已能保证数据库一致，只在断电时可能丢失最近的事务
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.SCHEMA)
+        self._upgrade_schema()
+
+        if migrate_from is not None and self._get_meta("migrated_from") is None:
+            self._migrate_json(migrate_from)
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._db.execute(sql, params)
+
+    def _upgrade_schema(self):
+        """ 为旧版本创建的数据库补上新增的列 """
+        columns = {row[1] for row in self._execute("PRAGMA table_info(user_limits)")}
+        if "period" not in columns:
+            self._execute("ALTER TABLE user_limits ADD COLUMN period INTEGER")
+
+    def _get_meta(self, key: str) -> str | None:
+        row = self._execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _migrate_json(self, json_path: Path):
+        """ 将旧的JSON数据文件导入数据库，原文件保留不动 """
+        if not json_path.exists():
+            self._execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from', '')")
+            return
+
+        try:
+            with json_path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"读取待迁移的数据文件失败，跳过迁移：{e}")
+            return
+
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                for key, value in data.items():
+                    if key == "user_limits":
+                        self._db.executemany(
+                            "INSERT OR REPLACE INTO user_limits (user_id, remaining, period) VALUES (?, ?, ?)",
+                            (
+                                (str(user_id), int(quota), None) if isinstance(quota, int)
+                                else (str(user_id), int(quota[0]), quota[1])
+                                for user_id, quota in value.items()
+                            ),
+                        )
+                    elif key in JsonStorage.RESERVED_KEYS:
+                        self._db.execute("INSERT OR IGNORE INTO lists (name) VALUES (?)", (key,))
+                        self._db.executemany(
+                            "INSERT OR IGNORE INTO list_items (name, value) VALUES (?, ?)",
+                            ((key, str(item)) for item in value),
+                        )
+                    elif isinstance(value, dict):
+                        for setting, setting_value in value.items():
+                            if setting == "blacklist":
+                                self._db.executemany(
+                                    "INSERT OR IGNORE INTO blacklist (group_id, user_id) VALUES (?, ?)",
+                                    ((key, str(user_id)) for user_id in setting_value),
+                                )
+                            else:
+                                self._db.execute(
+                                    "INSERT OR REPLACE INTO group_settings (group_id, key, value) VALUES (?, ?, ?)",
+                                    (key, setting, json.dumps(setting_value)),
+                                )
+                self._db.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from', ?)", (str(json_path),)
+                )
+                self._db.execute("COMMIT")
+            except (sqlite3.Error, AttributeError, TypeError, ValueError) as e:
+                self._db.execute("ROLLBACK")
+                logger.error(f"迁移数据文件失败：{e}")
+                return
+
+        logger.info(f"已将数据文件 {json_path} 迁移到 {self.db_path}")
+
+    def get_group_setting(self, group_id: str, key: str) -> Any:
+        row = self._execute(
+            "SELECT value FROM group_settings WHERE group_id = ? AND key = ?", (group_id, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_group_setting(self, group_id: str, key: str, value: Any):
+        self._execute(
+            "INSERT OR REPLACE INTO group_settings (group_id, key, value) VALUES (?, ?, ?)",
+            (group_id, key, json.dumps(value)),
+        )
+
+    def get_user_quota(self, user_id: str) -> tuple[int, int | None] | None:
+        row = self._execute("SELECT remaining, period FROM user_limits WHERE user_id = ?", (user_id,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set_user_quota(self, user_id: str, remaining: int, period: int):
+        self._execute(
+            "INSERT OR REPLACE INTO user_limits (user_id, remaining, period) VALUES (?, ?, ?)",
+            (user_id, remaining, period),
+        )
+
+    def fill_quota_periods(self, period: int) -> int:
+        return self._execute("UPDATE user_limits SET period = ? WHERE period IS NULL", (period,)).rowcount
+
+    def add_blacklist(self, group_id: str, user_id: str) -> bool:
+        cursor = self._execute("INSERT OR IGNORE INTO blacklist (group_id, user_id) VALUES (?, ?)",
+                               (group_id, user_id))
+        return cursor.rowcount > 0
+
+    def remove_blacklist(self, group_id: str, user_id: str) -> bool:
+        cursor = self._execute("DELETE FROM blacklist WHERE group_id = ? AND user_id = ?", (group_id, user_id))
+        return cursor.rowcount > 0
+
+    def list_blacklist(self, group_id: str) -> list[str]:
+        rows = self._execute("SELECT user_id FROM blacklist WHERE group_id = ? ORDER BY rowid", (group_id,))
+        return [row[0] for row in rows.fetchall()]
+
+    def ensure_list(self, name: str, defaults: list[str]):
+        with self._lock:
+            if self._db.execute("SELECT 1 FROM lists WHERE name = ?", (name,)).fetchone() is not None:
+                return
+            self._db.execute("BEGIN")
+            self._db.execute("INSERT INTO lists (name) VALUES (?)", (name,))
+            self._db.executemany("INSERT OR IGNORE INTO list_items (name, value) VALUES (?, ?)",
+                                 ((name, value) for value in defaults))
+            self._db.execute("COMMIT")
+
+    def list_items(self, name: str) -> list[str]:
+        rows = self._execute("SELECT value FROM list_items WHERE name = ? ORDER BY seq", (name,))
+        return [row[0] for row in rows.fetchall()]
+
+    def add_item(self, name: str, value: str) -> bool:
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO lists (name) VALUES (?)", (name,))
+            cursor = self._db.execute("INSERT OR IGNORE INTO list_items (name, value) VALUES (?, ?)", (name, value))
+        return cursor.rowcount > 0
+
+    def add_items(self, name: str, values: list[str]) -> int:
+        with self.batch():
+            self._db.execute("INSERT OR IGNORE INTO lists (name) VALUES (?)", (name,))
+            before = self._db.total_changes
+            self._db.executemany("INSERT OR IGNORE INTO list_items (name, value) VALUES (?, ?)",
+                                 ((name, value) for value in values))
+            return self._db.total_changes - before
+
+    def remove_item(self, name: str, value: str) -> bool:
+        cursor = self._execute("DELETE FROM list_items WHERE name = ? AND value = ?", (name, value))
+        return cursor.rowcount > 0
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """ 批量修改在同一个事务中提交 """
+        with self._lock:
+            if self._db.in_transaction:
+                yield
+                return
+            self._db.execute("BEGIN")
+            try:
+                yield
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -1,6 +1,14 @@
 import asyncio
+from collections.abc import AsyncIterator
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+from pathlib import Path
 import random
+import re
+import shutil
 import struct
+import threading
 from io import BytesIO
 
 import httpx
@@ -15,9 +23,19 @@ from nonebot.adapters.onebot.v11.exception import ActionFailed
 from nonebot.rule import Rule
 from PIL import Image, ImageFilter
 
-from .data_source import data_manager
+from .cache import cover_cache, photo_info_cache, search_result_cache
+from .config import plugin_config
+from .data_source import (SEARCH_PAGE_SIZE, SearchItem, SearchState,
+                          data_manager, search_manager)
+from .executor import run_io
+from .network import cover_http
 
 #region API与下载相关函数
+# 每个上游各自限制并发，多个搜索同时进行时也不会占满默认线程池或压垮上游
+api_semaphore = asyncio.Semaphore(max(1, plugin_config.jmcomic_api_concurrency))
+cover_semaphore = asyncio.Semaphore(max(1, plugin_config.jmcomic_cover_concurrency))
+
+
 def get_photo_info(client: JmcomicClient, photo_id):
     """获取章节信息和 Bot 要发送的消息"""
     try:
@@ -39,8 +57,56 @@ def get_photo_info(client: JmcomicClient, photo_id):
 
     return None
 
+# 正在后台获取的本子信息，避免同一本子被重复请求
+_photo_fetching: dict[str, asyncio.Task] = {}
+
+
+async def _fetch_photo_info(client: JmcomicClient, photo_id: str):
+    """请求本子信息并写入缓存，本子不存在时记录负缓存"""
+    try:
+        async with api_semaphore:
+            photo = await asyncio.to_thread(get_photo_info, client, photo_id)
+    except MissingAlbumPhotoException:
+        await run_io(photo_info_cache.put, photo_id, None)
+        raise
+
+    if photo is not None:
+        await run_io(photo_info_cache.put, photo_id, photo)
+    return photo
+
+
+def _start_photo_fetch(client: JmcomicClient, photo_id: str) -> asyncio.Task:
+    task = _photo_fetching.get(photo_id)
+    if task is None:
+        task = asyncio.create_task(_fetch_photo_info(client, photo_id))
+        _photo_fetching[photo_id] = task
+
+        def on_done(t: asyncio.Task):
+            _photo_fetching.pop(photo_id, None)
+            # 后台刷新的异常无人等待，在这里取出避免告警
+            if not t.cancelled():
+                t.exception()
+
+        task.add_done_callback(on_done)
+    return task
+
+
 async def get_photo_info_async(client: JmcomicClient, photo_id):
-    return await asyncio.to_thread(get_photo_info, client, photo_id)
+    """获取章节信息，优先使用缓存；缓存过期但仍可用时先返回旧信息，并在后台刷新"""
+    key = str(photo_id)
+    entry = photo_info_cache.get_memory(key)
+    if entry is None:
+        entry = await run_io(photo_info_cache.load_db, key)
+
+    if entry is None:
+        return await asyncio.shield(_start_photo_fetch(client, key))
+
+    if not photo_info_cache.is_fresh(entry):
+        _start_photo_fetch(client, key)
+
+    if entry.missing:
+        raise MissingAlbumPhotoException(f"本子 {key} 不存在", {})
+    return entry.photo
 
 
 def download_photo(downloader: JmDownloader, photo: JmPhotoDetail):
@@ -75,49 +141,525 @@ def search_album(client: JmcomicClient, search_query: str, page: int = 1):
     return None
 
 async def search_album_async(client: JmcomicClient, search_query: str, page: int = 1):
-    return await asyncio.to_thread(search_album, client, search_query, page)
+    async with api_semaphore:
+        return await asyncio.to_thread(search_album, client, search_query, page)
+
+
+def parse_search_items(page: JmSearchPage) -> list[SearchItem]:
+    """
+    从搜索结果页中取出本子的标题、作者和标签
+
+    移动端API（插件使用的 client.impl: api）的搜索结果只有ID、标题和作者，没有标签，
+    这些结果的标签为 None，发送前仍需请求详情检查禁止的标签；网页端的搜索结果和
+    直接搜索jm号得到的单个本子带有标签，可以直接使用
+    """
+    single_album = page.single_album if page.is_single_album else None
+
+    items = []
+    for album_id, info in page.content:
+        author = info.get("author")
+        if isinstance(author, list):
+            author = " ".join(author)
+        if not author and single_album is not None:
+            author = single_album.author
+
+        # jmcomic 为没有标签的搜索结果补上空列表，无法区分“没有标签”和“未返回标签”，只能再请求详情确认
+        tags = info.get("tags") or None
+
+        items.append(SearchItem(id=str(album_id), title=info.get("name", ""), author=author or None, tags=tags))
+    return items
+
+
+async def complete_search_item(client: JmcomicClient, item: SearchItem) -> SearchItem | None:
+    """
+    为缺少作者或标签的搜索结果请求详情，无法补全时返回 None
+
+    API搜索结果总是缺少标签，因此每个结果都会查询一次详情，详情经过本子信息缓存，重复出现的本子不再请求
+    """
+    if item.is_complete:
+        return item
+    try:
+        photo = await get_photo_info_async(client, item.id)
+    except MissingAlbumPhotoException:
+        return None
+    if photo is None:
+        return None
+    return SearchItem(id=item.id, title=item.title or photo.title, author=item.author or photo.author,
+                      tags=item.tags or photo.tags)
 
 
 async def download_avatar(photo_id: int | str) -> BytesIO | None:
-    """下载本子封面"""
-    for domain in JmModuleConfig.DOMAIN_IMAGE_LIST:
-        url = f"https://{domain}/media/albums/{photo_id}.jpg"
+    """下载本子封面，优先使用最健康的图片域名"""
+    response = await cover_http.get_hedged(
+        JmModuleConfig.DOMAIN_IMAGE_LIST,
+        lambda domain: f"https://{domain}/media/albums/{photo_id}.jpg",
+        timeout=40,
+    )
+
+    if response is None:
+        logger.warning(f"{photo_id} 封面下载失败：所有域名不可用")
+        return None
+
+    if not response.content or len(response.content) < 1024:
+        logger.warning(f"{photo_id} 可能返回了错误页面，无法下载封面")
+        return None
+
+    return BytesIO(response.content)
+
+
+# 封面在聊天中的展示尺寸，模糊前先缩小到该尺寸以内
+COVER_MAX_SIZE = (600, 800)
+# 原图尺寸下的模糊半径，缩小后按比例调整，保持相同的观感
+COVER_BLUR_RADIUS = 7
+COVER_QUALITY = 80
+
+
+def blur_image_bytes(data: bytes) -> bytes:
+    """对图片进行模糊处理，先缩小到展示尺寸再模糊，减少计算量"""
+    image = Image.open(BytesIO(data))
+    original_width = image.width
+
+    # JPEG 可在解码时直接按 1/2、1/4、1/8 缩小，避免解码完整分辨率
+    image.draft("RGB", COVER_MAX_SIZE)
+    image = image.convert("RGB")
+    image.thumbnail(COVER_MAX_SIZE)
+
+    radius = max(2.0, COVER_BLUR_RADIUS * image.width / original_width)
+    blurred_image = image.filter(ImageFilter.GaussianBlur(radius=radius))
+
+    output = BytesIO()
+    blurred_image.save(output, format="JPEG", quality=COVER_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+class CoverBlurPool:
+    """
+    封面模糊处理的执行器
 
+    配置了进程数时使用进程池，绕开 GIL；否则在线程中处理。
+    进程池使用 fork 方式创建，子进程无需重新导入插件。在多线程进程中 fork 可能死锁，
+    因此在插件加载时、其他线程启动之前就创建全部子进程，已有其他线程或平台不支持 fork 时退回线程
+    """
+
+    def __init__(self, process_workers: int = 0):
+        self.process_workers = process_workers
+        self._executor: ProcessPoolExecutor | None = None
+
+    def start(self):
+        """ 创建进程池及其全部子进程，需要在其他线程启动之前调用 """
+        if self.process_workers <= 0 or self._executor is not None:
+            return
+        if "fork" not in multiprocessing.get_all_start_methods():
+            logger.warning("当前平台不支持 fork，封面将在线程中处理")
+            return
+        if threading.active_count() > 1:
+            logger.warning("创建封面处理进程池时已有其他线程在运行，为避免 fork 死锁，封面将在线程中处理")
+            return
+
+        executor = ProcessPoolExecutor(self.process_workers, mp_context=multiprocessing.get_context("fork"))
+        # fork 方式下首次提交任务时一次性创建全部子进程，之后才启动进程池的管理线程
+        executor.submit(int).result()
+        self._executor = executor
+
+    async def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _blur(self, data: bytes) -> bytes:
+        if self._executor is None:
+            return await asyncio.to_thread(blur_image_bytes, data)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, blur_image_bytes, data)
+
+    async def blur(self, data: bytes) -> bytes | None:
+        """ 模糊处理单张图片，处理失败时返回 None """
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, timeout=40)
-                response.raise_for_status()
+            return await self._blur(data)
+        except Exception as e:
+            logger.warning(f"封面处理失败：{e}")
+            return None
+
+
+cover_blur_pool = CoverBlurPool(plugin_config.jmcomic_image_process_workers)
+# 插件加载时事件循环尚未运行，文件线程池等也还没有创建线程
+cover_blur_pool.start()
+
+
+# 正在下载处理的封面，预取与正式请求同时需要同一封面时只下载一次
+_cover_fetching: dict[str, asyncio.Task] = {}
+
+
+async def _fetch_blurred_cover(photo_id: str) -> bytes | None:
+    """下载并模糊处理封面，成功后写入缓存"""
+    async with cover_semaphore:
+        avatar = await download_avatar(photo_id)
+    if avatar is None:
+        return None
+    data = await cover_blur_pool.blur(avatar.getvalue())
+    if data is not None:
+        await run_io(cover_cache.put, photo_id, data)
+    return data
+
 
-                if not response.content or len(response.content) < 1024:
-                    logger.warning(f"{photo_id} 可能返回了错误页面，无法下载封面")
-                    return None
+async def get_blurred_cover(photo_id: int | str) -> BytesIO | None:
+    """获取模糊处理后的本子封面，依次查找内存缓存、磁盘缓存，都未命中时下载并处理"""
+    key = str(photo_id)
+    data = cover_cache.get_memory(key)
+    if data is None:
+        data = await run_io(cover_cache.load_disk, key)
 
-                return BytesIO(response.content)
+    if data is None:
+        task = _cover_fetching.get(key)
+        if task is None:
+            task = asyncio.create_task(_fetch_blurred_cover(key))
+            _cover_fetching[key] = task
 
-        except (httpx.HTTPStatusError, httpx.RequestError):
+            def on_done(t: asyncio.Task):
+                _cover_fetching.pop(key, None)
+                if not t.cancelled():
+                    t.exception()
+
+            task.add_done_callback(on_done)
+        # 等待者超时被取消时，下载仍继续完成并写入缓存
+        data = await asyncio.shield(task)
+
+    return BytesIO(data) if data is not None else None
+
+
+class SearchEnricher:
+    """
+    为一页搜索结果补全本子信息和封面
+
+    每个结果的信息和封面同时获取，单项超过 item_timeout 即放弃；
+    整页超过 page_timeout 时只返回已完成的部分，未完成的请求在后台继续执行以填充缓存
+    """
+
+    # 同时预热的页数上限，避免大量翻页预取挤占正式请求的并发
+    MAX_WARMING_PAGES = 2
+
+    def __init__(self, item_timeout: float, page_timeout: float):
+        self.item_timeout = item_timeout
+        self.page_timeout = page_timeout
+        # 保存后台任务的引用，避免被垃圾回收
+        self._background: set[asyncio.Task] = set()
+        self._warming = asyncio.Semaphore(self.MAX_WARMING_PAGES)
+
+        self.pages = 0
+        self.partial_pages = 0
+        self.item_timeouts = 0
+        self.first_result_count = 0
+        self.first_result_total = 0.0
+        self.first_result_max = 0.0
+        self.warmed_pages = 0
+
+    def deadline(self) -> float:
+        """ 从现在开始计算的整页截止时间 """
+        return asyncio.get_running_loop().time() + self.page_timeout
+
+    async def _with_timeout(self, coro, photo_id: str):
+        try:
+            return await asyncio.wait_for(coro, self.item_timeout)
+        except asyncio.TimeoutError:
+            self.item_timeouts += 1
+            logger.warning(f"jm{photo_id} 的信息或封面获取超时")
+        except Exception as e:
+            logger.warning(f"jm{photo_id} 的信息或封面获取失败：{e}")
+        return None
+
+    def _detach(self, tasks):
+        """ 不再等待的任务转入后台继续执行 """
+        for task in tasks:
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    def start_info(self, client: JmcomicClient, items: list[SearchItem]) -> list[asyncio.Task]:
+        """ 开始补全每个结果的本子信息 """
+        self.pages += 1
+        return [asyncio.create_task(self._with_timeout(complete_search_item(client, item), item.id))
+                for item in items]
+
+    def start_covers(self, items: list[SearchItem]) -> list[asyncio.Task | None]:
+        """ 开始获取每个结果的封面，已知会被屏蔽的本子不需要封面 """
+        tasks = []
+        for item in items:
+            if item.is_complete and data_manager.has_restricted_tag(item.tags, item.title):
+                tasks.append(None)
+            else:
+                tasks.append(asyncio.create_task(self._with_timeout(get_blurred_cover(item.id), item.id)))
+        return tasks
+
+    async def wait(self, tasks: list[asyncio.Task | None], deadline: float) -> list:
+        """
+        等待任务完成直到截止时间
+
+        Returns:
+            list: 各任务的结果，未完成的任务为 None
+        """
+        running = [task for task in tasks if task is not None]
+        if running:
+            timeout = max(0.0, deadline - asyncio.get_running_loop().time())
+            _, pending = await asyncio.wait(running, timeout=timeout)
+            if pending:
+                self.partial_pages += 1
+                logger.warning(f"搜索结果补全超时，{len(pending)} 个请求转入后台继续执行")
+                self._detach(pending)
+
+        return [task.result() if task is not None and task.done() else None for task in tasks]
+
+    async def iter_covers(self, cover_tasks: list[asyncio.Task | None], deadline: float,
+                          batch_size: int) -> AsyncIterator[list[tuple[int, BytesIO]]]:
+        """
+        按完成顺序分批产出封面，每批最多 batch_size 张，截止时间后未完成的封面转入后台
+
+        Yields:
+            list: (结果序号, 封面) 的列表，按序号排列
+        """
+        remaining = {task: i for i, task in enumerate(cover_tasks) if task is not None}
+        batch: list[tuple[int, BytesIO]] = []
+        loop = asyncio.get_running_loop()
+
+        while remaining:
+            timeout = deadline - loop.time()
+            done = set()
+            if timeout > 0:
+                done, _ = await asyncio.wait(remaining, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                self.partial_pages += 1
+                logger.warning(f"封面获取超时，{len(remaining)} 个请求转入后台继续执行")
+                self._detach(remaining)
+                break
+
+            for task in done:
+                index = remaining.pop(task)
+                if task.result() is not None:
+                    batch.append((index, task.result()))
+
+            while len(batch) >= batch_size:
+                yield sorted(batch[:batch_size])
+                batch = batch[batch_size:]
+
+        if batch:
+            yield sorted(batch)
+
+    async def enrich(self, client: JmcomicClient,
+                     items: list[SearchItem]) -> tuple[list[SearchItem | None], list[BytesIO | None]]:
+        """
+        补全搜索结果，信息和封面全部完成或到达截止时间后一起返回
+
+        Args:
+            client: JM客户端
+            items: 从搜索页解析出的结果
+
+        Returns:
+            tuple: 补全后的结果和对应的封面，未能在时限内获取的项为 None
+        """
+        deadline = self.deadline()
+        info_tasks = self.start_info(client, items)
+        cover_tasks = self.start_covers(items)
+        results = await self.wait(info_tasks + cover_tasks, deadline)
+        return results[:len(items)], results[len(items):]
+
+    async def warm(self, client: JmcomicClient, items: list[SearchItem]):
+        """ 预先获取一页结果的本子信息和封面，结果只写入缓存 """
+        async with self._warming:
+            await asyncio.gather(
+                *(self._with_timeout(complete_search_item(client, item), item.id) for item in items),
+                *(self._with_timeout(get_blurred_cover(item.id), item.id) for item in items
+                  if not (item.is_complete and data_manager.has_restricted_tag(item.tags, item.title))),
+            )
+        self.warmed_pages += 1
+
+    def record_first_result(self, elapsed: float):
+        """ 记录从收到指令到发出第一条结果的耗时 """
+        self.first_result_count += 1
+        self.first_result_total += elapsed
+        self.first_result_max = max(self.first_result_max, elapsed)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "pages": self.pages,
+            "partial_pages": self.partial_pages,
+            "item_timeouts": self.item_timeouts,
+            "avg_first_result": self.first_result_total / (self.first_result_count or 1),
+            "max_first_result": self.first_result_max,
+            "warmed_pages": self.warmed_pages,
+        }
+
+
+search_enricher = SearchEnricher(
+    item_timeout=plugin_config.jmcomic_item_timeout,
+    page_timeout=plugin_config.jmcomic_search_timeout,
+)
+
+# 正在请求的搜索页，多个用户同时搜索相同内容时只请求一次
+_search_fetching: dict[tuple[str, int], asyncio.Task] = {}
+
+
+async def _fetch_search_page(client: JmcomicClient, search_query: str, page: int) -> tuple[SearchItem, ...] | None:
+    jmpage = await search_album_async(client, search_query, page)
+    if jmpage is None:
+        return None
+    return search_result_cache.put(search_query, page, parse_search_items(jmpage))
+
+
+async def fetch_search_page(client: JmcomicClient, search_query: str, page: int) -> tuple[SearchItem, ...] | None:
+    """获取一个API搜索页，优先使用共享缓存，失败时返回 None"""
+    items = search_result_cache.get(search_query, page)
+    if items is not None:
+        return items
+
+    key = (search_result_cache.normalize(search_query), page)
+    task = _search_fetching.get(key)
+    if task is None:
+        task = asyncio.create_task(_fetch_search_page(client, search_query, page))
+        _search_fetching[key] = task
+
+        def on_done(t: asyncio.Task):
+            _search_fetching.pop(key, None)
+            if not t.cancelled():
+                t.exception()
+
+        task.add_done_callback(on_done)
+    return await asyncio.shield(task)
+
+
+async def get_search_slice(client: JmcomicClient, state: SearchState, start: int, end: int) -> list[SearchItem]:
+    """
+    取出搜索状态中 [start, end) 范围内的结果，所在的API页被淘汰时重新请求
+
+    Args:
+        client: JM客户端
+        state: 用户的搜索状态
+        start: 起始位置
+        end: 结束位置（不含）
+
+    Returns:
+        list[SearchItem]: 范围内的结果，重新请求失败的页会被跳过
+    """
+    end = min(end, state.total_count)
+    if start >= end:
+        return []
+
+    first_page = start // SEARCH_PAGE_SIZE + 1
+    last_page = (end - 1) // SEARCH_PAGE_SIZE + 1
+    pages = await asyncio.gather(*(fetch_search_page(client, state.query, page)
+                                   for page in range(first_page, last_page + 1)))
+
+    results = []
+    for page, items in zip(range(first_page, last_page + 1), pages):
+        if items is None:
+            logger.warning(f"重新获取搜索结果失败: {state.query} {page}")
             continue
+        page_start = (page - 1) * SEARCH_PAGE_SIZE
+        results.extend(items[max(0, start - page_start):end - page_start])
+    return results
 
-    logger.warning(f"{photo_id} 封面下载失败：所有域名不可用")
-    return None
 
+async def _warm_search_slice(client: JmcomicClient, state: SearchState, start: int, end: int):
+    next_results = await get_search_slice(client, state, start, end)
+    if next_results:
+        await search_enricher.warm(client, next_results)
 
-def blur_image(image_bytes: BytesIO) -> BytesIO:
-    """对图片进行模糊处理"""
-    image = Image.open(image_bytes)
-    blurred_image = image.filter(ImageFilter.GaussianBlur(radius=7))
 
-    output = BytesIO()
-    blurred_image.save(output, format="JPEG")
+def start_search_prefetch(client: JmcomicClient, state: SearchState, results_per_page: int):
+    """
+    在用户翻页前预取下一页：预热下一页本子的信息和封面，
+    即将翻到已有结果末尾时再预取下一个API页。状态被替换、移除或过期时预取会被取消
 
-    output.seek(0)
+    Args:
+        client: JM客户端
+        state: 用户的搜索状态，start_idx 为下一页的起始位置
+        results_per_page: 每页显示的结果数量
+    """
+    state.cancel_prefetch()
+    if not plugin_config.jmcomic_search_prefetch:
+        return
 
-    return output
+    next_end = state.start_idx + results_per_page
+    if next_end >= state.total_count and state.may_load_more(search_manager.max_results):
+        state.next_page_task = asyncio.create_task(
+            fetch_search_page(client, state.query, state.api_page + 1)
+        )
 
-async def blur_image_async(image_bytes: BytesIO):
-    return await asyncio.to_thread(blur_image, image_bytes)
+    if state.start_idx < state.total_count:
+        state.warm_task = asyncio.create_task(_warm_search_slice(client, state, state.start_idx, next_end))
 
 # endregion
 
+#region 批量导入
+# 导入文件的大小上限
+IMPORT_MAX_BYTES = 4 * 1024 * 1024
+
+
+def find_file_url(event: MessageEvent) -> str | None:
+    """从消息或其回复的消息中找到文件的下载链接"""
+    messages = [event.message]
+    if event.reply is not None:
+        messages.append(event.reply.message)
+
+    for message in messages:
+        for segment in message:
+            if segment.type == "file" and segment.data.get("url"):
+                return segment.data["url"]
+    return None
+
+
+def _read_import_file(source: str) -> bytes:
+    """读取本地导入文件，超出大小上限时抛出 ValueError"""
+    with Path(source).expanduser().open("rb") as f:
+        content = f.read(IMPORT_MAX_BYTES + 1)
+    if len(content) > IMPORT_MAX_BYTES:
+        raise ValueError("文件过大")
+    return content
+
+
+async def _download_import_file(url: str) -> bytes:
+    """流式下载导入文件，超出大小上限时立即中止并抛出 ValueError"""
+    async with httpx.AsyncClient(timeout=30, follow_redirects=True) as http_client:
+        async with http_client.stream("GET", url) as response:
+            response.raise_for_status()
+            content_length = response.headers.get("Content-Length")
+            if content_length is not None and content_length.isdigit() and int(content_length) > IMPORT_MAX_BYTES:
+                raise ValueError("文件过大")
+
+            chunks = []
+            size = 0
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > IMPORT_MAX_BYTES:
+                    raise ValueError("文件过大")
+                chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def load_import_text(source: str) -> str:
+    """
+    读取导入文件的内容
+
+    Args:
+        source: http(s) 链接或 Bot 所在机器上的文件路径
+
+    Raises:
+        ValueError: 文件过大或不是 UTF-8 编码
+    """
+    if source.startswith(("http://", "https://")):
+        content = await _download_import_file(source)
+    else:
+        content = await run_io(_read_import_file, source)
+
+    try:
+        return content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ValueError("文件不是 UTF-8 编码")
+
+
+def split_import_values(text: str) -> list[str]:
+    """按空白、换行和逗号拆分导入的值"""
+    return [value for value in re.split(r"[\s,，、]+", text) if value]
+
+#endregion
+
+
 async def send_forward_message(bot: Bot, event: MessageEvent, messages: list):
     """ 发送合并消息 """
     if isinstance(event, GroupMessageEvent):
@@ -177,10 +719,47 @@ async def group_is_enabled(bot: Bot, event: MessageEvent) -> bool:
 
 #endregion
 
+# Linux 下 FICLONE ioctl 的请求码，用于在支持 reflink 的文件系统上共享数据块
+FICLONE = 0x40049409
+
+
+def clone_file(src_path, dst_path):
+    """
+    尽量以零拷贝方式复制文件
+
+    依次尝试 reflink、copy_file_range，都不可用时回退到分块复制，整个过程不会把文件读入内存
+    """
+    with open(src_path, "rb") as fsrc, open(dst_path, "wb") as fdst:
+        try:
+            import fcntl
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return
+        except (ImportError, OSError):
+            pass
+
+        if hasattr(os, "copy_file_range"):
+            try:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                if remaining == 0:
+                    return
+            except OSError:
+                pass
+
+        fsrc.seek(0)
+        fdst.seek(0)
+        fdst.truncate()
+        shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+
+
 def modify_pdf_md5(original_pdf_path, output_path):
     """
     修改PDF文件的MD5值，但保持文件内容可用
-    通过在文件末尾添加随机字节来改变MD5
+    复制原文件后在末尾追加随机注释来改变MD5，复制过程不读取文件正文
 
     Args:
         original_pdf_path: 原始PDF文件路径
@@ -190,26 +769,28 @@ def modify_pdf_md5(original_pdf_path, output_path):
         bool: 是否成功修改
     """
     try:
-        # 读取原始PDF
-        with open(original_pdf_path, 'rb') as f:
-            content = f.read()
-
-        # 生成随机字节
-        random_bytes = struct.pack('d', random.random())
-
-        # 添加随机注释到PDF末尾
-        # PDF规范允许在文件末尾添加注释，以%%EOF结尾
-        # 我们在%%EOF之前添加随机内容作为注释
-        if content.endswith(b'%%EOF'):
-            # 如果PDF以%%EOF结尾，在它前面添加注释
-            modified_content = content[:-5] + b'\n% Random: ' + random_bytes + b'\n%%EOF'
-        else:
-            # 如果没有，直接在末尾添加注释和EOF标记
-            modified_content = content + b'\n% Random: ' + random_bytes + b'\n%%EOF'
-
-        # 写入修改后的内容
-        with open(output_path, 'wb') as f:
-            f.write(modified_content)
+        # 只读取文件尾部，找到原有的 startxref 偏移
+        with open(original_pdf_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 1024))
+            tail = f.read()
+
+        clone_file(original_pdf_path, output_path)
+
+        # 生成随机字节，转为十六进制避免注释中出现换行符
+        random_bytes = struct.pack("d", random.random()).hex().encode()
+
+        # PDF规范允许在文件末尾添加注释，阅读器从最后一个 %%EOF 向前查找 startxref
+        # 因此在追加的注释之后重复原有的 startxref，保证交叉引用表仍能被找到
+        trailer = b"\n% Random: " + random_bytes + b"\n"
+        startxref_idx = tail.rfind(b"startxref")
+        if startxref_idx != -1:
+            eof_idx = tail.find(b"%%EOF", startxref_idx)
+            trailer += tail[startxref_idx:eof_idx if eof_idx != -1 else None].rstrip() + b"\n"
+        trailer += b"%%EOF\n"
+
+        with open(output_path, "ab") as f:
+            f.write(trailer)
 
         return True
     except Exception as e:
@@ -0,0 +1,83 @@
+"""
+封面模糊处理的基准测试，对比旧实现（原图直接模糊）与新实现（先缩小再模糊）处理一页搜索结果的耗时和CPU时间
+
+用法: python tests/benchmark_cover.py [每页封面数] [封面宽度] [封面高度]
+"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import nonebot
+from PIL import Image, ImageFilter
+
+os.environ.setdefault("ENVIRONMENT", "test")
+nonebot.init()
+nonebot.load_plugin("nonebot_plugin_jmdownloader")
+
+from nonebot_plugin_jmdownloader.utils import blur_image_bytes
+
+
+def legacy_blur(data: bytes) -> bytes:
+    """ 旧实现：原图直接模糊，默认质量编码 """
+    image = Image.open(BytesIO(data))
+    output = BytesIO()
+    image.filter(ImageFilter.GaussianBlur(radius=7)).save(output, format="JPEG")
+    return output.getvalue()
+
+
+def make_covers(count: int, size: tuple[int, int]) -> list[bytes]:
+    covers = []
+    for i in range(count):
+        image = Image.effect_noise(size, 40 + i).convert("RGB")
+        output = BytesIO()
+        image.save(output, format="JPEG", quality=90)
+        covers.append(output.getvalue())
+    return covers
+
+
+def children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def run_threads(func, covers: list[bytes]) -> tuple[float, float, int]:
+    cpu_before, wall_before = time.process_time(), time.perf_counter()
+    results = await asyncio.gather(*(asyncio.to_thread(func, data) for data in covers))
+    return time.perf_counter() - wall_before, time.process_time() - cpu_before, sum(map(len, results))
+
+
+async def run_processes(func, covers: list[bytes], workers: int) -> tuple[float, float, int]:
+    loop = asyncio.get_running_loop()
+    cpu_before, wall_before = children_cpu(), time.perf_counter()
+    executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"))
+    results = await asyncio.gather(*(loop.run_in_executor(executor, func, data) for data in covers))
+    wall = time.perf_counter() - wall_before
+    # 子进程退出后才能统计到其CPU时间
+    executor.shutdown(wait=True)
+    return wall, children_cpu() - cpu_before, sum(map(len, results))
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    size = (int(sys.argv[2]), int(sys.argv[3])) if len(sys.argv) > 3 else (1200, 1600)
+    covers = make_covers(count, size)
+    workers = max(1, (os.cpu_count() or 2) // 2)
+
+    cases = [
+        ("旧实现 线程", run_threads(legacy_blur, covers)),
+        ("新实现 线程", run_threads(blur_image_bytes, covers)),
+        (f"新实现 进程x{workers}", run_processes(blur_image_bytes, covers, workers)),
+    ]
+    print(f"每页 {count} 张封面，尺寸 {size[0]}x{size[1]}")  # noqa: T201
+    for name, case in cases:
+        wall, cpu, total = await case
+        print(f"{name}: 耗时 {wall * 1000:.0f}ms | CPU {cpu * 1000:.0f}ms | 输出 {total / 1024:.0f}KB")  # noqa: T201
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""
+禁止标签匹配的基准测试，对比逐条规则做子串查找与预编译自动机在不同规则数量下每个本子的匹配耗时
+
+用法: python tests/benchmark_filter.py [本子数量]
+"""
+import os
+import random
+import sys
+import time
+
+import nonebot
+
+os.environ.setdefault("ENVIRONMENT", "test")
+nonebot.init()
+nonebot.load_plugin("nonebot_plugin_jmdownloader")
+
+from nonebot_plugin_jmdownloader.content_filter import KeywordMatcher, normalize_text
+
+CHARSET = "猎奇重口男同血腥虐杀恋尸癖萝莉人妻巨乳触手纯爱后宫校园奇幻全彩中文汉化单行本短篇长篇同人原创"
+
+
+def random_word(rng: random.Random, low: int, high: int) -> str:
+    return "".join(rng.choice(CHARSET) for _ in range(rng.randint(low, high)))
+
+
+def make_albums(rng: random.Random, count: int) -> list[tuple[list[str], str]]:
+    return [([random_word(rng, 2, 4) for _ in range(rng.randint(5, 15))], random_word(rng, 10, 40))
+            for _ in range(count)]
+
+
+def naive_match(rules: list[str], tags: list[str], title: str) -> bool:
+    """ 逐条规则在规范化后的标签和标题中做子串查找 """
+    texts = [normalize_text(tag) for tag in tags] + [normalize_text(title)]
+    return any(rule in text for rule in rules for text in texts)
+
+
+def measure(func, albums) -> tuple[float, int]:
+    start = time.perf_counter()
+    hits = sum(1 for tags, title in albums if func(tags, title))
+    return (time.perf_counter() - start) / len(albums), hits
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rng = random.Random(42)
+    albums = make_albums(rng, count)
+
+    print(f"{count} 个本子，每个 5~15 个标签")  # noqa: T201
+    for rule_count in (10, 100, 1000, 5000):
+        rules = list({normalize_text(random_word(rng, 3, 6)) for _ in range(rule_count)})
+
+        build_start = time.perf_counter()
+        matcher = KeywordMatcher(rules)
+        matcher.find_any(["预热"])
+        build = time.perf_counter() - build_start
+
+        naive, naive_hits = measure(lambda tags, title: naive_match(rules, tags, title), albums)
+        compiled, compiled_hits = measure(
+            lambda tags, title: matcher.find_any(tags) is not None or matcher.find(title) is not None, albums
+        )
+        assert naive_hits == compiled_hits
+        print(f"{len(rules)} 条规则: 逐条查找 {naive * 1e6:.1f}us/本 | 自动机 {compiled * 1e6:.1f}us/本"  # noqa: T201
+              f" | 构建 {build * 1000:.1f}ms | 命中 {compiled_hits}")
+
+
+if __name__ == "__main__":
+    main()
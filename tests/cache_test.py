@@ -0,0 +1,88 @@
+import os
+from pathlib import Path
+
+
+def test_cover_cache_evicts_on_put(tmp_path: Path):
+    from nonebot_plugin_jmdownloader.cache import CoverCache
+
+    # 已有的封面按修改时间排在新写入的封面之前
+    tmp_path.mkdir(exist_ok=True)
+    (tmp_path / "1.jpg").write_bytes(b"x" * 400)
+    os.utime(tmp_path / "1.jpg", (1, 1))
+
+    cache = CoverCache(tmp_path, memory_items=10, max_bytes=1000)
+    cache.put(2, b"x" * 400)
+    assert (tmp_path / "1.jpg").exists()
+
+    cache.put(3, b"x" * 400)
+    assert not (tmp_path / "1.jpg").exists()
+    assert (tmp_path / "2.jpg").exists()
+    assert (tmp_path / "3.jpg").exists()
+    assert cache.stats()["disk_bytes"] == 800
+    assert cache.evictions == 1
+
+    # 覆盖写入同一封面不会重复计算大小
+    cache.put(3, b"x" * 500)
+    assert cache.stats()["disk_bytes"] == 900
+    assert (tmp_path / "2.jpg").exists()
+
+
+def test_photo_info_cache_drops_unloadable_rows(tmp_path: Path):
+    from nonebot_plugin_jmdownloader.cache import PhotoInfoCache
+
+    cache = PhotoInfoCache(db_path=tmp_path / "photo.db")
+    cache.put(1, {"title": "标题"})
+    # 对应的类已不存在，以及构造参数已改变的对象
+    broken = {"2": b"cno_such_module\nThing\n(tR.", "3": b"cbuiltins\nint\n(S'x'\nS'y'\ntR."}
+    for photo_id, data in broken.items():
+        cache._db.execute(
+            "INSERT INTO photo_info (photo_id, fetched_at, data, version) VALUES (?, ?, ?, ?)",
+            (photo_id, cache._memory["1"].fetched_at, data, cache.VERSION),
+        )
+    cache._db.commit()
+    cache._memory.clear()
+
+    assert cache.load_db(1).photo == {"title": "标题"}
+    assert cache.load_db(2) is None
+    assert cache.load_db(3) is None
+    assert cache._db.execute("SELECT photo_id FROM photo_info").fetchall() == [("1",)]
+    cache.close()
+
+
+def test_photo_info_cache_drops_other_versions(tmp_path: Path):
+    from nonebot_plugin_jmdownloader.cache import PhotoInfoCache
+
+    cache = PhotoInfoCache(db_path=tmp_path / "photo.db")
+    cache.put(1, {"title": "标题"})
+    cache._db.execute("UPDATE photo_info SET version = '0:2.0.0'")
+    cache._db.commit()
+    cache.close()
+
+    cache = PhotoInfoCache(db_path=tmp_path / "photo.db")
+    assert cache.load_db(1) is None
+    assert cache._db.execute("SELECT COUNT(*) FROM photo_info").fetchone() == (0,)
+    cache.close()
+
+
+def test_pdf_cache_skips_pinned_pdfs(tmp_path: Path):
+    from nonebot_plugin_jmdownloader.cache import PdfCache
+
+    cache = PdfCache(tmp_path, max_bytes=1000, policy="lfu")
+    for photo_id in ("1", "2"):
+        cache.path_of(photo_id).write_bytes(b"x" * 400)
+        assert cache.add(photo_id)
+
+    # 1 正在发送，2 的命中次数更多，按 LFU 本应淘汰 1
+    cache.lookup("2")
+    cache.pin("1")
+    cache.path_of("3").write_bytes(b"x" * 400)
+    assert cache.add("3")
+    assert cache.path_of("1").exists()
+    assert not cache.path_of("2").exists()
+    assert cache.stats()["pinned"] == 1
+
+    cache.unpin("1")
+    cache.path_of("4").write_bytes(b"x" * 400)
+    assert cache.add("4")
+    assert not cache.path_of("1").exists()
+    assert cache.stats()["pinned"] == 0
@@ -23,3 +23,14 @@ async def after_nonebot_init(after_nonebot_init: None):
 
     # 加载插件
     nonebot.load_from_toml("pyproject.toml")
+
+
+@pytest.fixture
+def data_manager(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    """ 数据保存在临时目录中的 JmComicDataManager """
+    from nonebot_plugin_jmdownloader import data_source
+
+    monkeypatch.setattr(data_source, "get_plugin_data_dir", lambda: tmp_path)
+    manager = data_source.JmComicDataManager(backend="sqlite")
+    yield manager
+    manager.close()
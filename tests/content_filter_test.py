@@ -0,0 +1,57 @@
+def test_keyword_matcher_normalizes_text():
+    from nonebot_plugin_jmdownloader.content_filter import KeywordMatcher
+
+    matcher = KeywordMatcher(["獵奇", "ＹＡＯＩ", "重口"])
+    assert matcher.keywords == {"猎奇", "yaoi", "重口"}
+    # 规范化后重复的关键词不会再次加入
+    assert not matcher.add("猎奇")
+    assert not matcher.add("yaoi")
+    assert len(matcher) == 3
+
+    assert matcher.find("全彩 猎奇向") == "猎奇"
+    assert matcher.find("Yaoi") == "yaoi"
+    assert matcher.find_any(["全彩", "ｙａｏｉ"]) == "yaoi"
+    assert matcher.find("全彩") is None
+    assert matcher.find("") is None
+
+
+def test_keyword_matcher_does_not_cross_tags():
+    from nonebot_plugin_jmdownloader.content_filter import KeywordMatcher
+
+    matcher = KeywordMatcher(["重口"])
+    assert matcher.find_any(["加重", "口交"]) is None
+    assert matcher.find_any(["加重", "重口味"]) == "重口"
+
+
+def test_keyword_matcher_follows_failure_links():
+    from nonebot_plugin_jmdownloader.content_filter import KeywordMatcher
+
+    matcher = KeywordMatcher(["he", "she", "hers"])
+    assert matcher.find("ushers") == "she"
+    assert matcher.find("ahhe") == "he"
+    # 匹配后新增的关键词同样生效
+    matcher.add("us")
+    assert matcher.find("ushers") == "us"
+
+
+def test_only_exact_tags_are_exact_matches(data_manager):
+    data_manager.add_restricted_tag("重口")
+
+    # 繁简体、全角半角不同但规范化后相同的标签视为完全相同
+    assert data_manager.has_exact_restricted_tag(["全彩", "獵奇"])
+    assert data_manager.has_exact_restricted_tag(["ＹＡＯＩ"])
+    # 只是包含禁止的关键词时只会被拒绝，不算完全相同
+    assert not data_manager.has_exact_restricted_tag(["重口味"])
+    assert data_manager.has_restricted_tag(["重口味"])
+    assert not data_manager.has_restricted_tag(["全彩"])
+
+
+def test_title_matches_follow_config(data_manager):
+    data_manager.filter_titles = False
+    assert not data_manager.has_restricted_tag(["全彩"], "猎奇合集")
+    assert not data_manager.has_restricted_title("猎奇合集")
+
+    data_manager.filter_titles = True
+    assert data_manager.has_restricted_tag(["全彩"], "猎奇合集")
+    assert data_manager.has_restricted_title("猎奇合集")
+    assert not data_manager.has_exact_restricted_tag(["全彩"])
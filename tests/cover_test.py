@@ -0,0 +1,41 @@
+from io import BytesIO
+import threading
+
+from PIL import Image
+
+
+def jpeg_bytes(size: tuple[int, int]) -> bytes:
+    output = BytesIO()
+    Image.new("RGB", size, "red").save(output, format="JPEG")
+    return output.getvalue()
+
+
+async def test_blur_pool_falls_back_to_threads_when_threads_exist():
+    from nonebot_plugin_jmdownloader.utils import COVER_MAX_SIZE, CoverBlurPool
+
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+        # 已有其他线程时不会 fork 子进程
+        pool = CoverBlurPool(process_workers=2)
+        pool.start()
+        assert pool._executor is None
+    finally:
+        stop.set()
+        thread.join()
+
+    data = await pool.blur(jpeg_bytes((1200, 1600)))
+    with Image.open(BytesIO(data)) as image:
+        assert image.width <= COVER_MAX_SIZE[0]
+        assert image.height <= COVER_MAX_SIZE[1]
+    assert await pool.blur(b"not an image") is None
+    await pool.close()
+
+
+def test_blur_pool_without_workers_uses_threads():
+    from nonebot_plugin_jmdownloader.utils import CoverBlurPool
+
+    pool = CoverBlurPool(process_workers=0)
+    pool.start()
+    assert pool._executor is None
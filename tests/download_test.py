@@ -0,0 +1,87 @@
+import asyncio
+
+
+async def test_single_flight_merges_concurrent_downloads():
+    from nonebot_plugin_jmdownloader.download import DownloadSingleFlight
+
+    flight = DownloadSingleFlight()
+    calls = 0
+    gate = asyncio.Event()
+
+    async def download() -> bool:
+        nonlocal calls
+        calls += 1
+        await gate.wait()
+        return True
+
+    first = asyncio.create_task(flight.run(1, download))
+    second = asyncio.create_task(flight.run("1", download))
+    await asyncio.sleep(0)
+    assert flight.is_inflight(1)
+
+    # 其中一个等待者被取消不影响正在进行的下载
+    first.cancel()
+    gate.set()
+    assert await second is True
+    assert calls == 1
+    assert flight.stats() == {"inflight": 0, "started": 1, "merged": 1}
+
+
+async def test_scheduler_round_robins_groups_and_users():
+    from nonebot_plugin_jmdownloader.download import DownloadScheduler
+
+    scheduler = DownloadScheduler(workers=1, max_queue=5)
+    started = []
+    gate = asyncio.Event()
+
+    def job(photo_id: str):
+        async def run() -> bool:
+            started.append(photo_id)
+            if photo_id == "blocker":
+                await gate.wait()
+            return True
+        return run
+
+    # 唯一的下载协程被占用，后续任务全部排队
+    blocker = scheduler.submit("A", "u0", "blocker", job("blocker"))
+    await asyncio.sleep(0)
+    assert started == ["blocker"]
+
+    jobs = [
+        scheduler.submit("A", "u1", "a1", job("a1")),
+        scheduler.submit("A", "u1", "a2", job("a2")),
+        scheduler.submit("A", "u1", "a3", job("a3")),
+        scheduler.submit("A", "u2", "b1", job("b1")),
+        scheduler.submit("B", "u3", "c1", job("c1")),
+    ]
+    assert scheduler.is_full()
+    assert scheduler.submit("B", "u4", "d1", job("d1")) is None
+    assert scheduler.rejected == 1
+    # 提交时的位置：其他用户和其他群的任务插到 u1 的后续任务之前
+    assert [j.position for j in jobs] == [1, 2, 3, 2, 2]
+
+    # 先按群轮转，再在群内按用户轮转
+    # 先按群轮转，再在群内按用户轮转
+    gate.set()
+    assert await asyncio.gather(blocker.future, *(j.future for j in jobs))
+    assert started == ["blocker", "a1", "c1", "b1", "a2", "a3"]
+    assert scheduler.depth == 0
+    await scheduler.stop()
+
+
+async def test_scheduler_stop_cancels_queued_jobs():
+    from nonebot_plugin_jmdownloader.download import DownloadScheduler
+
+    scheduler = DownloadScheduler(workers=1, max_queue=5)
+    gate = asyncio.Event()
+
+    async def block() -> bool:
+        await gate.wait()
+        return True
+
+    scheduler.submit("A", "u1", "1", block)
+    await asyncio.sleep(0)
+    queued = scheduler.submit("A", "u2", "2", block)
+    await scheduler.stop()
+    assert queued.future.cancelled()
+    assert scheduler.depth == 0
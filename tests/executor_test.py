@@ -0,0 +1,64 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+
+async def test_run_io_runs_off_the_event_loop():
+    from nonebot_plugin_jmdownloader.executor import IoExecutor
+
+    executor = IoExecutor(workers=2)
+    loop_thread = threading.get_ident()
+
+    threads = await asyncio.gather(*(executor.run(threading.get_ident) for _ in range(4)))
+    assert loop_thread not in threads
+    assert executor.stats()["submitted"] == 4
+
+    # 文件操作执行期间事件循环仍能处理其他任务
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker = asyncio.create_task(tick())
+    await executor.run(time.sleep, 0.2)
+    ticker.cancel()
+    assert ticks >= 5
+
+    await executor.close()
+    assert executor._executor is None
+
+
+async def test_loop_lag_monitor_reports_blocking(monkeypatch: pytest.MonkeyPatch):
+    from nonebot_plugin_jmdownloader import executor
+
+    warnings: list[str] = []
+    monkeypatch.setattr(executor.logger, "warning", warnings.append)
+
+    monitor = executor.LoopLagMonitor(threshold=0.05, interval=0.02)
+    await monitor.start()
+    await asyncio.sleep(0.1)
+    assert monitor.stats()["stalls"] == 0
+
+    # 阻塞事件循环，心跳延迟超过阈值
+    time.sleep(0.3)  # noqa: ASYNC251
+    await asyncio.sleep(0.1)
+    await monitor.close()
+
+    assert monitor.stats()["stalls"] == 1
+    assert monitor.stats()["max_lag"] >= 0.2
+    assert any("当前调用栈" in message and "test_loop_lag_monitor_reports_blocking" in message for message in warnings)
+    assert any(message.startswith("事件循环被阻塞了") for message in warnings)
+
+
+async def test_loop_lag_monitor_disabled():
+    from nonebot_plugin_jmdownloader.executor import LoopLagMonitor
+
+    monitor = LoopLagMonitor(threshold=0)
+    await monitor.start()
+    assert monitor._task is None
+    await monitor.close()
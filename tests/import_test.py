@@ -0,0 +1,88 @@
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import threading
+
+import pytest
+
+CHUNK = b"1" * 64 * 1024
+
+
+class ImportFileHandler(BaseHTTPRequestHandler):
+    # 发送的分块数量，用于确认超出上限后下载被中止
+    sent_chunks = 0
+
+    def do_GET(self):
+        if self.path == "/small":
+            body = b"123 456,789"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == "/declared":
+            self.send_response(200)
+            self.send_header("Content-Length", str(100 * 1024 * 1024))
+            self.end_headers()
+        else:
+            # 不声明长度的无限分块响应
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for _ in range(1000):
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(CHUNK), CHUNK))
+                    ImportFileHandler.sent_chunks += 1
+                self.wfile.write(b"0\r\n\r\n")
+            except OSError:
+                pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server() -> Iterator[str]:
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ImportFileHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+async def test_import_from_url(server: str):
+    from nonebot_plugin_jmdownloader.utils import load_import_text, split_import_values
+
+    assert split_import_values(await load_import_text(f"{server}/small")) == ["123", "456", "789"]
+
+
+async def test_import_rejects_declared_large_file(server: str):
+    from nonebot_plugin_jmdownloader.utils import load_import_text
+
+    with pytest.raises(ValueError, match="文件过大"):
+        await load_import_text(f"{server}/declared")
+
+
+async def test_import_aborts_streamed_large_file(server: str):
+    from nonebot_plugin_jmdownloader.utils import IMPORT_MAX_BYTES, load_import_text
+
+    with pytest.raises(ValueError, match="文件过大"):
+        await load_import_text(f"{server}/stream")
+    # 只读取了略多于上限的数据，而不是整个 64MB 的响应
+    assert ImportFileHandler.sent_chunks * len(CHUNK) < IMPORT_MAX_BYTES * 4
+
+
+async def test_import_from_file(tmp_path: Path):
+    from nonebot_plugin_jmdownloader.utils import IMPORT_MAX_BYTES, load_import_text
+
+    path = tmp_path / "ids.txt"
+    path.write_bytes("\ufeff猎奇、重口".encode())
+    assert await load_import_text(str(path)) == "猎奇、重口"
+
+    path.write_bytes(b"1" * (IMPORT_MAX_BYTES + 1))
+    with pytest.raises(ValueError, match="文件过大"):
+        await load_import_text(str(path))
+
+    path.write_bytes("猎奇".encode("gbk"))
+    with pytest.raises(ValueError, match="UTF-8"):
+        await load_import_text(str(path))
@@ -0,0 +1,79 @@
+import hashlib
+import os
+from pathlib import Path
+
+from PIL import Image
+import pytest
+
+pypdf = pytest.importorskip("pypdf")
+
+
+@pytest.fixture
+def source_pdf(tmp_path: Path) -> Path:
+    path = tmp_path / "1.pdf"
+    pages = [Image.new("RGB", (40, 60), color) for color in ("red", "green", "blue")]
+    pages[0].save(path, format="PDF", save_all=True, append_images=pages[1:])
+    return path
+
+
+def no_reflink(*args):
+    raise OSError("reflink unsupported")
+
+
+def md5_of(path: Path) -> str:
+    return hashlib.md5(path.read_bytes()).hexdigest()
+
+
+def check_modified(source: Path, output: Path, original: bytes):
+    from nonebot_plugin_jmdownloader.utils import modify_pdf_md5
+
+    assert modify_pdf_md5(str(source), str(output))
+    # 缓存中的原文件不会被修改
+    assert source.read_bytes() == original
+    assert md5_of(output) != md5_of(source)
+    assert output.read_bytes().startswith(original)
+    assert len(pypdf.PdfReader(output, strict=True).pages) == 3
+
+
+def test_modify_pdf_md5(tmp_path: Path, source_pdf: Path):
+    original = source_pdf.read_bytes()
+    check_modified(source_pdf, tmp_path / "a.pdf", original)
+    check_modified(source_pdf, tmp_path / "b.pdf", original)
+    # 每次生成的副本各不相同
+    assert md5_of(tmp_path / "a.pdf") != md5_of(tmp_path / "b.pdf")
+
+
+def test_modify_pdf_md5_without_zero_copy(tmp_path: Path, source_pdf: Path, monkeypatch: pytest.MonkeyPatch):
+    fcntl = pytest.importorskip("fcntl")
+    monkeypatch.setattr(fcntl, "ioctl", no_reflink)
+    monkeypatch.delattr(os, "copy_file_range", raising=False)
+
+    check_modified(source_pdf, tmp_path / "a.pdf", source_pdf.read_bytes())
+
+
+def test_clone_file_falls_back_after_partial_copy(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    from nonebot_plugin_jmdownloader.utils import clone_file
+
+    fcntl = pytest.importorskip("fcntl")
+    if not hasattr(os, "copy_file_range"):
+        pytest.skip("copy_file_range is not available")
+
+    real_copy_file_range = os.copy_file_range
+    calls = 0
+
+    def flaky_copy_file_range(src, dst, count):
+        # 第一次复制部分数据，之后报错，需要从头分块复制
+        nonlocal calls
+        calls += 1
+        if calls > 1:
+            raise OSError("cross-device copy")
+        return real_copy_file_range(src, dst, min(count, 1000))
+
+    monkeypatch.setattr(fcntl, "ioctl", no_reflink)
+    monkeypatch.setattr(os, "copy_file_range", flaky_copy_file_range)
+
+    source = tmp_path / "src.bin"
+    source.write_bytes(os.urandom(5000))
+    clone_file(source, tmp_path / "dst.bin")
+    assert calls == 2
+    assert (tmp_path / "dst.bin").read_bytes() == source.read_bytes()
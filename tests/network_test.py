@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+
+class FakeDomains:
+    """ 按域名模拟图片服务器，记录每个请求的开始时间以及是否被取消 """
+
+    def __init__(self, **behaviours: tuple[float, int | None]):
+        # 域名 -> (响应前等待的秒数, 状态码)，状态码为 None 时模拟连接失败
+        self.behaviours = behaviours
+        self.started: dict[str, float] = {}
+        self.cancelled: set[str] = set()
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        domain = request.url.host
+        self.started[domain] = time.monotonic()
+        delay, status = self.behaviours[domain]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.add(domain)
+            raise
+        if status is None:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(status, content=domain.encode())
+
+    def client(self, hedge_delay: float):
+        from nonebot_plugin_jmdownloader.network import CoverHttpClient
+
+        client = CoverHttpClient(hedge_delay=hedge_delay)
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+        return client
+
+
+def build_url(domain: str) -> str:
+    return f"https://{domain}/cover.jpg"
+
+
+async def test_hedge_starts_after_delay():
+    fake = FakeDomains(a=(1, 200), b=(0, 200))
+    client = fake.client(hedge_delay=0.1)
+
+    started_at = time.monotonic()
+    response = await client.get_hedged(["a", "b"], build_url)
+    assert response.content == b"b"
+    assert fake.started["b"] - started_at >= 0.1
+    assert client.hedged == 1
+    # 落败的请求被取消，耗时计入该域名的延迟
+    await asyncio.sleep(0)
+    assert fake.cancelled == {"a"}
+    assert client.health.domains["a"].latency >= 0.1
+    await client.close()
+
+
+async def test_first_success_cancels_other_requests():
+    fake = FakeDomains(a=(1, 200), b=(1, 200), c=(0.05, 200))
+    client = fake.client(hedge_delay=0.02)
+
+    response = await client.get_hedged(["a", "b", "c"], build_url)
+    assert response.content == b"c"
+    await asyncio.sleep(0)
+    assert fake.cancelled == {"a", "b"}
+    assert client.hedged == 2
+    await client.close()
+
+
+@pytest.mark.parametrize("status", [503, None])
+async def test_failure_launches_next_domain_immediately(status: int | None):
+    fake = FakeDomains(a=(0, status), b=(0, 200))
+    client = fake.client(hedge_delay=10)
+
+    started_at = time.monotonic()
+    response = await client.get_hedged(["a", "b"], build_url)
+    assert response.content == b"b"
+    assert time.monotonic() - started_at < 1
+    assert client.hedged == 0
+    assert client.health.domains["a"].consecutive_failures == 1
+    await client.close()
+
+
+async def test_all_domains_failing_returns_none():
+    fake = FakeDomains(a=(0, 500), b=(0, None))
+    client = fake.client(hedge_delay=10)
+
+    assert await client.get_hedged(["a", "b"], build_url) is None
+    assert client.stats()["a"].failures == 1
+    assert client.stats()["b"].failures == 1
+    await client.close()
+
+
+async def test_open_circuit_domain_is_tried_last():
+    fake = FakeDomains(a=(0, 500), b=(0, 200))
+    client = fake.client(hedge_delay=10)
+    client.health.failure_threshold = 2
+
+    # a 延迟更低，在熔断之前排在前面
+    client.health.record_success("a", 0.01)
+    client.health.record_success("b", 0.5)
+    assert client.health.ordered(["b", "a"]) == ["a", "b"]
+
+    assert (await client.get_hedged(["a", "b"], build_url)).content == b"b"
+    assert (await client.get_hedged(["a", "b"], build_url)).content == b"b"
+    assert client.health.is_open("a")
+    assert client.health.ordered(["a", "b"]) == ["b", "a"]
+
+    # 熔断中的域名不会被优先请求
+    fake.started.clear()
+    assert (await client.get_hedged(["a", "b"], build_url)).content == b"b"
+    assert "a" not in fake.started
+
+    # 成功一次后解除熔断
+    client.health.record_success("a", 0.01)
+    assert not client.health.is_open("a")
+    assert client.health.ordered(["b", "a"])[0] == "a"
+    await client.close()
@@ -0,0 +1,149 @@
+from pathlib import Path
+import struct
+
+from PIL import Image
+import pytest
+
+pypdf = pytest.importorskip("pypdf")
+
+
+def save_image(path: Path, mode: str = "RGB", size: tuple[int, int] = (40, 60), fmt: str = "JPEG") -> Path:
+    color = {"RGB": (200, 10, 10), "L": 128, "CMYK": (10, 20, 30, 40)}[mode]
+    Image.new(mode, size, color).save(path, format=fmt, dpi=(72, 72))
+    return path
+
+
+def strip_app14(path: Path):
+    """ 去掉 Adobe APP14 标记，模拟非 Adobe 软件生成的 CMYK JPEG """
+    data = path.read_bytes()
+    out, pos = bytearray(data[:2]), 2
+    while data[pos + 1] != 0xDA:
+        length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+        if data[pos + 1] != 0xEE:
+            out += data[pos:pos + 2 + length]
+        pos += 2 + length
+    out += data[pos:]
+    path.write_bytes(bytes(out))
+
+
+def read_pdf(path: Path):
+    return pypdf.PdfReader(path, strict=True)
+
+
+def page_widths(path: Path) -> list[float]:
+    return [float(page.mediabox.width) for page in read_pdf(path).pages]
+
+
+def test_pages_are_written_in_index_order(tmp_path: Path):
+    from nonebot_plugin_jmdownloader.pdf import StreamingPdfWriter
+
+    writer = StreamingPdfWriter(tmp_path / "1.pdf")
+    writer.open()
+    writer.add_page(3, save_image(tmp_path / "3.jpg", size=(30, 60)))
+    writer.add_page(2, save_image(tmp_path / "2.jpg", size=(20, 60)))
+    # 第 1 页到达之前，后续页面都在等待
+    assert writer.page_count == 0
+    writer.add_page(1, save_image(tmp_path / "1.jpg", size=(10, 60)))
+    assert writer.page_count == 3
+
+    assert writer.close()
+    assert not writer.part_path.exists()
+    assert page_widths(tmp_path / "1.pdf") == [10, 20, 30]
+
+
+def test_gap_is_flushed_on_close(tmp_path: Path):
+    from nonebot_plugin_jmdownloader.pdf import StreamingPdfWriter
+
+    writer = StreamingPdfWriter(tmp_path / "1.pdf")
+    writer.open()
+    writer.add_page(4, save_image(tmp_path / "4.jpg", size=(40, 60)))
+    writer.add_page(1, save_image(tmp_path / "1.jpg", size=(10, 60)))
+    writer.add_page(3, save_image(tmp_path / "3.jpg", size=(30, 60)))
+    assert writer.page_count == 1
+
+    # 第 2 页下载失败，剩余页面在结束时按页码写入
+    assert writer.close()
+    assert page_widths(tmp_path / "1.pdf") == [10, 30, 40]
+
+
+def test_unreadable_images_are_skipped(tmp_path: Path):
+    from nonebot_plugin_jmdownloader.pdf import StreamingPdfWriter
+
+    broken = tmp_path / "2.jpg"
+    broken.write_bytes(b"not an image")
+
+    writer = StreamingPdfWriter(tmp_path / "1.pdf")
+    writer.open()
+    writer.add_page(1, save_image(tmp_path / "1.jpg", size=(10, 60)))
+    writer.add_page(2, broken)
+    writer.add_page(3, save_image(tmp_path / "3.jpg", size=(30, 60)))
+    assert writer.close()
+    assert page_widths(tmp_path / "1.pdf") == [10, 30]
+
+
+def test_abort_and_empty_close_remove_part_file(tmp_path: Path):
+    from nonebot_plugin_jmdownloader.pdf import StreamingPdfWriter
+
+    writer = StreamingPdfWriter(tmp_path / "1.pdf")
+    writer.open()
+    writer.add_page(1, save_image(tmp_path / "1.jpg"))
+    assert writer.part_path.exists()
+    writer.abort()
+    assert not writer.part_path.exists()
+    assert not writer.pdf_path.exists()
+
+    writer = StreamingPdfWriter(tmp_path / "2.pdf")
+    writer.open()
+    assert not writer.close()
+    assert not writer.part_path.exists()
+    assert not writer.pdf_path.exists()
+
+
+@pytest.mark.parametrize(
+    ("mode", "fmt", "color_space"),
+    [
+        ("RGB", "JPEG", "/DeviceRGB"),
+        ("L", "JPEG", "/DeviceGray"),
+        ("CMYK", "JPEG", "/DeviceCMYK"),
+        ("RGB", "PNG", "/DeviceRGB"),
+    ],
+)
+def test_output_parses_strictly(tmp_path: Path, mode: str, fmt: str, color_space: str):
+    from nonebot_plugin_jmdownloader.pdf import StreamingPdfWriter
+
+    image_path = save_image(tmp_path / f"1.{fmt.lower()}", mode=mode, fmt=fmt)
+    writer = StreamingPdfWriter(tmp_path / "1.pdf")
+    writer.open()
+    writer.add_page(1, image_path)
+    assert writer.close()
+
+    reader = read_pdf(tmp_path / "1.pdf")
+    page = reader.pages[0]
+    # PNG 以每米像素数记录 DPI，换算后略有误差
+    assert float(page.mediabox.width) == pytest.approx(40, abs=0.01)
+    assert float(page.mediabox.height) == pytest.approx(60, abs=0.01)
+    image = page["/Resources"]["/XObject"]["/Im0"].get_object()
+    assert image["/ColorSpace"] == color_space
+    assert image["/Filter"] == "/DCTDecode"
+    # Pillow 生成的 CMYK JPEG 带有 Adobe 标记，为反相存储
+    assert ("/Decode" in image) == (mode == "CMYK")
+    assert page.images[0].image.size == (40, 60)
+
+
+def test_cmyk_without_adobe_marker_is_not_inverted(tmp_path: Path):
+    from nonebot_plugin_jmdownloader.pdf import StreamingPdfWriter
+
+    image_path = save_image(tmp_path / "1.jpg", mode="CMYK")
+    strip_app14(image_path)
+    with Image.open(image_path) as image:
+        assert image.mode == "CMYK"
+        assert "adobe" not in image.info
+
+    writer = StreamingPdfWriter(tmp_path / "1.pdf")
+    writer.open()
+    writer.add_page(1, image_path)
+    assert writer.close()
+
+    image = read_pdf(tmp_path / "1.pdf").pages[0]["/Resources"]["/XObject"]["/Im0"].get_object()
+    assert image["/ColorSpace"] == "/DeviceCMYK"
+    assert "/Decode" not in image
@@ -1,4 +1,6 @@
-from nonebot.adapters.onebot.v11 import Bot, GroupMessageEvent, Message
+from types import SimpleNamespace
+
+from nonebot.adapters.onebot.v11 import ActionFailed, Bot, GroupMessageEvent, Message, NetworkError, PrivateMessageEvent
 from nonebug import App
 import pytest
 
@@ -26,6 +28,28 @@ def make_onebot_msg(message: Message) -> GroupMessageEvent:
     return event
 
 
+def make_private_msg(message: Message) -> PrivateMessageEvent:
+    from time import time
+
+    from nonebot.adapters.onebot.v11.event import Sender
+
+    event = PrivateMessageEvent(
+        time=int(time()),
+        sub_type="friend",
+        self_id=123456,
+        post_type="message",
+        message_type="private",
+        message_id=12345623,
+        user_id=1234567890,
+        raw_message=message.extract_plain_text(),
+        message=message,
+        original_message=message,
+        sender=Sender(),
+        font=123456,
+    )
+    return event
+
+
 @pytest.mark.asyncio
 async def test_pip(app: App):
     import nonebot
@@ -46,3 +70,62 @@ async def test_pip(app: App):
         ctx.receive_event(bot, event)
         ctx.should_call_send(event, Message("nonebot2"), result=None, bot=bot)
         ctx.should_finished()
+
+
+@pytest.mark.parametrize(
+    ("exception", "remaining"),
+    [
+        (None, 1),
+        # 发送失败时退还预留的次数
+        (ActionFailed(retcode=1200), 2),
+        # 上传超时时协议端通常仍会发出文件，依然扣除次数
+        (NetworkError("timeout"), 1),
+    ],
+)
+async def test_download_commits_quota_after_upload(
+    app: App, data_manager, monkeypatch: pytest.MonkeyPatch, exception: Exception | None, remaining: int
+):
+    import nonebot
+    from nonebot.adapters.onebot.v11 import Adapter as OnebotV11Adapter
+
+    import nonebot_plugin_jmdownloader as plugin
+
+    photo = SimpleNamespace(id="123400", title="test", author="author", tags=["tag"])
+
+    async def get_photo_info(client, photo_id):
+        return photo
+
+    monkeypatch.setattr(plugin, "data_manager", data_manager)
+    monkeypatch.setattr(plugin, "get_photo_info_async", get_photo_info)
+    # 离线环境中插件构建 jm 客户端会失败
+    monkeypatch.setattr(plugin, "client", None, raising=False)
+    monkeypatch.setattr(plugin, "acquire_rate_limits", lambda *checks: 0)
+    monkeypatch.setattr(plugin.plugin_config, "jmcomic_modify_real_md5", False)
+    monkeypatch.setattr(plugin.pdf_cache, "lookup", plugin.pdf_cache.path_of)
+    data_manager.set_user_limit(1234567890, 2)
+
+    event = make_private_msg(Message("/jm下载 123400"))
+    async with app.test_matcher(plugin.jm_download) as ctx:
+        adapter = nonebot.get_adapter(OnebotV11Adapter)
+        bot = ctx.create_bot(base=Bot, adapter=adapter)
+        ctx.receive_event(bot, event)
+        ctx.should_call_send(
+            event,
+            Message([
+                "jm123400 | test\n", "🎨 作者: author\n", "🔖 标签: #tag\n", "开始下载...\n你本周还有1次下载次数！",
+            ]),
+            result=None,
+            bot=bot,
+        )
+        ctx.should_call_api(
+            "upload_private_file",
+            {"user_id": 1234567890, "file": plugin.pdf_cache.path_of(photo.id).as_posix(), "name": "123400.pdf"},
+            result=None,
+            exception=exception,
+        )
+        if isinstance(exception, ActionFailed):
+            ctx.should_call_send(event, "发送文件失败", result=None, bot=bot)
+        ctx.should_finished()
+
+    assert data_manager.get_user_limit(1234567890) == remaining
+    assert data_manager.stats()["outstanding"] == 0
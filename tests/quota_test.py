@@ -0,0 +1,84 @@
+import pytest
+
+
+def test_reservation_commit_and_release(data_manager):
+    data_manager.set_user_limit(1, 2)
+
+    first = data_manager.reserve_user_limit(1)
+    second = data_manager.reserve_user_limit(1)
+    assert first is not None
+    assert second is not None
+    # 预留中的次数不能被其他请求使用，但还没有写入存储
+    assert data_manager.get_user_limit(1) == 0
+    assert data_manager.reserve_user_limit(1) is None
+    assert data_manager.storage.get_user_quota("1")[0] == 2
+
+    assert data_manager.release_reservation(first)
+    assert not data_manager.release_reservation(first)
+    assert data_manager.get_user_limit(1) == 1
+
+    assert data_manager.commit_reservation(second)
+    assert not data_manager.commit_reservation(second)
+    assert not data_manager.release_reservation(second)
+    assert data_manager.get_user_limit(1) == 1
+    assert data_manager.storage.get_user_quota("1")[0] == 1
+
+    assert data_manager.stats() == {
+        "outstanding": 0, "reserved": 0, "committed": 1, "released": 1, "expired": 0,
+    }
+
+
+def test_reservation_expires(data_manager):
+    data_manager.set_user_limit(1, 1)
+    stale = data_manager.reserve_user_limit(1)
+    assert data_manager.expire_reservations() == 0
+
+    stale.created_at -= data_manager.RESERVATION_TTL + 1
+    assert data_manager.expire_reservations() == 1
+    assert data_manager.get_user_limit(1) == 1
+    # 已过期的预留不能再提交
+    assert not data_manager.commit_reservation(stale)
+    assert data_manager.stats()["expired"] == 1
+
+
+def test_quota_resets_in_new_period(data_manager):
+    from nonebot_plugin_jmdownloader.config import plugin_config
+    from nonebot_plugin_jmdownloader.quota import current_period
+
+    data_manager.storage.set_user_quota("1", 0, current_period() - 1)
+    assert data_manager.get_user_limit(1) == plugin_config.jmcomic_user_limits
+    data_manager.decrease_user_limit(1)
+    assert data_manager.storage.get_user_quota("1") == (plugin_config.jmcomic_user_limits - 1, current_period())
+
+
+def test_current_period_starts_on_monday():
+    from datetime import datetime
+
+    from nonebot_plugin_jmdownloader.quota import current_period
+
+    assert current_period(datetime(2024, 1, 7, 23, 59)) + 1 == current_period(datetime(2024, 1, 8))
+    assert current_period(datetime(2024, 1, 8)) == current_period(datetime(2024, 1, 14, 23, 59))
+
+
+def test_token_bucket(monkeypatch: pytest.MonkeyPatch):
+    from nonebot_plugin_jmdownloader import quota
+
+    now = 1000.0
+    monkeypatch.setattr(quota.time, "monotonic", lambda: now)
+    users = quota.TokenBucketLimiter(2, 10)
+    groups = quota.TokenBucketLimiter(3, 10)
+
+    assert quota.acquire_rate_limits((users, "1"), (groups, "g")) == 0
+    assert quota.acquire_rate_limits((users, "1"), (groups, "g")) == 0
+    assert quota.acquire_rate_limits((users, "1"), (groups, "g")) == pytest.approx(5)
+    # 被用户限制拒绝时不消耗群的令牌
+    assert groups.retry_after("g") == 0
+    assert quota.acquire_rate_limits((users, "2"), (groups, "g")) == 0
+    assert quota.acquire_rate_limits((users, "3"), (groups, "g")) == pytest.approx(10 / 3)
+    assert users.stats() == {"tracked": 2, "allowed": 3, "limited": 1}
+
+    # 恢复满的桶会被丢弃
+    now += 10
+    users.consume("4")
+    assert users.stats()["tracked"] == 1
+    assert not quota.TokenBucketLimiter(0, 10).enabled
@@ -0,0 +1,142 @@
+from types import SimpleNamespace
+
+from jmcomic import AdvancedDict, JmPageTool
+import pytest
+
+# 移动端API搜索接口的返回值（jmcomic 文档中的示例），结果中没有标签
+API_SEARCH_DATA = {
+    "search_query": "MANA",
+    "total": "177",
+    "content": [
+        {
+            "id": "441923",
+            "author": "MANA",
+            "description": "",
+            "name": "[MANA] 神里绫华5",
+            "image": "",
+            "category": {"id": "1", "title": "同人"},
+            "category_sub": {"id": "1", "title": "同人"},
+        },
+        {
+            "id": "441924",
+            "author": "",
+            "description": "",
+            "name": "[MANA] 神里绫华6",
+            "image": "",
+            "category": {"id": "1", "title": "同人"},
+            "category_sub": {"id": "1", "title": "同人"},
+        },
+    ],
+}
+
+
+def test_api_search_page_has_no_tags():
+    from nonebot_plugin_jmdownloader.utils import parse_search_items
+
+    page = JmPageTool.parse_api_to_search_page(AdvancedDict(API_SEARCH_DATA))
+    items = parse_search_items(page)
+
+    assert [item.id for item in items] == ["441923", "441924"]
+    assert items[0].title == "[MANA] 神里绫华5"
+    assert items[0].author == "MANA"
+    assert items[1].author is None
+    # 空的标签列表是 jmcomic 补上的，不能当作“没有标签”而跳过禁止标签的检查
+    assert all(item.tags is None and not item.is_complete for item in items)
+
+
+async def test_complete_search_item_fetches_details(monkeypatch: pytest.MonkeyPatch):
+    from nonebot_plugin_jmdownloader import utils
+
+    calls = []
+
+    async def fake_get_photo_info(client, photo_id):
+        calls.append(photo_id)
+        return SimpleNamespace(title="详情标题", author="详情作者", tags=["全彩", "猎奇"])
+
+    monkeypatch.setattr(utils, "get_photo_info_async", fake_get_photo_info)
+
+    page = JmPageTool.parse_api_to_search_page(AdvancedDict(API_SEARCH_DATA))
+    items = [await utils.complete_search_item(None, item) for item in utils.parse_search_items(page)]
+
+    assert calls == ["441923", "441924"]
+    assert items[0].title == "[MANA] 神里绫华5"
+    assert items[0].author == "MANA"
+    assert items[0].tags == ["全彩", "猎奇"]
+    assert items[1].author == "详情作者"
+
+
+async def test_complete_search_item_skips_items_with_tags(monkeypatch: pytest.MonkeyPatch):
+    from nonebot_plugin_jmdownloader import utils
+    from nonebot_plugin_jmdownloader.data_source import SearchItem
+
+    async def fail(client, photo_id):
+        raise AssertionError("不应请求详情")
+
+    monkeypatch.setattr(utils, "get_photo_info_async", fail)
+
+    item = SearchItem(id="1", title="标题", author="作者", tags=["全彩"])
+    assert await utils.complete_search_item(None, item) is item
+
+
+def make_state(query: str, minutes_ago: float = 0):
+    from datetime import datetime, timedelta
+
+    from nonebot_plugin_jmdownloader.data_source import SearchState
+
+    created_at = datetime.now() - timedelta(minutes=minutes_ago)
+    return SearchState(query=query, start_idx=0, total_count=0, last_id="", api_page=1, created_at=created_at)
+
+
+def test_search_manager_evicts_oldest_at_capacity():
+    from nonebot_plugin_jmdownloader.data_source import SearchManager
+
+    manager = SearchManager(ttl_minutes=30, max_sessions=2)
+    manager.set_state("1", make_state("a", minutes_ago=10))
+    manager.set_state("2", make_state("b", minutes_ago=5))
+    manager.set_state("3", make_state("c"))
+
+    # 最早过期的用户 1 被淘汰
+    assert set(manager.states) == {"2", "3"}
+    assert manager.evicted == 1
+
+    # 替换已有用户的状态不会淘汰其他用户
+    manager.set_state("3", make_state("d"))
+    assert set(manager.states) == {"2", "3"}
+    assert manager.evicted == 1
+
+
+def test_search_manager_skips_stale_heap_entries():
+    from nonebot_plugin_jmdownloader.data_source import SearchManager
+
+    manager = SearchManager(ttl_minutes=30, max_sessions=2)
+    manager.set_state("1", make_state("a", minutes_ago=10))
+    manager.set_state("2", make_state("b", minutes_ago=5))
+    # 用户 1 重新搜索后，堆中最早的记录已失效
+    manager.set_state("1", make_state("c"))
+    assert manager.stats()["heap_entries"] == 3
+
+    manager.set_state("3", make_state("d"))
+    assert set(manager.states) == {"1", "3"}
+    assert manager.states["1"].query == "c"
+    assert manager.evicted == 1
+
+
+def test_search_manager_cleans_expired_states():
+    from nonebot_plugin_jmdownloader.data_source import SearchManager
+
+    manager = SearchManager(ttl_minutes=30, max_sessions=10)
+    manager.set_state("1", make_state("a", minutes_ago=40))
+    manager.set_state("2", make_state("b", minutes_ago=20))
+    manager.set_state("3", make_state("c", minutes_ago=35))
+    # 用户 3 的旧状态已过期，但替换后的状态仍有效
+    manager.set_state("3", make_state("d"))
+
+    manager.clean_expired()
+    assert set(manager.states) == {"2", "3"}
+    assert manager.expired == 1
+    assert manager.stats()["heap_entries"] == 2
+
+    # 查询时发现过期也会移除
+    manager.states["2"].created_at = make_state("e", minutes_ago=31).created_at
+    assert manager.get_state("2") is None
+    assert manager.expired == 2
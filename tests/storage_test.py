@@ -0,0 +1,101 @@
+import asyncio
+import json
+from pathlib import Path
+import sqlite3
+
+
+async def test_json_write_failure_backs_off(tmp_path: Path):
+    from nonebot_plugin_jmdownloader.storage import JsonStorage
+
+    storage = JsonStorage(tmp_path / "data.json", save_interval=0.01)
+    storage.MIN_RETRY_DELAY = 0.1
+    # 临时文件位置被目录占用，写入必然失败
+    (tmp_path / "data.json.tmp").mkdir()
+
+    storage.set_group_setting("1", "enabled", True)
+    await asyncio.sleep(0.5)
+    # 0.1 + 0.2 后第三次重试要到 0.7s 之后，不会立即反复重试
+    assert 1 <= storage.failed_writes <= 3
+    assert storage.writes == 0
+
+    (tmp_path / "data.json.tmp").rmdir()
+    await asyncio.sleep(0.5)
+    assert storage.writes == 1
+    assert json.loads((tmp_path / "data.json").read_text(encoding="utf-8"))["1"]["enabled"] is True
+    storage.close()
+
+
+async def test_json_writes_are_coalesced(tmp_path: Path):
+    from nonebot_plugin_jmdownloader.storage import JsonStorage
+
+    storage = JsonStorage(tmp_path / "data.json", save_interval=0.05)
+    for i in range(100):
+        storage.set_user_quota(str(i), i, 1)
+    await asyncio.sleep(0.2)
+    assert storage.writes == 1
+    storage.close()
+
+
+def test_sqlite_migrates_json(tmp_path: Path):
+    from nonebot_plugin_jmdownloader.storage import SqliteStorage
+
+    json_path = tmp_path / "jmcomic_data.json"
+    json_path.write_text(json.dumps({
+        "user_limits": {"10001": 3},
+        "restricted_tags": ["猎奇", "重口"],
+        "123456": {"folder_id": "abc", "enabled": True, "blacklist": ["10002"]},
+    }), encoding="utf-8")
+
+    storage = SqliteStorage(tmp_path / "jmcomic_data.db", migrate_from=json_path)
+    assert storage.get_user_quota("10001") == (3, None)
+    assert storage.list_items("restricted_tags") == ["猎奇", "重口"]
+    assert storage.get_group_setting("123456", "folder_id") == "abc"
+    assert storage.get_group_setting("123456", "enabled") is True
+    assert storage.list_blacklist("123456") == ["10002"]
+
+    # 旧记录没有周期，启动时补上当前周期
+    assert storage.fill_quota_periods(7) == 1
+    assert storage.get_user_quota("10001") == (3, 7)
+    storage.close()
+
+    # 已迁移过的数据库不会重复导入
+    json_path.write_text(json.dumps({"user_limits": {"10001": 0}}), encoding="utf-8")
+    storage = SqliteStorage(tmp_path / "jmcomic_data.db", migrate_from=json_path)
+    assert storage.get_user_quota("10001") == (3, 7)
+    storage.close()
+
+
+def test_sqlite_upgrades_old_schema(tmp_path: Path):
+    from nonebot_plugin_jmdownloader.storage import SqliteStorage
+
+    db_path = tmp_path / "old.db"
+    db = sqlite3.connect(db_path)
+    db.execute("CREATE TABLE user_limits (user_id TEXT PRIMARY KEY, remaining INTEGER NOT NULL)")
+    db.execute("INSERT INTO user_limits VALUES ('1', 2)")
+    db.commit()
+    db.close()
+
+    storage = SqliteStorage(db_path)
+    assert storage.get_user_quota("1") == (2, None)
+    storage.set_user_quota("1", 1, 5)
+    assert storage.get_user_quota("1") == (1, 5)
+    storage.close()
+
+
+def test_sqlite_batch_rolls_back(tmp_path: Path):
+    from nonebot_plugin_jmdownloader.storage import SqliteStorage
+
+    storage = SqliteStorage(tmp_path / "data.db")
+    storage.ensure_list("restricted_ids", [])
+    try:
+        with storage.batch():
+            storage.add_item("restricted_ids", "1")
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert storage.list_items("restricted_ids") == []
+
+    assert storage.add_items("restricted_ids", ["1", "2", "1"]) == 2
+    assert storage.add_items("restricted_ids", ["2", "3"]) == 1
+    assert storage.list_items("restricted_ids") == ["1", "2", "3"]
+    storage.close()